@@ -17,6 +17,17 @@ import inspect;
 import sys;
 import math;
 import random;
+import operator;
+import array;
+import os;
+import hashlib;
+import threading;
+import contextlib;
+import weakref;
+import collections;
+import imp;
+import marshal;
+import cPickle as pickle;
 isa = isinstance;
 
 #############################################################
@@ -24,23 +35,20 @@ isa = isinstance;
 #############################################################
 
 class Name(str): pass;        # for holding identifier names
-class Symbol(str): pass;    # for holding keywords and ops
+class Symbol(str):          # for holding keywords and ops
+    def __reduce__(self):   # Symbols are compared by identity, so they must be re-interned when unpickled.
+        return (internSymbol, (str(self),));
 
 def makeSymbolTable(addLiterals):
     "Creates a symbol table."
-    table = {};                # private (via closure)
+    class SymbolTable(dict):
+        def __missing__(self, s):
+            return self.setdefault(s, Symbol(s));    # (atomic, so that threads interning s at once get the same Symbol)
+        __call__ = dict.__getitem__;    # table(s) interns s. (Being native, it's much faster than a Python method.)
+    table = SymbolTable();
     if addLiterals is True:
-        table = {'true': True, 'false': False, 'null': None};    # Note: hash('x') is the same as hash(Symbol('x'))
-    class SymbolTable(object):
-        def __call__(self, s):
-            if s not in table:
-                table[s] = Symbol(s);
-            return table[s];
-        def __contains__(self, s):
-            return s in table;
-        def __repr__(self):
-            return str(table);
-    return SymbolTable();
+        table.update({'true': True, 'false': False, 'null': None});    # Note: hash('x') is the same as hash(Symbol('x'))
+    return table;
 
 
 iKeywords = '''
@@ -60,6 +68,7 @@ Infinity NaN undefined
 keywords = iKeywords + uKeywords;
 
 sym = makeSymbolTable(addLiterals = True); # true, false, null
+def internSymbol(s): return sym(s);        # (for unpickling)
 map(sym, iKeywords);
 map(sym, list('()[]!*/%+-><=,;{:}'));
 map(sym, '>= <= === !== && ||'.split());
@@ -80,14 +89,19 @@ class LJKeyErr(LJErr): pass;
 class LJIndexErr(LJErr): pass;
 class LJAssertionErr(LJErr): pass;
 
+namePattern = re.compile(r'[a-z]\w*$');
+propertyPattern = re.compile(r'\w+$');
+numberPattern = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE]\d+)?$');
+keywordSet = frozenset(keywords);
+
 def isNameLike(s):
     "Returns if a token is name-LIKE. 'if' IS name like."
     if s == '_' or s == '$': return True;
-    return re.findall(r'[a-z]\w*', s) == [s] and s[-1] != '_';
+    return namePattern.match(s) is not None and s[-1] != '_';
 
 def isValidName(s):
     "Returns if a token is a valid identifier name."
-    return s not in keywords and isNameLike(s);
+    return s not in keywordSet and isNameLike(s);
 
 def strNum(n):
     "Converts floats to (possibly int-like) strings."
@@ -98,75 +112,27 @@ def isDecimal(s):
     if s == '0' or any(map(s.startswith, '0e 0E 0.'.split())):
         return True;
     return not s.startswith('0');
+
+lexPattern = re.compile(r"""                                  # lex() scans its input once, left to right, w/ this pattern.
+    \s*(?:                                                    # After skipping spaces, the first alternative that matches wins.
+    (?P<comment>//[^\r\n]*)
+  | (?P<string>'(?:[^'\\\r\n]|\\[^\r\n])*'|"(?:[^"\\\r\n]|\\[^\r\n])*")
+  | (?P<op>===|!==|>=|<=|\+=|-=|&&|\|\||                       # Longer operators are tried first. Bad (EVIL) ones are
+          ==|!=|\+\+|--|>>|<<|\*=|/=|%=|                      #    scanned too, and raise syntax errors.
+          [=,;()\[\]{}!*/%+\-<>:])
+  | (?P<chunk>(?:[^\s'"=,;()\[\]{}!*/%+\-<>:&|]|&(?!&)|\|(?!\|))+)   # names, numbers, dot-refinements (& junk)
+  | (?P<quote>['"]))                                          # an unterminated string
+""", re.VERBOSE);
     
 def lex(s):
     "Breaks input into a list of tokens. (Lexical Analysis)"
-    spacer = [
-        # Introducing spaces:
-        ('=', ' = '), (',', ' , '), (';', ' ; '),
-        ('(', ' ( '), ('[', ' [ '), ('{', ' { '),
-        (')', ' ) '), (']', ' ] '), ('}', ' } '),
-        ('!', ' ! '), ('*', ' * '), ('/', ' / '),
-        ('%', ' % '), ('+', ' + '), ('-', ' - '),
-        ('>', ' > '), ('<', ' < '), (':', ' : '),
-        ('&&', ' && '), ('||', ' || '),
-        # Removing unwanted spaces:
-        ('>  =', '>='), ('<  =', '<='),
-        ('=  =  =', '==='), ('!  =  =', '!=='),
-        ('+  =', '+='), ('-  =', '-='),
-        # Bad (EVIL) symbols (these raise syntax errors):
-        ('=  =', '=='), ('!  =', '!='),
-        ('+  +', '++'), ('-  -', '--'),
-        ('>  >', '>>'), ('<  <', '<<'),
-        ('*  =', '*='), ('/  =', '/='), ('%  =', '%=')#, 
-    ];
     tokens = []; # Output. Filled by enclosed functions.
     
     ###    
-    def segmentifyLine(s):
-        "Helps segmentify() with segmenting a single line." # segmentifyLine() uses an FSM which looks as follows:
-        mode = 'code'; quote = None;                        #
-        ans = [''];                                         #           .--> (CODE) <--> STRING
-        for i in xrange(len(s)):                            #
-            if mode == 'code' and quote is None:            # CODE is the start state and the only accepting state.
-                if s[i] in ['"', "'"]:
-                    mode = 'string';
-                    quote = '"' if s[i] == '"' else "'";
-                    ans.append(quote);
-                elif s[i] == '/' and i + 1 < len(s) and s[i+1] == '/':
-                    return ans;
-                else:
-                    ans[-1] += s[i];
-            elif mode == 'string' and quote in ['"', "'"]:  # A segment is a un-quoted code snippet
-                prev = ans[-1][-1];                         #   or a quoted-string snippet.
-                ans[-1] += s[i];
-                if s[i] == quote and prev != '\\':
-                    mode = 'code';
-                    ans.append('');
-                    quote = None;
-            else:
-                assert False;
-        if mode != 'code':
-            raise LJSyntaxErr('EOL while scanning string literal');
-        return ans;
-    
-    def segmentify(s):
-        "Segments input into code-segements & string-segments."
-        segments = [];
-        for line in s.splitlines():
-            if line and not line.isspace():
-                segments += segmentifyLine(line);
-        return segments;
-    
-    def isPropertyName(s):
-        "Helps subscriptify() tell if `s` is a valid key."  # TODO: Currently, `a = {}; a.function = 1;` is legal; 
-        return re.findall(r'\w+', s) == [s];                #        BUT, `a = {function : 1};` is illegal. FIX THIS.
-    
     def subscriptify(s):
-        "Helps handleDot() change dots to subscripts."
-        if isPropertyName(s):
-            toAppend = [sym('['), s, sym(']')];
-            map(tokens.append, toAppend);
+        "Helps handleDot() change dots to subscripts."      # TODO: Currently, `a = {}; a.function = 1;` is legal; 
+        if propertyPattern.match(s):                        #        BUT, `a = {function : 1};` is illegal. FIX THIS.
+            map(tokens.append, [sym('['), s, sym(']')]);
         else:
             raise LJSyntaxErr('illegal refinement ' + s);
     
@@ -179,8 +145,8 @@ def lex(s):
                 raise LJSyntaxErr('unexpected refinement ' + x);
             # otherwise...
             poken = tokens[-1]; # previous token
-            if not (poken in '})]' or isValidName(poken)):          # Note: `in` is weaker than `is`.
-                raise LJSyntaxErr('unexpected token ' + x + poken); # Thus,
+            if not (isa(poken, str) and (poken in '})]' or isValidName(poken))):    # Note: `in` is weaker than `is`.
+                raise LJSyntaxErr('unexpected token ' + x + str(poken));        # Thus,
             # otherwise...                                          #      poken in [sym('}'), sym(')'), sym(']')]
             splitLi = x[1 : ].split('.');                           #   is not used.
             map(subscriptify, splitLi);
@@ -193,44 +159,36 @@ def lex(s):
             else:
                 raise LJSyntaxErr('unexpected token ' + baseId);
     
-    def atomizeNS(x):
-        "Identify (& return) bools, numbers, strings & names."
-        if x in uKeywords:
-            raise LJSyntaxErr('unexpected keyword ' + x);
+    def atomize(x):
+        "Identify (& return) bools, numbers, names & symbols."
+        if x in sym:                                          # Note: uKeywords are in badsym, not in sym.
+            return sym(x);
         elif x in badsym:
+            if x in uKeywords: raise LJSyntaxErr('unexpected keyword ' + x);
             raise LJSyntaxErr('unexpected token ' + x);
-        elif x in sym: 
-            tokens.append(sym(x));
         elif isValidName(x):
-            tokens.append(Name(x)); 
-        else:
-            try: 
-                tmp = float(x);
-                if isDecimal(x): tokens.append(tmp);
-                else:
-                    raise LJSyntaxErr('illegal (octal) number ' + x);
-            except ValueError:                                # SyntaxError is left uncaught.
-                if '.' in x: 
-                    handleDot(x);
-                else:
-                    raise LJSyntaxErr('unexpected token ' + x);
+            return Name(x);
+        elif numberPattern.match(x):
+            if isDecimal(x): return float(x);
+            raise LJSyntaxErr('illegal (octal) number ' + x);
+        try: return float(x);                                 # rare forms, like `Inf`
+        except ValueError:
+            raise LJSyntaxErr('unexpected token ' + x);
     
-    def lexNS(code):
-        "Tokenizes a non-string, i.e. un-quoted code snippet."
-        for tup in spacer:
-            code = code.replace(tup[0], tup[1]);
-        map(atomizeNS, code.split());
-        
-    def lexS(s):
-        "Shaves off quotes and decodes backslash escapes."
-        assert s[0] == s[-1] and s[-1] in ['"', "'"];
-        tokens.append(s[1 : -1].decode('string_escape'));
-    
-    for seg in segmentify(s):
-        if seg.startswith('"') or seg.startswith("'"):
-            lexS(seg);
-        else:
-            lexNS(seg);
+    atoms = {};    # chunk or op --> token, as most repeat
+    for match in lexPattern.finditer(s):
+        kind, x = match.lastgroup, match.group(match.lastindex);
+        if x in atoms:
+            tokens.append(atoms[x]);
+        elif kind == 'chunk' and '.' in x and not numberPattern.match(x):
+            handleDot(x);                                     # depends on the previous token, so never cached
+        elif kind == 'chunk' or kind == 'op':
+            atoms[x] = atomize(x);
+            tokens.append(atoms[x]);
+        elif kind == 'string':                                # Shaves off quotes and decodes backslash escapes.
+            tokens.append(x[1 : -1].decode('string_escape'));
+        elif kind == 'quote':
+            raise LJSyntaxErr('EOL while scanning string literal');
     return [sym('var?')] + tokens;                             # UNINTERNED symbol, indicating that a var statement may follow.
 
 #############################################################
@@ -242,58 +200,65 @@ def eMsgr(li):
     err_repr = lambda x: '' if x == 'var?' else lj_repr(x);
     return ' ... ' + ' '.join(map(err_repr, li[:20]));
 
-def gmb(seq, i): # Get Matching (Closing) Bracket
-    "Get index of right bracket, matching left bracket at i."
-    brackets = {
-        sym('('): sym(')'),
-        sym('['): sym(']'),
-        sym('{'): sym('}')#,
-    };
-    left = seq[i];
-    right = brackets[left];
-    count = 0;
-    for j in xrange(i, len(seq), 1):
-        if seq[j] == left: count += 1;
-        elif seq[j] == right: count -= 1;
-        if count == 0: return j;
-    raise LJSyntaxErr('unbalanced bracket' + eMsgr(seq[i:]));
-
-def topSplit(li, symbo):                                        # Consider: `add(1, sub(2, 3));`
-    "Splits input list on the TOP-LEVEL non-bracket symbol."    # The comma right after 2 is not a top-level comma. (Its nested.)
-    if not li: return li; # empty list;                         # On the other hand, the comma right after 1 is.
-    oBrackets = [sym('('), sym('{'), sym('[')];
-    ans = [];
-    i, j = 0, 0;
-    while j < len(li):
-        if li[j] in oBrackets:
-            j = gmb(li, j);    # ignore commas in bracket pairs
-        elif li[j] is symbo:
-            ans.append(li[i : j]);
-            i, j = j+1, j+1;
-        elif j == len(li) - 1:
-            ans.append(li[i : j + 1]);
-            break;
-        else:
-            j += 1;
-    return ans;
-
-def isTopIn(li, symbo):
-    "Tells if symbo is a top-level-symbol in list li."
-    return len(topSplit(li, symbo)) != 1;
-
-def topIndex(li, j, symbo):    # error thrower                    # Bugfix:
-    "Gives index of TOP-LEVEL occurence of symbo, starting at j." # Originally, topIndex accepted a list of symbols `syms` to
-    oBrackets = [sym('('), sym('{'), sym('[')];                   # to split on. If a non-list x was passed, it'd set syms = [x].
-    if symbo in oBrackets:                                        # Splitting was accomplished by checking `if li[j] in syms`
-        raise Exception('');    # internal error                  # as opposed to the current check `if li[j] is symbo`
-    while j < len(li):                                            # The `in` test is insufficient as it cannot tell the difference
-        if li[j] in oBrackets:                                    #     between types str and Symbol. The `is` test is necessary.
-            j = gmb(li, j);    # ignore semis in bracket pairs    # Luckily, topSplit was always called on a single symbol.
-        elif li[j] is symbo:                                      # The bug was thus, easily fixed by changing the test is `is`.
-            return j;
+brackets = {
+    sym('('): sym(')'),
+    sym('['): sym(']'),
+    sym('{'): sym('}')#,
+};
+closers = set(brackets.values());
+
+def matchBrackets(tokens):                                      # Brackets are matched once, up front, in a single pass.
+    "Maps the index of each opening bracket to its match."      # The parser then jumps over bracketed groups (& finds
+    match = [None] * len(tokens);                               #    the end of each) by looking up this table.
+    stack = [];
+    for i, tok in enumerate(tokens):
+        if type(tok) is not Symbol: continue;                   # Note: The str '(' is a string literal, not a bracket.
+        if tok in brackets:
+            stack.append(i);
+        elif tok in closers:
+            if not stack or brackets[tokens[stack[-1]]] is not tok:
+                raise LJSyntaxErr('unbalanced bracket' + eMsgr(tokens[i:]));
+            match[stack.pop()] = i;
+    if stack:
+        raise LJSyntaxErr('unbalanced bracket' + eMsgr(tokens[stack[-1]:]));
+    return match;
+
+class Tokens(list):
+    "A list of tokens, along with its bracket-match table."   # Parsers work on ranges [j, end) of a single Tokens object,
+    def __init__(self, tokens):                                #    never on copies (slices) of it.
+        list.__init__(self, tokens);
+        self.match = matchBrackets(self);
+
+def topIndex(tokens, j, end, symbo):    # error thrower           # Consider: `add(1, sub(2, 3));`
+    "Gives index of TOP-LEVEL occurence of symbo in [j, end)."  # The comma right after 2 is not a top-level comma. (Its nested.)
+    k = findTop(tokens, j, end, symbo);                         # On the other hand, the comma right after 1 is.
+    if k is None:
+        raise LJSyntaxErr('expected ' + symbo + eMsgr(tokens[j:end]));
+    return k;
+
+def findTop(tokens, j, end, symbo):
+    "Like topIndex(), but returns None if symbo isn't found."
+    match = tokens.match;
+    while j < end:
+        if tokens[j] is symbo:                                  # The `is` test is necessary, as `in` & `==` cannot tell
+            return j;                                           #    the difference between types str and Symbol.
+        elif match[j] is not None:
+            j = match[j] + 1;    # skip bracket pairs
         else:
             j += 1;
-    raise LJSyntaxErr('expected ' + symbo + eMsgr(li));
+    return None;
+
+def topSplit(tokens, j, end, symbo):
+    "Splits [j, end) into ranges, on TOP-LEVEL symbo."          # A trailing empty range (as in `var a = 1,;`) is dropped.
+    ranges = [];
+    while j < end:
+        k = findTop(tokens, j, end, symbo);
+        if k is None:
+            ranges.append((j, end));
+            break;
+        ranges.append((j, k));
+        j = k + 1;
+    return ranges;
 
 #############################################################
 
@@ -303,286 +268,363 @@ class Function(object):        # for holding function values  # Functions can be
         self.tree = tree;                                     
         self.iTokens = iTokens;
         self.crEnv = None;    # creation ENVironment          # However, the crEnv of a function can be know only at rumtime.
-    def __str__ (self):                                      # So, for now, we set it to None;
+        self.body = None;     # compiled body (if compiled)   # So, the Function in a parse tree is a mere template (w/o crEnv).
+        self.compiled = self.assembled = None;    # lazily made bodies, for Functions made by run()
+        self.template = None; # whose lazy bodies are shared (if any)
+    def __str__ (self):                                      # Each evaluation of a function literal creates a new Function
         return '...function %s %s...' % \
-                    (str(self.params), str(self.tree));
-    __repr__ = __str__     # uncomment for debugging
+                    (str(self.params), str(self.tree));       #    via makeFunction(), which SHARES the template's params, tree
+    __repr__ = __str__     # uncomment for debugging          #    & iTokens and pairs them with a crEnv. Thus, trees are never
+                                                              #    copied or mutated while running.
+def makeFunction(template, body, env):                        # body(env, ctx), if set, runs the function in env & returns its value.
+    "Creates a Function value from a template, in env."
+    func = Function(template.params, template.tree, template.iTokens);
+    func.body = body;
+    func.crEnv = env;
+    func.template = template.template or template;
+    return func;
+
+#############################################################
+                                                              # Expressions are parsed (once) into nested nodes. Each node is a
+binaryPrecedence = {                                          #     list whose first element is a tag:
+    sym('*'): 6, sym('/'): 6, sym('%'): 6,                    #         ['literal', value]          ['name', Name]
+    sym('+'): 5, sym('-'): 5,                                 #         ['function', Function]      ['array', [exp, ...]]
+    sym('>='): 4, sym('<='): 4, sym('>'): 4, sym('<'): 4,     #         ['object', [[key, exp], ...]]
+    sym('==='): 3, sym('!=='): 3,                             #         ['refine', exp, keyExp]     ['call', exp, [exp, ...]]
+    sym('&&'): 2,                                             #         ['unop', op, exp]           ['binop', op, exp, exp]
+    sym('||'): 1#,                                            # Higher precedence binds tighter. All binary ops are left-associative.
+};                                                            # Nodes are never mutated once built. Interpreters only read them.
+nonAssociative = map(sym, '> < >= <= === !=='.split());
+
+def isOp(tok, table):
+    "Tells if tok is an operator Symbol in table."          # Type must be checked, as the str '+' equals the Symbol '+'.
+    return type(tok) is Symbol and tok in table;
+
+def expectSym(tokens, j, end, s):
+    "Raises a syntax error unless tokens[j] is sym(s)."
+    if j >= end or tokens[j] is not sym(s):
+        raise LJSyntaxErr('expected ' + s + eMsgr(tokens[j:end]));
+    return j + 1;
+
+def parseFunction(tokens, k, end):                          # form:        ... function ( a , b )  { ... } ...
+    "Helps parsePrimary() to parse function literals."      # indices:         k        lp         rp lc      rc
+    try:
+        lp = k + 1;
+        assert lp < end and tokens[lp] is sym('(');
+        rp = tokens.match[lp];
+        lc = rp + 1;
+        assert lc < end and tokens[lc] is sym('{');
+        rc = tokens.match[lc];
+        assert rc > lc + 1; # ensuring non-empty block
+        params = [];                                        # Do _NOT_ to call topSplit(), as each param _MUST_ be a Name
+        for p in tokens[lp+1 : rp]:
+            if isa(p, Name): params.append(p);
+            else: assert p is sym(',');
+    except AssertionError:
+        raise LJSyntaxErr('bad function literal');
+    iTokens = [sym('var?')] + tokens[lc + 1 : rc];          # list of body tokens (non-alias), kept for lj_repr()
+    func = Function(params, parseBlock(tokens, lc + 1, rc, varAt=lc + 1), iTokens);
+    return ['function', func], rc + 1;
+
+def parseSequence(tokens, j, end, closer):                  # form:        ... [ exp , exp , ... ] ...
+    "Parses comma-separated expressions up to closer."      # indices:         j-1                 ^ returned index - 1
+    exps = [];                                              # Note: A trailing comma (as in `[1, 2,]`) is tolerated.
+    while not (j < end and tokens[j] is sym(closer)):
+        exp, j = parseBinary(tokens, j, end, 1);
+        exps.append(exp);
+        if j < end and tokens[j] is sym(','):
+            j += 1;
+        else:
+            break;
+    return exps, expectSym(tokens, j, end, closer);
+
+def parseObject(tokens, j, end):                            # form:        ... { keyX : valueExpX , keyY : valueExpY ... } ...
+    "Parses an object literal into an 'object' node."       # indices:         j
+    pairs = [];
+    j += 1;
+    while not (j < end and tokens[j] is sym('}')):
+        try:
+            key = tokens[j];
+            if type(key) is Name: key = str(key);
+            assert type(key) is str;                        # JS keys MUST be strings. Numbers & booleans are not allowed.
+            assert j + 1 < end and tokens[j + 1] is sym(':');
+        except (IndexError, AssertionError):
+            raise LJSyntaxErr('illegal object literal' + eMsgr(tokens[j:end]));
+        exp, j = parseBinary(tokens, j + 2, end, 1);
+        pairs.append([key, exp]);
+        if j < end and tokens[j] is sym(','):
+            j += 1;
+        else:
+            break;
+    return ['object', pairs], expectSym(tokens, j, end, '}');
+
+def parsePrimary(tokens, j, end):                           # A bracketed group never extends past its matching bracket,
+    "Parses a literal, name, group, array, object or function."     # which therefore bounds the parsing of its contents.
+    tok = tokens[j];
+    if tok is sym('('):
+        close = tokens.match[j];
+        if close == j + 1:
+            raise LJSyntaxErr('empty parentheses' + eMsgr(tokens[j:end]));
+        exp, k = parseBinary(tokens, j + 1, close, 1);
+        return exp, expectSym(tokens, k, close + 1, ')');
+    elif tok is sym('['):
+        exps, j = parseSequence(tokens, j + 1, tokens.match[j] + 1, ']');
+        return ['array', exps], j;
+    elif tok is sym('{'):
+        return parseObject(tokens, j, tokens.match[j] + 1);
+    elif tok is sym('function'):
+        return parseFunction(tokens, j, end);
+    elif type(tok) is Name:
+        return ['name', tok], j + 1;
+    elif type(tok) in [float, str, bool, type(None)]:
+        return ['literal', tok], j + 1;
+    raise LJSyntaxErr('unexpected token ' + lj_repr(tok) + eMsgr(tokens[j:end]));
+
+def parsePostfix(tokens, j, end):                           # form:        ... primary [ key ] ( arg , arg ) ...
+    "Parses refinements and invocations on a primary."
+    exp, j = parsePrimary(tokens, j, end);
+    while j < end:
+        tok = tokens[j];
+        if tok is sym('['):
+            close = tokens.match[j];
+            if close == j + 1:
+                raise LJSyntaxErr('illegal refinement');
+            key, j = parseBinary(tokens, j + 1, close, 1);
+            exp = ['refine', exp, key];
+            j = expectSym(tokens, j, close + 1, ']');
+        elif tok is sym('('):
+            args, j = parseSequence(tokens, j + 1, tokens.match[j] + 1, ')');
+            exp = ['call', exp, args];
+        else:
+            break;
+    return exp, j;
+
+def parseUnary(tokens, j, end):
+    "Parses prefix operators ! - and + (right to left)."
+    if j >= end:
+        raise LJSyntaxErr('unexpected end of expression' + eMsgr(tokens[j:end]));
+    tok = tokens[j];
+    if tok is sym('!') or tok is sym('-') or tok is sym('+'):
+        exp, j = parseUnary(tokens, j + 1, end);
+        return ['unop', tok, exp], j;
+    return parsePostfix(tokens, j, end);
+
+def parseBinary(tokens, j, end, minPrec):                   # Precedence climbing:
+    "Parses binary operations of precedence >= minPrec."    #     `a + b * c` is parsed as `a + (b * c)`.
+    exp, j = parseUnary(tokens, j, end);                    #     `a - b - c` is parsed as `(a - b) - c`.
+    while j < end and isOp(tokens[j], binaryPrecedence):
+        op = tokens[j];
+        prec = binaryPrecedence[op];
+        if prec < minPrec: break;
+        rhs, j = parseBinary(tokens, j + 1, end, prec + 1);
+        exp = ['binop', op, exp, rhs];
+        if op in nonAssociative and j < end and isOp(tokens[j], nonAssociative):
+            op2 = tokens[j];                                # On Chromium, `1 === 1 === 1` is false and `1 > 1 < 1` is true.
+            msg = 'operators %s and %s cannot be chained' % (op, op2);
+            if op == op2:                                   # We shall not be a part of this madness!!
+                msg = 'operator %s cannot be chained' % op;
+            raise LJSyntaxErr(msg);
+    return exp, j;
+
+def parseExp(tokens, j, end):
+    "Parses tokens in [j, end) into an expression node."
+    if j >= end:
+        raise LJSyntaxErr('empty expression');
+    exp, k = parseBinary(tokens, j, end, 1);
+    if k != end:
+        raise LJSyntaxErr('illegal expression' + eMsgr(tokens[k:end]));
+    return exp;
+
+#############################################################
 
 def yacc(tokens):
     "Builds an AST from a list of tokens. (Syntactic Analysis)"
-    tree = []; # AST (Abstract Syntax Tree)
-    def parseFunction(expLi, k):                            # form:        ... function ( a , b )  { ... } ...
-        "Helps parseExp() to parse function expressions."   # indices:         k        lp         rp lc      rc
-        try:
-            lp = expLi.index(sym('('), k);
-            assert lp == k + 1;
-            rp = gmb(expLi, lp);
-            lc = expLi.index(sym('{'), rp);
-            assert lc == rp + 1;
-            rc = gmb(expLi, lc);
-            assert rc > lc + 1; # ensuring non-empty block
-            paramsWithCommas = expLi[lp+1 : rp];            # Do _NOT_ to call topSplit(), as each param _MUST_ be a Name
-            params = [];
-            for p in paramsWithCommas:
-                if isa(p, Name): params.append(p);
-                else: assert p == sym(',');
-        except (ValueError, AssertionError):
-            #print 'func ExpLI = ', expLi;
-            raise LJSyntaxErr('bad function literal');
-        iTokens = [sym('var?')] + expLi[lc + 1 : rc];    # list of body tokens (non-alias)
-        func = Function(params, yacc(iTokens), iTokens);
-        expLi = expLi[ : k] + [func] + expLi[rc + 1 : ];    # DO NOT DIRECTLY RETURN THE RHS EXPRESSION. It is less readable.
-        return expLi;                                       # Substitute an instance of Function in place of function literal
-    
-    def parseExp(expLi):
-        "Tells functions from rest and parses them."        # Remaining parts in an expression like operators etc.            
-        while True:                                            #    are dealt with during interpreting
-            #print 'expLi = ', expLi, '\n';
-            funky = map(lambda x: x is sym('function'), expLi);
-            #print ; print;
-            #print 'expLi = ', expLi;
-            #print 'funky = ', funky;
-            #print ; print;
-            if any(funky):                                  # Do NOT use `while sym("function") in expLi`
-                k = funky.index(True);                      #     as the `in` operator cannot tell the difference between
-                expLi = parseFunction(expLi, k);            #     'function' the Symbol and "function" the str.
-            else:
-                break;
-        return expLi;
+    if type(tokens) is not Tokens:
+        tokens = Tokens(tokens);
+    return parseBlock(tokens, 0, len(tokens));
 
-    def parseVar(tokens, j):                                # form:        ... var a = 10 , b = 20 ; ...
+def parseBlock(tokens, j, end, varAt=None):
+    "Builds an AST from the tokens in range [j, end)."       # varAt is the index at which a var statement may appear (if any).
+    tree = []; # AST (Abstract Syntax Tree)
+    def parseVar(j):                                        # form:        ... var a = 10 , b = 20 ; ...
         "Helps yacc() in parsing var statements."           # indices:         j                   semiPos
-        if j == 0 or tokens[j - 1] != sym('var?'):
+        if j != varAt and not (j > 0 and tokens[j - 1] is sym('var?')):
             raise LJSyntaxErr('unexpected var statement');   # In JS, var statements may occur anywhere.
-        semiPos = topIndex(tokens, j, sym(';'));             # This may create an illusion of block-scope, which JS lacks.
-        subtokens = tokens[j+1 : semiPos];                   # As a remedy, Jispy allows at most one var statement per scope,
-        inits = topSplit(subtokens, sym(','));               #    and, if used, it must be the very first statement in the scope.
-        for init in inits:                                   # The uninterned symbol `var?` is used to restrict var statements.
-            try:
-                assert len(init) >= 3;                       # eg. init:     a  =  10  +  10
-                assert type(init[0]) is Name;                # indices:   0  1  2   3  4 
-                assert init[1] is sym('=');
-            except AssertionError:
+        semiPos = topIndex(tokens, j, end, sym(';'));        # This may create an illusion of block-scope, which JS lacks.
+        for a, b in topSplit(tokens, j + 1, semiPos, sym(',')):     # As a remedy, Jispy allows at most one var statement per
+            try:                                             #    scope, and, if used, it must be the very first statement
+                assert b - a >= 3;                           #    in the scope.
+                assert type(tokens[a]) is Name;              # The uninterned symbol `var?` is used to restrict var statements.
+                assert tokens[a + 1] is sym('=');            # eg. init:     a  =  10  +  10
+            except AssertionError:                           # indices:      a  a+1 ...        b
                 raise LJSyntaxErr('illegal var statement');
-            rhsParsedExp = parseExp(init[2 : ]);
-            tree.append(['init', init[0], rhsParsedExp]);
+            tree.append(['init', tokens[a], parseExp(tokens, a + 2, b)]);
         return semiPos + 1;
 
-    def parseIf(tokens, j, tree=tree, stmtName = 'if'):     # form:        ... if ( a == 20 )   { ... } ...
-        "Helps yacc(..) in parsing if statements."          # indices:         j  lp        rp  lc    rc
-        try:
-            lp = tokens.index(sym('('), j);    # left paren    # Note: `while` & `else if` are syntactically similar to pure `if`.
-            assert lp == j + 1;                                #        We shall thus use parseIf() to parse `else if` and `while`.
-            rp = gmb(tokens, lp);            # right paren     #        In doing so, we mustn't wrongly mutate the AST.
-            assert rp > lp + 1;                   # non-empty  #        Instead, a dummy-tree will be passed in to parseIf()
-            lc = tokens.index(sym('{'), rp);# left curly
-            assert lc == rp + 1;
-            rc = gmb(tokens, lc);            # right curly
+    def parseCondBlock(j, stmtName):                          # form:        ... if ( a == 20 )   { ... } ...
+        "Parses `( cond ) { code }` after tokens[j]."         # indices:         j  lp        rp  lc    rc
+        try:                                                  # Note: `while` & `else if` are syntactically similar to pure `if`.
+            lp = j + 1;    # left paren                       #       We shall thus use parseCondBlock() to parse all three.
+            assert lp < end and tokens[lp] is sym('(');
+            rp = tokens.match[lp];    # right paren
+            assert rp > lp + 1;                   # non-empty
+            lc = rp + 1;    # left curly
+            assert lc < end and tokens[lc] is sym('{');
+            rc = tokens.match[lc];    # right curly
             assert rc > lc + 1;                # non-empty block
-        except (ValueError, AssertionError):
+        except AssertionError:
             raise LJSyntaxErr('illegal %s statement' % stmtName);
-        cond = parseExp(tokens[lp + 1 : rp]);
-        code = yacc(tokens[lc + 1 : rc]);
+        cond = parseExp(tokens, lp + 1, rp);
+        code = parseBlock(tokens, lc + 1, rc);
+        return cond, code, rc + 1;
+
+    def parseIf(j):
+        "Helps yacc(..) in parsing if statements."
+        cond, code, j = parseCondBlock(j, 'if');
         tree.append(['if-ladder', cond, code])                # An if-ladder generically represents a any VALID combination
-        return rc + 1;                                        #    of if and else constructs. (This obviously includes `else if`.)
+        return j;                                             #    of if and else constructs. (This obviously includes `else if`.)
     
-    def parseElseIf(tokens, j):                               # form:        ... else if ( a !== 0 ) { ... } ...
+    def parseElseIf(j):                                       # form:        ... else if ( a !== 0 ) { ... } ...
         "Helps parseElse() in parsing else-if statements."    # index:        j
-        tempTree = []; # dummy-tree for passing to parseIf()
-        j = parseIf(tokens[:], j+1, tempTree, 'else if');   # The if-ladder, which was created on seeing `if`,
-        [_, cond, code] = tempTree[0];                      # is mutated as follows on seeing `else if`:
-        tree[-1].append(cond);                              #      [if-ladder cond0 cond0] --> [if-ladder cond0 code0 cond1 code1]
-        tree[-1].append(code);                              # Where cond0, code0 were previously seen; cond1, code1 were just seen.
-        return j;
+        cond, code, j = parseCondBlock(j + 1, 'else if');   # The if-ladder, which was created on seeing `if`,
+        tree[-1].append(cond);                              # is mutated as follows on seeing `else if`:
+        tree[-1].append(code);                              #      [if-ladder cond0 cond0] --> [if-ladder cond0 code0 cond1 code1]
+        return j;                                           # Where cond0, code0 were previously seen; cond1, code1 were just seen.
     
-    def parsePureElse(tokens, j):                             # form:        ... else { ... } ...
+    def parsePureElse(j):                                     # form:        ... else { ... } ...
         "Helps parseElse() in parsing pure-else stmts."       # indices:         j    lc    rc
-        try:
-            lc = tokens.index(sym('{'), j);
-            assert lc == j + 1;
-            rc = gmb(tokens, lc);
-        except (ValueError, AssertionError):
+        lc = j + 1;
+        if tokens[lc] is not sym('{'):
             raise LJSyntaxErr('illegal else statement');
-        cond = [sym('true')];    # alwyas truthy.         # The if-ladder, (which was previously created,)
-        code = yacc(tokens[lc+1 : rc]);                   # is mutated by adding a condition which is always true:
+        rc = tokens.match[lc];
+        cond = ['literal', True];    # alwyas truthy.     # The if-ladder, (which was previously created,)
+        code = parseBlock(tokens, lc + 1, rc);            # is mutated by adding a condition which is always true:
         tree[-1].append(cond);                            #     [if-ladder cond0 code0 ] --> [if-ladder cond0 code0 TrueCond code1]
         tree[-1].append(code);                            # TrueCond is always true, which makes pure `else`,
         return rc + 1;                                    #     the semantic equivalent of `else if (true)`.
     
-    def parseElse(tokens, j):                             # Relies on parseElseIf() and parsePureElse() above.
+    def parseElse(j):                                     # Relies on parseElseIf() and parsePureElse() above.
         "Helps yacc() in parsing else statements."        
         if tree == [] or tree[-1][0] != 'if-ladder':
             raise LJSyntaxErr('misplaced else statement');
-        if j == len(tokens) - 1 :
+        if j == end - 1:
             raise LJSyntaxErr('unexpected else (last token)');
-        if tokens[j+1] == 'if':
-            return parseElseIf(tokens[:], j);
+        if tokens[j+1] is sym('if'):
+            return parseElseIf(j);
         else:
-            return parsePureElse(tokens[:], j);
+            return parsePureElse(j);
     
-    def parseWhile(tokens, j):                                # form:        ... while ( a > 1 )   { ... } ...
+    def parseWhile(j):                                        # form:        ... while ( a > 1 )   { ... } ...
         "Helps yacc() in parsing while statements."           # indices:         j     lp      rp  lc    rc
-        tokens[j] = sym('if');    # make while look like if.
-        tempTree = [];             # dummy-tree
-        j = parseIf(tokens[:], j, tempTree, 'while');        # Note:
-        [_, cond, code] = tempTree[0];                       #     param `tokens` supplied to parseWhile is a 
-        tree.append(['while', cond, code]);                  #     NON-ALIAS-copy of that supplied to yacc;
-        return j;                                            #     We may hence freely make changes in it.        
+        cond, code, j = parseCondBlock(j, 'while');
+        tree.append(['while', cond, code]);
+        return j;
         
-    def parseReturn(tokens, j):                              # form:        ... return 1 + 1 + 1 ; ...
+    def parseReturn(j):                                      # form:        ... return 1 + 1 + 1 ; ...
         "Helps yacc() in parsing return statements."         # indices:         j                semiPos
-        semiPos = topIndex(tokens, j, sym(';'));
-        parsedReturnExp = parseExp(tokens[j+1 : semiPos]);
-        tree.append(['return', parsedReturnExp]);
+        semiPos = topIndex(tokens, j, end, sym(';'));
+        tree.append(['return', parseExp(tokens, j + 1, semiPos)]);
         return semiPos + 1;
     
-    def parseBreak(tokens, j):                               # form:        ... break ; ...
+    def parseBreak(j):                                       # form:        ... break ; ...
         "Helps yacc() in parsing break statements."          # indices:         j     j+1
-        try: assert tokens[j + 1] is sym(';');
-        except AssertionError:
+        if not (j + 1 < end and tokens[j + 1] is sym(';')):
             raise LJSyntaxErr('expected ; (semicolon) after break');
         tree.append(['break']);
         return j + 2;
     
-    def checkLhsExp(expLi):    # expLi is lhsExpLi
+    def checkLhsExp(lhsExp):                                 # Only `name` and `name[..][..]` may be assigned to.
         "Helps parseAssign() in checking LHS of assignment."
-        try:
-            assert len(expLi) >= 1;
-            assert type(expLi[0]) is Name;
-            if len(expLi) > 1:
-                j = -1;    # last index
-                while True:
-                    assert expLi[j] is sym(']');
-                    ls = gmob(expLi, j);                     # Left Square [         gmob() <--> Get Matching Opening Bracket
-                    if expLi[ls - 1] is sym(']'):            # cascaded indexing
-                        j = ls - 1;                          # Right square ]
-                    else:
-                        assert ls - 1 == 0;
-                        break;
-        except AssertionError:
-            raise LJTypeErr('illegal LHS in assignment' + eMsgr(expLi));
+        exp = lhsExp;
+        while exp[0] == 'refine':
+            exp = exp[1];
+        if exp[0] != 'name':
+            raise LJTypeErr('illegal LHS in assignment');
         return None;
     
-    def parseAssign(stmt, tree=tree): # Relies on checkLhsExp  # form:         a[0] = 1 + b + c ;
-        "Helps yacc() in parsing assignment statements."       # indices:     0    eqSign
-        try:
-            assert type(stmt[0]) is Name;                    # Note: parseAssign() was written when shorthand assignments
-            eqSign = stmt.index(sym('='));                   #        were NOT supported. As a result, it doen't (currently)
-            lhsExp = parseExp(stmt[ : eqSign]);              #        handle them. A separate function parseShorthandAssign()
-            rhsExp = parseExp(stmt[eqSign + 1 : ]);          #        has been written to do so exclusively, which 
-            checkLhsExp(lhsExp);                             #        converts a shorthand assignment to an assignment
-        except AssertionError:                               #        via parseAssign().
-            raise LJTypeErr('illegal LHS in assignment' + eMsgr(stmt));
+    def parseAssign(a, eqSign, b, tree=tree):               # form:         a[0] = 1 + b + c ;
+        "Helps yacc() in parsing assignment statements."       # indices:     a    eqSign          b
+        if type(tokens[a]) is not Name:
+            raise LJTypeErr('illegal LHS in assignment' + eMsgr(tokens[a:b]));
+        lhsExp = parseExp(tokens, a, eqSign);
+        rhsExp = parseExp(tokens, eqSign + 1, b);
+        checkLhsExp(lhsExp);
+        if tokens[eqSign] is not sym('='):                    # form:        k[i]    +=    1    ;
+            pOrM = sym(tokens[eqSign][0]);                    # sym('+') or sym('-'); i.e. Plus or Minus
+            rhsExp = ['binop', pOrM, lhsExp, rhsExp];         # Converting `lhs += rhs` to `lhs = lhs + (rhs)`
         tree.append(['assign', lhsExp, rhsExp]);
         return None;
     
-    def parseShortAssign(stmt, tree=tree):                     # form:        k[i]    +=    1    ;
-        "Helps yacc() in parsing short-hand assignments."      # indices:     0
-        assert sym('+=') in stmt or sym('-=') in stmt;
-        if sym('+=') in stmt:
-            short = sym('+=');
-        else:
-            short = sym('-=');
-        symPos = stmt.index(short);
-        xtmt = stmt[: symPos] + [sym('=')] + stmt[symPos+1 :];  # Make the shorthand assignment LOOK LIKE an assignment.
-        tempTree = [];    # dummy-tree
-        parseAssign(xtmt, tempTree);                            # Checks legality of assignment, and hence of shorhand assignment.
-        [_, lhsExp, rhsExp] = tempTree[0];
-        pOrM = sym(short[0]);                                   # sym('+') or sym('-'); i.e. Plus or Minus
-        rhsExp = lhsExp + [pOrM] + rhsExp;                      # Convertin `lhs += rhs` to `lhs = lhs + rhs`
-        tree.append(['assign', lhsExp, rhsExp]);
+    def findAssignOp(a, b):
+        "Gives index of TOP-LEVEL = (or += or -=), if any."
+        for op in [sym('='), sym('+='), sym('-=')]:
+            k = findTop(tokens, a, b, op);
+            if k is not None: return k;
+        return None;
 
-    def sepForCls(tokens, j):                                 #form:        ... for ( i = 0 ;  i < 10 ; i += 1 )   { ... } ...
-        "Helps parseFor() w/ separating sub-clauses in for."  #indices:         j   lp      s1        s2       rp  lc    rc
-        try:
-            lp = tokens.index(sym('('), j);
-            assert lp == j + 1;                               # Notes:
-            rp = gmb(tokens, lp);                             #    1. We shall convert the for loop to an equivalent while loop
-            assert rp > lp + 1; # ( ..non-empty.. )           #    2. The equivalent while loop of the loop shown above is:
-            lc = tokens.index(sym('{'), rp);                  #         ... i = 0 ; while (i < 10) { ... i += 1 } ...
-            assert lc == rp + 1;                              #         where `...` is assumend to remain the same.
-            rc = gmb(tokens, lc);                             #    3. It is necessary to verify that the increment-clause
-            assert rc > lc + 1;    # non-empty block          #         of for `i += 1` is NOT a disruptive statement.
-            s1 = tokens.index(sym(';'), lp, rp);              #         It must be an assignment. (Pure JS is less restrictive.)
-            s2 = tokens.index(sym(';'), s1 + 1, rp);          #    4. Assignment & increment clauses within (parens of) for
-            assert s2 > s1 + 1;                               #         may not include function values; as tokens.index()
-            assert sym(';') not in tokens[s2 + 1 : rp];       #         is used as opposed to topIndex(). 
-        except (ValueError, AssertionError):
-            raise LJSyntaxErr('illegal for statement');
-        asgnCl = tokens[lp + 1 : s1];    # ASSiGNment CLause, yet to be parsed
-        condCl  = tokens[s1 + 1 : s2];
-        incrCl = tokens[s2 + 1 : rp];
-        codeCl  = tokens[lc + 1 : rc];
-        return (asgnCl, condCl, incrCl, codeCl, rc); # Each clause is yet to be parsed.
-    
-    def parseForAssignments(asgnClause):
+    def parseForAssignments(a, b):
         "Helps in parsing assignment and increment clauses."
         tempTree = [];
-        asgns = topSplit(asgnClause, sym(','));
-        #print 'split asgns = ', asgns;
-        for asg in asgns:
-            if sym('=') in asg:
-                parseAssign(asg, tempTree);
-            elif sym('+=') in asg or sym('-=') in asg:
-                parseShortAssign(asg, tempTree);
-            else:
+        for c, d in topSplit(tokens, a, b, sym(',')):
+            eqSign = findAssignOp(c, d);
+            if eqSign is None:
                 raise LJSyntaxErr('illegal for statement');
+            parseAssign(c, eqSign, d, tempTree);
         return tempTree;
     
-    def parseFor(tokens, j):                            
-        "Helps yacc(..) in parsing for stmt (as while)."
-        (asgnCl, condCl, incrCl, codeCl, rc) = sepForCls(tokens, j);
-        pAsgns = parseForAssignments(asgnCl);                # parsed assignments (from assignment clause)
-        pCond = parseExp(condCl);                            # parsed condition
-        pIncrs = parseForAssignments(incrCl);                # only for error checking
-        pCode = yacc(codeCl) + pIncrs;# + incrCl + [sym(';')]);            # parsed code; the UNPARSED increment clause is appended
+    def parseFor(j):                                          #form:        ... for ( i = 0 ;  i < 10 ; i += 1 )   { ... } ...
+        "Helps yacc(..) in parsing for stmt (as while)."      #indices:         j   lp      s1        s2       rp  lc    rc
+        try:
+            lp = j + 1;                                       # Notes:
+            assert lp < end and tokens[lp] is sym('(');       #    1. We shall convert the for loop to an equivalent while loop
+            rp = tokens.match[lp];                            #    2. The equivalent while loop of the loop shown above is:
+            assert rp > lp + 1; # ( ..non-empty.. )           #         ... i = 0 ; while (i < 10) { ... i += 1 } ...
+            lc = rp + 1;                                      #         where `...` is assumend to remain the same.
+            assert lc < end and tokens[lc] is sym('{');       #    3. It is necessary to verify that the increment-clause
+            rc = tokens.match[lc];                            #         of for `i += 1` is NOT a disruptive statement.
+            assert rc > lc + 1;    # non-empty block          #         It must be an assignment. (Pure JS is less restrictive.)
+            s1 = topIndex(tokens, lp + 1, rp, sym(';'));
+            s2 = topIndex(tokens, s1 + 1, rp, sym(';'));
+            assert s2 > s1 + 1;
+            assert findTop(tokens, s2 + 1, rp, sym(';')) is None;
+        except (LJSyntaxErr, AssertionError):
+            raise LJSyntaxErr('illegal for statement');
+        pAsgns = parseForAssignments(lp + 1, s1);            # parsed assignments (from assignment clause)
+        pCond = parseExp(tokens, s1 + 1, s2);                # parsed condition
+        pIncrs = parseForAssignments(s2 + 1, rp);            # parsed increments
+        pCode = parseBlock(tokens, lc + 1, rc) + pIncrs;     # parsed code; the increments are appended
         map(tree.append, pAsgns);                            # Assignment is placed before while (in our parse tree)
         tree.append(['while', pCond, pCode]);                # equivalent while loop
         return rc + 1;
     
-    def parseExpStmt(stmt):
+    def parseExpStmt(a, b):
         "Helps yacc(..) parse exp-stmts like `print('Hi!');`"
-        if stmt[0] is sym('function'):
+        if tokens[a] is sym('function'):
             raise LJSyntaxErr('unexpected token function');    # functions, unless wrapped in parens, are illegal pure-expressions
-        tree.append(['exp-stmt', parseExp(stmt)]);
+        tree.append(['exp-stmt', parseExp(tokens, a, b)]);
         return None;    
-        
-    j = 0;
-    while j < len(tokens):                                    # Here, we look at the a given token `tok`.
+    
+    parsers = {
+        sym('var'): parseVar, sym('if'): parseIf,
+        sym('else'): parseElse, sym('while'): parseWhile,
+        sym('return'): parseReturn, sym('break'): parseBreak,
+        sym('for'): parseFor#,
+    };
+    while j < end:                                            # Here, we look at the a given token `tok`.
         tok = tokens[j];                                      # If it is special, like 'if', 'var', 'while' etc.,
-        if tok is sym('var?'):                                #    we ship all the tokens, along with the index `j`
-            j += 1;                                           #    of the current token, to a helper like parseIf()
-        elif tok is sym('var'):                               #
-            j = parseVar(tokens[:], j);                       # In doing so, we send a non-alias-copy of `tokens`
-        elif tok is sym('if'):                                #     by simplying slicing it to all of itself `tokens[:]`.
-            j = parseIf(tokens[:], j);                        # Sending a non-alias-copy is important as the helper
-        elif tok is sym('else'):                              # may mutate tokens, making debugging difficult (if not impossible).
-            j = parseElse(tokens[:], j);                      #
-        elif tok is sym('while'):                             # The helper, when its done parsing, returns the index of 
-            j = parseWhile(tokens[:], j);                     #    the NEXT token to be considered.
-        elif tok is sym('return'):                            #
-            j = parseReturn(tokens[:], j);                    # The AST is mutated by the helper function.
-        elif tok is sym('break'):                             #     We needn't worry about that here.
-            j = parseBreak(tokens[:], j);
-        elif tok is sym('for'):
-            j = parseFor(tokens[:], j);
-        else:
-            #print 'current token = ', tok;
-            semiPos = topIndex(tokens, j, sym(';'));
-            stmt = tokens[j : semiPos];
-            if not stmt:
-                #pass;
+        if tok is sym('var?'):                                #    we ship the index `j` of the current token to a helper
+            j += 1;                                           #    like parseIf(), which parses tokens in [j, end).
+        elif type(tok) is Symbol and tok in parsers:          # The helper, when its done parsing, returns the index of 
+            j = parsers[tok](j);                              #    the NEXT token to be considered.
+        else:                                                 # The AST is mutated by the helper function.
+            semiPos = topIndex(tokens, j, end, sym(';'));     #     We needn't worry about that here.
+            if semiPos == j:
                 raise LJSyntaxErr('empty statement');
-            #if sym('=') in stmt:
-            #    parseAssign(stmt);
-            #elif sym('+=') in stmt or sym('-=') in stmt:
-            #    parseShortAssign(stmt); 
-            if isTopIn(stmt, sym('=')):
-                parseAssign(stmt);
-            elif isTopIn(stmt, sym('+=')) or isTopIn(stmt, sym('-=')):
-                parseShortAssign(stmt);
+            eqSign = findAssignOp(j, semiPos);
+            if eqSign is not None:
+                parseAssign(j, eqSign, semiPos);
             else:
-                parseExpStmt(stmt);
+                parseExpStmt(j, semiPos);
             j = semiPos + 1;
     return tree;
 
@@ -617,8 +659,8 @@ def gmob(li, i): # GetMatchingOpeningBacket. Cousin of gmb()
 #            ans.append(elt);
 #    return ans;
 
-def cloneTree (iTree):
-    "";
+def cloneTree (iTree):                                        # Note: Interpreters no longer need cloneTree(),
+    "Creates a NON-ALIAS clone of a parse tree.";                # as parse trees are never mutated while running.
     oTree = [];
     for iNode in iTree:
         if type(iNode) is Function:
@@ -664,10 +706,17 @@ def makeEnvClass(maxDepth=None): # maxDepth is private
                 return self;
             elif not self.isGlobal:
                 return self.parent.getEnv(key);
+            elif self.base is not None and key in self.base:
+                return self;                                  # reads fall through (see __missing__), writes shadow
             raise LJReferenceErr('%s is not defined' % key);
+        def __missing__(self, key):
+            "Reads a variable through to the Base, if any."
+            if self.base is None: raise KeyError(key);
+            return self.base[key];
         def init(self, key, value):
             "Initializes a variable in the currect environment."
-            if key not in self: self[key] = value;
+            if key not in self and not (self.isGlobal and self.base is not None and key in self.base):
+                self[key] = value;
             else:
                 raise LJReferenceErr('%s is already defined' % key);
         def assign(self, key, value):
@@ -679,10 +728,6 @@ def makeEnvClass(maxDepth=None): # maxDepth is private
         def makeChild(self, params=[], args=[]):
             "Creates an Env with current Env `self` as parent."
             return Env(params=params, args=args, parent=self);
-        def setDepth(self, depth):
-            self.depth = depth;
-            if maxDepth and self.depth >= maxDepth:
-                raise LJRuntimeErr('maximum call depth exceeded');
         #def show(self):
         #    "Helps with debugging."
         #    out = '\n';
@@ -691,15 +736,110 @@ def makeEnvClass(maxDepth=None): # maxDepth is private
         #            out += '\t\t%s : %s\n' % (k, self[k]);
         #    return out;
     
+    class Frozen(Env):
+        "An Env of a Base, whose variables can't be changed."
+        def __setitem__(self, key, value):
+            raise LJTypeErr('cannot change frozen variable');
+    
+    Env.maxDepth = maxDepth;                                  # also read by Frames (via Context)
+    Env.base = None;                                          # a global Env's frozen Base Env, if any
+    Env.Frozen = Frozen;
     return Env;
 
-class LJJump(Exception):
-    def __str__(self):
-        return 'unexpected jump statement';
-class LJReturn(LJJump): pass;
-class LJBreak(LJJump): pass;
+class LJJump(Exception):                                      # Statements report how they complete, without raising:
+    def __str__(self):                                        #     None        normally,
+        return 'unexpected jump statement';                   #     BREAK       via `break;`
+class LJReturn(LJJump): pass;                                 #     (value,)    via `return value;`
+class LJBreak(LJJump): pass;                                  # LJReturn and LJBreak are raised only for misplaced jumps, i.e.
+                                                              #    ones that complete a function body or a whole program.
+BREAK = object();    # completion signal of `break;`
+
+def checkCompletion(signal):
+    "Raises if a program completed via a jump."
+    if signal is BREAK: raise LJBreak();
+    if signal is not None: raise LJReturn(signal[0]);
+
+class TailCall(object):                                       # `return f(..);` in a function, but not within a loop, is a tail call.
+    "A call deferred to the caller of a function body."       #    Instead of calling f, the function's body returns TailCall(f, args),
+    __slots__ = ['func', 'args'];                             #    and the caller (see callFunction) calls f in its place, at the same
+    def __init__(self, func, args):                           #    depth. Thus, tail-recursive loops run in constant (Python) stack,
+        self.func = func;                                     #    & never exceed maxDepth. (Fuel limits them, like any loop.)
+        self.args = args;                                     # Calls within loops aren't deferred, as a callee's misplaced break
+                                                              #    must break out of the caller's loop.
+
+fuelInterval = 1000;    # units of fuel between checks of a Fuel's deadline
+memoryInterval = 65536; # bytes allocated between checks of a Fuel's memoryLimit
+itemBytes = {list: sys.getsizeof([None]) - sys.getsizeof([])};    # An object's items are a hash, key & value.
+itemBytes[dict] = 3 * itemBytes[list];
+emptyBytes = {list: sys.getsizeof([]), dict: sys.getsizeof({})};
+
+def valueBytes(t, n):                                         # Not sys.getsizeof(x), which varies w/ how x was made, & so w/ the
+    "Bytes counted for an array or object of n items."       #    engine.
+    return emptyBytes[t] + n * itemBytes[t];
+
+class Fuel(object):                                           # Each run burns a unit of fuel per statement, per loop iteration and
+    "Counts (and limits) the work done by a run."             #    per call of a (LittleJ) function, by:
+    __slots__ = ['tank', 'filled', 'limit', 'deadline',       #        fuel.tank -= 1;
+                 'room', 'roomTop', 'peak', 'memoryLimit'];   #        if fuel.tank < 0: fuel.refill();
+    def __init__(self, limit=None, timeLimit=None, memoryLimit=None):    # Thus, a run always stops at the same point, when out
+        self.limit = limit;                                   #    of fuel, however loaded the machine. The clock is read only
+        self.deadline = time.time() + timeLimit if timeLimit else None;    # once every fuelInterval units, by refill().
+        self.memoryLimit = memoryLimit;                       # Memory allocated is metered alike, in bytes, by:
+        self.room = self.roomTop = self.peak = 0;             #        fuel.room -= n;
+        self.tank = self.filled = 0;                          #        if fuel.room < 0: fuel.grow();
+        self.refill();
+        self.grow();
+    def used(self):
+        "Returns the units of fuel burnt so far."
+        return self.filled - self.tank;
+    def refill(self):
+        "Refills the tank; raises if out of fuel or time."
+        used = self.used();
+        if self.limit is not None and used > self.limit:
+            raise LJRuntimeErr('out of fuel');
+        if self.deadline is not None and time.time() > self.deadline:
+            raise LJRuntimeErr('out of time');
+        self.tank = fuelInterval if self.limit is None else min(fuelInterval, self.limit - used);
+        self.filled = used + self.tank;
+    def allocated(self):                                      # This is an allocation budget, not a measure of live memory: values
+        "Returns the bytes allocated so far."                #    are counted (shallowly, by valueBytes) as they're made or grow,
+        return self.roomTop - self.room;                      #    but never as they're collected. Bytes are only credited back when
+    def allocatedPeak(self):                                  #    natives (like del) shrink arrays or objects.
+        "Returns the most bytes allocated at any point."
+        return max(self.peak, self.allocated());
+    def grow(self):
+        "Makes room for allocations; raises if out of memory."
+        allocated = self.allocated();
+        if self.memoryLimit is not None and allocated > self.memoryLimit:
+            raise LJRuntimeErr('out of memory');
+        self.room = memoryInterval if self.memoryLimit is None else min(memoryInterval, self.memoryLimit - allocated);
+        self.roomTop = allocated + self.room;
+    def alloc(self, n):
+        "Counts n bytes allocated (or freed, if negative)."  # Memory only rises between frees, so the peak is noted at each.
+        if n < 0: self.peak = self.allocatedPeak();
+        self.room -= n;
+        if self.room < 0: self.grow();
 
-def lj_repr(x):
+class Current(threading.local):                               # Natives may depend on the Runtime running them. E.g. print() writes
+    "The Runtime running (or calling) in each thread."      #    to its writer, & natives that call back into LittleJ burn its fuel.
+    runtime = None;                                           # Thus, natives needn't be bound to a single Runtime.
+    depth = 0;                                                # depth of the latest native's caller (see invokePyFunction)
+current = Current();
+
+def fuelRuns(tree, entry=0):                                  # A block's statements run one after another, up to (and including)
+    "Splits a block into runs, each w/ the fuel it burns."    #    a compound or jump statement. Thus, compiled code burns fuel for
+    runs = [([], entry)];                                     #    a whole run at once. (So, when a statement raises, the rest of its
+    for stmt in tree:                                         #    run is burnt too.) `entry` is added to the first run's fuel.
+        stmts, n = runs[-1];
+        if stmts and stmts[-1][0] in ['if-ladder', 'while', 'return', 'tail-call', 'break']:
+            stmts, n = [], 0;
+            runs.append((stmts, n));
+        stmts.append(stmt);
+        runs[-1] = (stmts, n + 1);
+    return runs;
+
+def atomRepr(x):
+    "Represents a non-container value (or [], {})."
     if x is None: return 'null';
     if type(x) is bool: return 'true' if x else 'false';
     if type(x) is float:
@@ -708,509 +848,1732 @@ def lj_repr(x):
     if type(x) is str:
         return '"' + x.replace('"', '\\"') + '"'; 
     if type(x) in [Name, Symbol]: return x;
-    if type(x) is list:
-        if not x: return '[]' # corner case (see shaving)
-        out = '[';
-        for elt in x: out += lj_repr(elt) + ', ';
-        out = out[ : -2]; # shave off trailing ", "
-        return out + ']';
-    if type(x) is dict:
-        if not x: return '{}'; # corner case
-        out = '{';
-        for k in x: out += lj_repr(k) + ': ' + lj_repr(x[k]) + ', ';
-        out = out[ : -2]; # shave off trailing ", "
-        return out + '}';
+    if type(x) is list and not x: return '[]';
+    if type(x) is dict and not x: return '{}';
     if type(x) is Function:
         return 'function (' + ', '.join(x.params) + ') { ' + ' '.join(map(lj_repr, x.iTokens[1:])) + ' }';
     if inspect.isfunction(x):
         return 'function () { [native code] }'
     assert False;
+
+def lj_repr(x):                                               # Arrays and objects are walked with an explicit stack (`todo`) of
+    "Represents a value in LittleJ syntax."                   #    values and 1-tuples of text, rather than recursively. Thus, deeply
+    if not x or type(x) not in [list, dict]:                  #    nested values can't exhaust Python's stack.
+        return atomRepr(x);
+    out = []; todo = [x];
+    while todo:
+        x = todo.pop();
+        if type(x) is tuple:
+            out.append(x[0]);
+        elif type(x) is list and x:
+            todo.append((']',));
+            for j in xrange(len(x) - 1, 0, -1):
+                todo.extend([x[j], (', ',)]);
+            todo.extend([x[0], ('[',)]);
+        elif type(x) is dict and x:
+            keys = list(x);
+            todo.append(('}',));
+            for j in xrange(len(keys) - 1, -1, -1):
+                todo.extend([x[keys[j]], (lj_repr(keys[j]) + ': ',)]);
+                if j: todo.append((', ',));
+            todo.append(('{',));
+        else:
+            out.append(atomRepr(x));
+    return ''.join(out);
+#############################################################
+
+def refineObject(obj, key):
+    "Helps with object refinements."
+    if type(key) is not str:
+        raise LJTypeErr('object keys must be strings');
+    if key not in obj:
+        raise LJKeyErr(key);
+    return obj[key]; # intermediate result
+
+def refineListy(li, ind):
+    "Helps with list and string refinements."
+    msg = 'array' if type(li) is list else 'string';
+    if type(ind) is not float:
+        raise LJTypeErr(msg + ' indices must be numbers ... ' + lj_repr(ind));
+    elif ind < 0:
+        raise LJTypeErr(msg + ' indices must be non-negative ... ' + lj_repr(ind));
+    elif ind != round(ind):
+        raise LJTypeErr(msg + ' indices must integers ... ' + lj_repr(ind));
+    elif ind >= len(li):
+        raise LJIndexErr(msg + ' index out of range ... ' + lj_repr(ind));
+    return li[int(ind)];    # intermediate result
+
+def refine(ob, ki):                                           # form:        ... <py-dict-or-list> [ ki ] ...
+    "Performs a refinement on object/array/string."
+    if type(ob) is dict:
+        return refineObject(ob, ki);
+    elif type(ob) in [list, str]:
+        return refineListy(ob, ki);
+    raise LJTypeErr('cannot refine a non-object ... ' + lj_repr(ob));
+
+def unop(op, val):                                            # form:        ... op value ...
+    "Evaluates a single unary expression like !true."
+    if op is sym('!'):
+        return not isTruthy(val);
+    elif op is sym('-'):
+        if type(val) is not float:
+            raise LJTypeErr('bad operand for unary -');
+        return -val;
+    elif op is sym('+'):
+        if type(val) in [str, float]:
+            try: return float(val);                           # Note: `isDecimal` is not useful here.
+            except ValueError: pass;
+        raise LJTypeErr('bad operand for unary +');
+    raise LJSyntaxErr('unexpected unary operator ' + op);
+
+def eqeqeq(x, y):                                             # Note: In python, `1.0 is 1.0` --> True
+    "Emulates JS's === operator."                             #        But, `a = 1.0; b = 1.0; a is b` --> False
+    if type(x) != type(y) : return False;                     #        Thus `is` in py is NOT the same as `===` in JS
+    if type(y) in [bool, float, str, type(None)]:
+        return x == y;
+    refTypes = [list, dict, Function];
+    assert type(y) in refTypes or inspect.isfunction(y);
+    return x is y;
+
+indiBinops = {                                                # type-independent operators
+    sym('==='): eqeqeq,
+    sym('!=='): lambda x, y: not eqeqeq(x, y),
+    sym('&&'): lambda x, y: y if isTruthy(x) else x,
+    sym('||'): lambda x, y: x if isTruthy(x) else y#,
+};
+
+strNumBinops = {                                              # string and number operators
+    sym('>='): lambda x, y: x >= y,                           # Note:    `1 < "king"` is `True` in python but `false` in JS
+    sym('<='): lambda x, y: x <= y,                           #    Thus, type equality IS necessary for meaningful use of these ops.
+    sym('>'): lambda x, y: x > y,
+    sym('<'): lambda x, y: x < y,
+    sym('+'): lambda x, y: x + y#,
+};
+
+numBinops = {                                                 # number-only operators
+    sym('*'): lambda x, y: x * y,
+    sym('/'): lambda x, y: x / y,
+    sym('%'): lambda x, y: x % y,                             # Note: `+` is dealt with in strNumBinops
+    sym('-'): lambda x, y: x - y#,
+};
+
+def binop(a, op, b, fuel=None):                               # form:        ... value0 op value1 ...
+    "Evaluates a single binary expression like 1 + 1."       # String concatenation is metered by fuel (see Fuel), if given.
+    if op in indiBinops:
+        return indiBinops[op](a, b);
+    # otherwise...
+    if type(a) == type(b) and type(b) in [str, float]:
+        if op in strNumBinops:
+            if type(b) is str and fuel is not None and op is sym('+'):
+                fuel.room -= len(a) + len(b);                 # The whole new string is counted, like any other value made,
+                if fuel.room < 0: fuel.grow();                #    as both operands may well be kept alive.
+            return strNumBinops[op](a, b);
+        elif type(b) is float and op in numBinops:
+            return numBinops[op](a, b);
+    raise LJTypeErr('bad operands for binary ' + op + eMsgr([a, op, b]));
+
+def invokePyFunction(func, args, fuel=None, depth=0):
+    "Helps invoke python's function."                        # If fuel is given, the memory a native allocates is metered (see
+    nParams = func.__code__.co_argcount;                      #    Fuel): i.e. its return value (if new), and the growth of the
+    if len(args) != nParams:                                  #    arrays & objects passed to it (as by append).
+        raise LJTypeErr('incorrect no. of arguments');
+    current.depth = depth;                                    # the caller's, for natives that call back into LittleJ
+    held = [x for x in args if type(x) is list or type(x) is dict] if fuel is not None else None;
+    if held: lens = map(len, held);
+    inter = func(*args);
+    types = [bool, float, str, list, dict, Function, type(None)];
+    if type(inter) in types or inspect.isfunction(inter):
+        if held:
+            for x, n in zip(held, lens):
+                if len(x) != n: fuel.alloc((len(x) - n) * itemBytes[type(x)]);
+        if type(inter) in [str, list, dict] and fuel is not None and id(inter) not in map(id, args):
+            fuel.alloc(len(inter) if type(inter) is str else valueBytes(type(inter), len(inter)));
+        return inter;    # intermediate result
+    raise Exception('non-returning native function');
+
+frozenIds = {};    # id -> no. of live Bases that share the value (see freezeEnv)
+frozenLock = threading.RLock();    # (reentrant, as Bases may be released by gc while it's held)
+baseRefs = {};    # id -> weakref, to the Env of each live Base
+
+def checkMutable(objarr):
+    "Raises if an object or array belongs to a Base."
+    if frozenIds and id(objarr) in frozenIds:
+        raise LJTypeErr('cannot change frozen ' + ('array' if type(objarr) is list else 'object'));
+
+def assignRefinement(objarr, innexp, rhsVal, fuel=None):
+    "Assigns to an object key or an array index."            # New keys are metered by fuel (see Fuel), if given.
+    checkMutable(objarr);
+    if [type(objarr), type(innexp)] == [dict, str]:
+        if fuel is not None and innexp not in objarr:
+            fuel.alloc(itemBytes[dict]);
+        objarr[innexp] = rhsVal;
+    elif [type(objarr), type(innexp)] == [list, float]:
+        refineListy(objarr, innexp);    # checks range and roundness
+        objarr[int(innexp)] = rhsVal;
+    else:    # Note: strings are immutable
+        raise LJTypeErr('illegal LHS in assignment' + eMsgr([objarr, sym('['), innexp, sym(']')]));
+
+countedOps = map(sym, '< <= > >='.split());
+
+def countedLoop(stmt):                                        # form:        while ( i < n ) { ... i += 1 ; }    (as made by parseFor)
+    "Matches a counted while loop; returns its parts."       # i is a variable, n a literal or variable, and the step a number.
+    [_, cond, code] = stmt;                                   # Returns (var, op, bound, pOrM, step, body), or None.
+    if cond[0] != 'binop' or cond[1] not in countedOps or not code: return None;
+    [_, op, var, bound] = cond;
+    if var[0] not in ['name', 'local', 'global'] or bound[0] not in ['literal', 'name', 'local', 'global']:
+        return None;
+    last = code[-1];                                          # the increment, appended by parseFor
+    if last[0] != 'assign' or last[1] != var or last[2][0] != 'binop': return None;
+    [_, pOrM, incVar, stepExp] = last[2];
+    if pOrM not in [sym('+'), sym('-')] or incVar != var: return None;
+    if stepExp[0] != 'literal' or type(stepExp[1]) is not float: return None;
+    return var, op, bound, pOrM, stepExp[1], code[:-1];
+
 #############################################################
 
-def run(tree, env, maxLoopTime=None, writer=None):
-    "Executes parsed code in an environment `env`."
+def run(tree, env, maxLoopTime=None, writer=None, tailCalls=False, fuel=None, maxDepth=None):
+    "Executes parsed code in an environment `env`."          # tailCalls tells if `return f(..);` may be a tail call (see TailCall).
+    if fuel is None: fuel = Fuel();                          # fuel is burnt as the code runs (see Fuel).
+    if maxDepth is None: maxDepth = env.maxDepth or 0;       # The run's limit, not that of each function's crEnv, which may be
+                                                             #    an Env of a Base (see Base). (0 is for no limit.)
     # -------------------------------------------------------
     # *********************************************
-    def eval(expLi, env):
-        "Evaluates an expression in an environment."
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - 
-        def setFuncCreationEnvs(expLi):
-            "Set the creation Env (crEnv) for all functions."
-            for elt in expLi:
-                if type(elt) is Function and elt.crEnv == None:    # elt.crEnv may have been previously set due to the recursive
-                    elt.crEnv = env;                               #     nature of eval().
-            return expLi;                                         # Not required, but all other functions return expLi.
-        
-        def subNames(expLi):
-            "Substitutes identifier names w/ their values."
-            #print 'entering subNames, expLi = ', expLi;
-            count = 0; # counts { and }
-            for j in xrange(len(expLi)):
-                tok = expLi[j];
-                if tok is sym('{'): count += 1;               # Keys in objects `{a: "apple"}` are NOT substituted
-                elif tok is sym('}'): count -= 1;
-                elif type(tok) is Name and count == 0:
-                    expLi[j] = env.lookup(tok);               # env was passed to eval
-            return expLi;
-        
-        def subObject(expLi, j):                              # form:        ... { ... keyX : valueExpX , keyY : valueExpY ... }
-            "Substitutes an object literal w/ a py-dict."     # indices:         j                                             rc
-            #print 'entering subObject, expLi = ', expLi;
-            rc = gmb(expLi, j);
-            inner = expLi[j + 1 : rc];
-            pairs = topSplit(inner, sym(','));
+    def eval(exp, env):
+        "Evaluates an expression (node) in an environment."
+        tag = exp[0];                                         # Tags are tested roughly in order of frequency.
+        if tag == 'name':
+            return env.lookup(exp[1]);
+        elif tag == 'literal':
+            return exp[1];
+        elif tag == 'binop':
+            op = exp[1];
+            if op is sym('&&') or op is sym('||'):            # The right operand is evaluated only if needed.
+                x = eval(exp[2], env);
+                if isTruthy(x) is (op is sym('||')): return x;
+                return eval(exp[3], env);
+            return binop(eval(exp[2], env), op, eval(exp[3], env), fuel);
+        elif tag == 'refine':
+            return refine(eval(exp[1], env), eval(exp[2], env));
+        elif tag == 'call':
+            return invoke(exp, env);
+        elif tag == 'unop':
+            return unop(exp[1], eval(exp[2], env));
+        elif tag == 'array':
+            fuel.alloc(valueBytes(list, len(exp[1])));
+            return [eval(elt, env) for elt in exp[1]];
+        elif tag == 'object':
+            fuel.alloc(valueBytes(dict, len(exp[1])));
             obj = {};
-            for pair in pairs:                                # pair form:    keyA :   x + y + factorial ( 5 )
-                try:                                          # indices:        0  1   2 3 4 5     6     7 8 9
-                    assert len(pair) >= 3;
-                    key = pair[0];
-                    if type(key) is Name: key = str(key);
-                    assert type(key) is str;                 # JS keys MUST be strings. Numbers & booleans are coerced to strings.
-                    assert pair[1] is sym(':');
-                except AssertionError :
-                    raise LJSyntaxErr('illegal object literal' + eMsgr(expLi));
-                valueLi = pair[2 : ];
-                obj[key] = eval(valueLi, env);
-            expLi = expLi[ : j] + [obj] + expLi[rc + 1 : ];
-            return expLi;
-        
-        def subArray(expLi, j):                               # form:        ... [ 1 + 1 + 1 , expB , ... , expN ] ...
-            "Substitutes an array literal w/ a py-list."      # indices:        j                                rs
-            #print 'entering subArray, expLi = ', expLi;
-            rs = gmb(expLi, j);
-            inner = expLi[j + 1 : rs];
-            expLists = topSplit(inner, sym(','));            # each expression is represented by a py-list of tokens
-            arr = [];
-            for eLi in expLists:
-                try: assert len(eLi) >= 1;                    # try-except used over `if` to maintain consistency.
-                except AssertionError:                        # In the future, there may be more assertions.
-                    raise LJSyntaxErr('illegal array literal');
-                arr.append(eval(eLi, env));
-            expLi = expLi[ : j] + [arr] + expLi[rs + 1 : ];
-            return expLi;
-        
-        def subObjsAndArrs(expLi):
-            "Substitute literal objects and arrays."
-            #print 'entering sOA, expLi = ' + expLi;
-            j = 0;
-            while j < len(expLi):
-                tok = expLi[j];
-                if tok is sym('{'):
-                    expLi = subObject(expLi, j);
-                elif tok is sym('['):
-                    if j == 0:    # corner case (array literal)
-                        expLi = subArray(expLi, j);
-                    else:
-                        pok = expLi[j - 1];    # Previous tOK
-                        indexyTypes = [dict, list, str];
-                        pokIsIndexy = type(pok) in indexyTypes;
-                        if pokIsIndexy or pok in [sym(']'), sym(')')]:
-                            pass;    # indexing operation    # indexing operations are handeled by refine(..)
-                        else:        # array literal
-                            expLi = subArray(expLi, j);
-                else:
-                    pass;         # ignore other tokens
-                j += 1;            # even if expLi changes, incr j by 1
-            return expLi;
-        
-        def refineObject(obj, key):
-            "Helps with object refinements."
-            if type(key) is not str:
-                raise LJTypeErr('object keys must be strings');
-            if key not in obj:
-                raise LJKeyErr(key);
-            return obj[key]; # intermediate result
-        
-        def refineListy(li, ind):
-            "Helps with list and string refinements."
-            msg = 'array' if type(li) is list else 'string';
-            if type(ind) is not float:
-                raise LJTypeErr(msg + ' indices must be numbers ... ' + lj_repr(i));
-            elif ind < 0:
-                raise LJTypeErr(msg + ' indices must be non-negative ... ' + lj_repr(i));
-            elif ind != round(ind):
-                raise LJTypeErr(msg + ' indices must integers ... ' + lj_repr(i));
-            elif ind >= len(li):
-                raise LJIndexErr(msg + ' index out of range ... ' + lj_repr(ind));
-            return li[int(ind)];    # intermediate result
-        
-        def refine(expLi, j):                                # form:        ... <py-dict-or-list> [   10   ] ...
-            "Performs a refinement on object/array."         # indices:                          j        rs
-            #print 'entering refine, expLi = ', expLi;
-            def getRetExpLi(inter):
-                return expLi[ :j-1] + [inter] + expLi[rs+1: ];
-            ob = expLi[j - 1];    # object, array or string
-            assert type(ob) in [dict, list, str];
-            rs = gmb(expLi, j);
-            if rs == j + 1:
-                raise LJSyntaxErr('illegal refinement');
-            inner = expLi[j + 1 : rs];
-            ki = eval(inner, env); # short for Key/Index
-            if type(ob) is dict:
-                inter = refineObject(ob, ki);
-            else: # ob in [list, str]: (see assert)
-                inter = refineListy(ob, ki);
-            return getRetExpLi(inter);
-        
-        def invokeFunction(func, args):
-            "Helps invokes non-native functions."
+            for key, valExp in exp[1]:
+                obj[key] = eval(valExp, env);
+            return obj;
+        elif tag == 'function':
+            return makeFunction(exp[1], None, env);          # A fresh Function, paired w/ its creation Env (crEnv).
+        raise Exception('unknown node ' + tag);               # internal error
+    
+    def invokeFunction(func, args, env):
+        "Helps invokes non-native functions."
+        start, depth = None, env.depth + 1;
+        while True:
             if len(args) != len(func.params):
                 raise LJTypeErr('incorrect no. of arguments ... (%s)' % lj_repr(args)[1:-1]);            
-            if func.crEnv is None: raise Exception();           # internal error
-            assert func.crEnv is not None;
+            if func.crEnv is None: raise Exception();       # internal error
+            if func.body is not None:                       # Compiled Functions keep their variables in Frames, not Envs.
+                return callFunction(func, args, env, Context(maxLoopTime, None, maxDepth, fuel), depth);
+            fuel.tank -= 1;
+            if fuel.tank < 0: fuel.refill();
             newEnv = func.crEnv.makeChild(func.params, args);   # A function is executed in its environ of creation
-            newEnv.setDepth(env.depth + 1);                     # Depth of newEnv is changed to invocation_env's depth + 1
-            treeClone = cloneTree(func.tree);                   # shields func.tree from being mutated
-            #print 'bodyClone = ', bodyClone, '\n';
-            try:
-                run(treeClone, newEnv, maxLoopTime, writer);
-                #print('about to exit invokeFunc...`try` block w/ no return');
-            except LJReturn as r:
-                #print('in except block of invokeFunc.. due to return, retval = %s' % r.args[0]);
-                inter = r.args[0];
-                return inter;    # intermediate result
-            raise LJTypeErr('non-returning function');
-        
-        def invokePyFunction(func, args):
-            "Helps invoke python's function."
-            nParams = len(inspect.getargspec(func)[0]);        # number of parameters
-            if len(args) != nParams:
-                raise LJTypeErr('incorrect no. of arguments');
-            inter = func(*args);
-            types = [bool, float, str, list, dict, Function, type(None)];
-            if type(inter) in types or inspect.isfunction(inter):
-                return inter;    # intermediate result
-            #print func;
-            raise Exception('non-returning native function');            
-                
-        def invoke(expLi, j):                                # form:        ... <Function> ( 1, "king", ... , [0] ) ...
-            "Helps perform function calls."                  # indices:                    j                      rp
-            #print 'entering invoke, expLi = ', expLi;
-            def getRetExpLi(inter):
-                return expLi[ :j-1] + [inter] + expLi[rp+1:];
-            func = expLi[j - 1];
-            assert type(func) is Function or inspect.isfunction(func);
-            rp = gmb(expLi, j);
-            inner = expLi[j + 1 : rp];
-            augInner = [sym('[')] + inner + [sym(']')];
-            args = subArray(augInner, 0)[0];    # subArray returns an expLi. Here, the returned expLi will contain a single list
-            if type(func) is Function:
-                inter = invokeFunction(func, args);
-            else: # pythonic function
-                inter = invokePyFunction(func, args);
-            return getRetExpLi(inter);
-        
-        def solveGroup(expLi, j):                             # form:        ... ( a + b ) ...
-            "Helps with parentheses based grouping."          # indices:         j
-            #print 'entering solveGroup, expLi = ', expLi;
-            rp = gmb(expLi, j);
-            inner = expLi[j+1 : rp];
-            gVal = eval(inner, env);    # Grouping's Value
-            expLi = expLi[ : j] + [gVal] + expLi[rp+1 : ];
-            return expLi;
-            
-        def refine_invoke_and_group(expLi):
-            "Performs refinements and invocations."
-            #print 'entering r_i_and_g, expLi = ', expLi;
-            entered = cloneLi(expLi);
-            j = 0;
-            def isFunction(x) :
-                return type(x) is Function or inspect.isfunction(x);
-            while j < len(expLi):
-                tok = expLi[j];
-                if tok is sym('['):
-                    expLi = refine(expLi, j);
-                    # j = j;         # no increment
-                elif tok is sym('(') and j == 0: # corner case
-                    expLi = solveGroup(expLi, j);
-                    j += 1;
-                elif tok is sym('('):
-                    prev = expLi[j - 1];
-                    if isFunction(prev):
-                        expLi = invoke(expLi, j);
-                        # j = j;    # no increment
-                    else:
-                        expLi = solveGroup(expLi, j);
-                        j += 1;
-                else:
-                    j += 1; # ignore other tokens
-            if expLi == [['a', 'c', 'b'], [0.0]]:
-                pass;
-                #print 'entering rig expLi = ', entered;
-                #print 'leaving  rig expLi = ', expLi;
-            return expLi;
-                
-        def unop(expLi, op, j):                               # form:        ... op value ...    
-            "Evaluates a single unary expression like !true." # indices:         j
-            #print 'entering unop, expLi = ', expLi;
-            try:    
-                valExpLi = [expLi[j + 1]];
-            except ValueError:
-                raise LJSyntaxErr('unexpected unary operator' + op);
-            if op is sym('!'):                
-                inter = not isTruthy(eval(valExpLi, env));
-                expLi = expLi[ : j] + [inter] + expLi[j+2 : ];
-            elif op is sym('-'):
-                inter = eval(valExpLi, env);
-                if type(inter) is not float:
-                    raise LJTypeErr('bad operand for unary -');
-                expLi = expLi[ : j] + [-inter] + expLi[j+2 : ];
-            elif op is sym('+'):
-                inter = eval(valExpLi, env);
-                if type(inter) in [str, float]:
-                    try: interF = float(inter);                # Note: `isDecimal` is not useful here.
-                    except ValueError:
-                        raise LJTypeErr('bad operand for unary +');
-                else:
-                    raise LJTypeErr('bad operand for unary +');
-                expLi = expLi[ : j] + [interF] + expLi[j+2 : ];
-            return expLi;
-        
-        def indiBinop(a, op, b):
-            "Helps binop(..) with type-independent operators."
-            #print 'entering indiBinop, expLi = ', expLi;
-            isT = isTruthy;                                    # Note: JS and python have different ideas of falsehood
-            def eqeqeq(x, y):                                  # Note: In python, `1.0 is 1.0` --> True
-                if type(x) != type(y) : return False;          #        But, `a = 1.0; b = 1.0; a is b` --> False
-                if type(y) in [bool, float, str, type(None)]:  #        Thus `is` in py is NOT the same as `===` in JS
-                    return x == y;
-                refTypes = [list, dict, Function];
-                assert type(y) in refTypes or inspect.isfunction(y);
-                return x is y;
-            return {                                        # pythonic switch statement                                
-                sym('==='): eqeqeq,
-                sym('!=='): lambda x, y: not eqeqeq(x, y),
-                sym('&&'): lambda x, y: y if isT(x) else x,
-                sym('||'): lambda x, y: x if isT(x) else y#,
-            }[op](a, b);
-        
-        def strNumBinop(a, op, b):
-            "Helps binop(..) with string and number operations."
-            #print 'entering strNumBinop, expLi = ', expLi;
-            return {                                        
-                sym('>='): lambda x, y: x >= y,            # Note:    `1 < "king"` is `True` in python but `false` in JS
-                sym('<='): lambda x, y: x <= y,            #    Thus, type equality IS necessary for meaningful use of these ops.
-                sym('>'): lambda x, y: x > y,
-                sym('<'): lambda x, y: x < y,
-                sym('+'): lambda x, y: x + y,
-            }[op](a, b);
-        
-        def numBinop(a, op, b):
-            "Helps binop(..) with number operations."
-            #print 'entering numBinop, expLi = ', expLi;
-            return {
-                sym('*'): lambda x, y: x * y,
-                sym('/'): lambda x, y: x / y,
-                sym('%'): lambda x, y: x % y,                # Note: `+` is dealt with in strNumBinop
-                sym('-'): lambda x, y: x - y#,
-            }[op](a, b);
-        
-        def checkChaining(expLi, op, j):                        # On Chromium,
-            nonAsso = map(sym, '> < >= <= === !=='.split());    #                 1 === 1 === 1    -->        false
-            if j + 2 >= len(expLi): return;                     # because,
-            op2 = expLi[j + 2];                                 #                1 === 1          -->        true
-            rawMsg = 'operators %s and %s cannot be chained';   #                true === 1         -->        false
-            if op in nonAsso and op2 in nonAsso:                # Also,
-                op2 = expLi[j + 2];                             #                1 > 1 < 1        -->        true
-                msg = rawMsg % (op, op2);                       # because,
-                if op == op2:                                   #                1 > 1            -->        false
-                    msg = 'operator %s cannot be chained' % op; #                false < 1        -->        true
-                raise LJSyntaxErr(msg);                         #
-            else: pass;                                         # We shall not be a part of this madness!!
-        
-        def binop(expLi, op, j):                                # form:        ... value0 op value1 ...
-            "Evaluates a single binary expression like 1 + 1."  # indices:                j
-            #print 'entering binop, expLi = ', expLi;
-            def getRetExpLi(inter):
-                return expLi[ : j-1] + [inter] + expLi[j+2 : ];              j
-            try:
-                assert j > 0;
-                a = expLi[j - 1];    # first operand
-                b = expLi[j + 1];    # second operand
-            except (AssertionError, IndexError):
-                raise LJSyntaxErr('unexpected operator ' + op);
-            checkChaining(expLi, op, j);                                        
-            indiOps = map(sym, '=== !== && ||'.split());                    
-            if op in indiOps:                                            
-                inter = indiBinop(a, op, b);
-                return getRetExpLi(inter);
-            # otherwise...                                
-            if type(a) == type(b) and type(b) in [str, float]:
-                strNumOps = map(sym, '>= <= > < +'.split());
-                if op in strNumOps:
-                    inter = strNumBinop(a, op, b);
-                    return getRetExpLi(inter);
-                elif type(b) is float:
-                    numOps = map(sym, list('*/%-'));
-                    assert op in numOps;
-                    inter = numBinop(a, op, b);
-                    return getRetExpLi(inter);
-            raise LJTypeErr('bad operands for binary ' + op + eMsgr(expLi));
-        
-        def allUnary(expLi):
-            "Evaluates all unary expressions in expLi."
-            # UNARY (right to left)
-            j = len(expLi) - 1;            
-            while j >= 0:
-                if expLi[j] is sym('!'):
-                    expLi = unop(expLi, sym('!'), j);
-                elif expLi[j] is sym('-'):
-                    if j == 0 or type(expLi[j - 1]) != float:
-                        expLi = unop(expLi, sym('-'), j);
-                    else: pass;    # binary subtraction
-                elif expLi[j] is sym('+'):
-                    #if j == 0 or type(expLi[j - 1]) not in [float, str]:
-                    if j == 0 or type(expLi[j - 1]) is Symbol:
-                        expLi = unop(expLi, sym('+'), j);
-                    else: pass; # binary addition
-                else: pass;        # ignore token
-                j -= 1;
-            return expLi;
-            
-        def allBinary(expLi):
-            "Evaluates all binary expressions in expLi."
-            # BINARY (left-to-right):
-            precedence = [
-                [sym('*'), sym('/'), sym('%')],             # Note: ['*', '/', '%'] would also work just fine.
-                [sym('+'), sym('-')],                       # Because, in Python
-                [sym('>='), sym('<='), sym('>'), sym('<')], # ``` class S(str): pass;
-                [sym('==='), sym('!==')],                   #     s = S('king');  
-                [sym('&&')],                                #     s == 'king'; # ==> True
-                [sym('||')]#,
-            ];
-            for level in precedence:
-                #print expLi, level;
-                j = 0;
-                while j < len(expLi):
-                    if expLi[j] in level and type(expLi[j]) is Symbol:
-                        expLi = binop(expLi, expLi[j], j);
-                        #j = j; do not increment!!
-                    else:
-                        j += 1;
-                if len(expLi) == 1: break;
-            return expLi;
-    
-        def simpleEval(expLi):                              # TODO: remove this function.
-            "Evaluates unary and binary operations."
-            return(allBinary(allUnary(expLi)));
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - 
-        
-        None;                                                #print 'incomming expLi = ', expLi, '\n';
-        expLi = setFuncCreationEnvs(expLi);
-        expLi = subNames(expLi);                             #print'leaving subNames, expLi = ', expLi, '\n';
-        expLi = subObjsAndArrs(expLi);                       #print'leaving subObjsAndArrs, expLi = ', expLi, '\n';
-        expLi = refine_invoke_and_group(expLi);              #print'leaving r_i_and_g, expLi = ', expLi, '\n';
-        expLi = simpleEval(expLi);                           #print'leaving simpleEval, expLi = ', expLi, '\n';
-        oldLen = len(expLi);                                 #print 'oldLen (first) = ', oldLen, '\n';
-        while len(expLi) != 1:
-            expLi = simpleEval(expLi);
-            newLen = len(expLi);
-            if oldLen > newLen:
-                oldLen = newLen;
-            else:
-                errStr = ' '.join(map(str, expLi));
-                raise LJErr('illegal expression' + eMsgr(expLi));
-        # having finished looping...
-        ans = expLi[0];
-        LJTypes = [bool, float, str, list, dict, Function, type(None)];
-        if not (type(ans) in LJTypes or inspect.isfunction(ans)):
-            raise LJTypeErr('illegal expression (of unknown type)');
-        return ans;    # end eval(..)                
+            newEnv.depth = depth;                           # Depth of newEnv is changed to invocation_env's depth + 1
+            if maxDepth and depth >= maxDepth:
+                raise LJRuntimeErr('maximum call depth exceeded');
+            signal = run(func.tree, newEnv, maxLoopTime, writer, True, fuel, maxDepth);    # func.tree is shared, but never mutated
+            if signal is None:
+                raise LJTypeErr('non-returning function');
+            if signal is BREAK:
+                raise LJBreak();                            # misplaced; breaks out of the caller's loop (if any)
+            if type(signal[0]) is not TailCall:
+                return signal[0];
+            func, args = signal[0].func, signal[0].args;    # The tail call replaces this one, at the same depth.
+            start = checkTailTime(start, maxLoopTime);
+    
+    def invoke(exp, env):                                    # form:        ... <Function> ( 1, "king", ... , [0] ) ...
+        "Helps perform function calls."
+        [_, funcExp, argExps] = exp;
+        func = eval(funcExp, env);
+        args = [eval(argExp, env) for argExp in argExps];
+        if type(func) is Function:
+            return invokeFunction(func, args, env);
+        elif inspect.isfunction(func):
+            return invokePyFunction(func, args, fuel, env.depth);
+        raise LJTypeErr('cannot call a non-function ... ' + lj_repr(func));
 
     # *********************************************
     def runInit(stmt, env):
         "Helps exec an init `var a = 10;` statement."
-        [_, name, expLi] = stmt;
-        #print 'pre init ', stmt, ' env = ', env.show();
-        env.init(name, eval(expLi, env));
-        #print 'post init ', stmt, ' env = ', env.show();
+        [_, name, exp] = stmt;
+        env.init(name, eval(exp, env));
     
     def runIfLadder(stmt, env):
         "Helps run through an if-ladder."
         for j in xrange(1, len(stmt), 2):
-            expLi, code = stmt[j], stmt[j+1];
-            if isTruthy(eval(expLi, env)):
-                run(code, env, maxLoopTime, writer);
-                break;
+            exp, code = stmt[j], stmt[j+1];
+            if isTruthy(eval(exp, env)):
+                return run(code, env, maxLoopTime, writer, tailCalls, fuel, maxDepth);
                         
+    def runCountedLoop(counted, env):                        # The counter is read & incremented natively (when a number),
+        "Helps run a counted loop (see countedLoop)."         #    but still read afresh each time, as a callee may assign it.
+        [[_, name], op, bound, pOrM, step, code] = counted;
+        home = env.getEnv(name);                             # (Env in which the counter lives.)
+        pyOp, pyStep = pyBinops[op], pyBinops[pOrM];
+        t1 = time.time();
+        while True:
+            x = home[name];
+            y = bound[1] if bound[0] == 'literal' else eval(bound, env);
+            if type(x) is float and type(y) is float:
+                if not pyOp(x, y): break;
+            elif isFalsy(binop(x, op, y)): break;
+            fuel.tank -= 2;                                 # for the iteration, and the increment
+            if fuel.tank < 0: fuel.refill();
+            try: signal = run(code, env, maxLoopTime, writer, False, fuel, maxDepth);
+            except LJBreak: break;                          # a callee's misplaced break
+            if signal is not None:
+                if signal is BREAK: break;
+                return signal;
+            x = home[name];
+            home[name] = pyStep(x, step) if type(x) is float else binop(x, pOrM, step);
+            if maxLoopTime and time.time() - t1 > maxLoopTime:
+                raise LJRuntimeErr('looping for to long');
+
     def runWhile(stmt, env):
         "Helps run a while loop."
-        [_, expLi, code] = stmt;
-        #print 'while cond = ', expLi, ' & env = ', env.show();
+        counted = countedLoop(stmt);
+        if counted and counted[0][0] == 'name':
+            return runCountedLoop(counted, env);
+        [_, exp, code] = stmt;
         t1 = time.time();
-        while isTruthy(eval(expLi[:], env)):                # expLi[:] is eqvt. to cloneLi(expLi) as expLi is flat (non-nested).
-            try: run(cloneLi(code), env, maxLoopTime, writer);        # Cloning shields while's code-block from mutation
-            except LJBreak: break;
+        while isTruthy(eval(exp, env)):
+            fuel.tank -= 1;
+            if fuel.tank < 0: fuel.refill();
+            try: signal = run(code, env, maxLoopTime, writer, False, fuel, maxDepth);
+            except LJBreak: break;                          # a callee's misplaced break
+            if signal is not None:
+                if signal is BREAK: break;
+                return signal;
             if maxLoopTime and time.time() - t1 > maxLoopTime:
                 raise LJRuntimeErr('looping for to long');
     
-    def runReturn(stmt, env):
-        "Emulates return statement."
-        [_, expLi] = stmt;
-        #tmp = eval(expLi, env);
-        #print ('runReturn... returning ...' + str(tmp));
-        raise LJReturn(eval(expLi, env));    
-    
     def runNameAssign(stmt, env):
         "Helps runAssign(..) in executing simple assignments."
-        #print 'nameAssign, ', stmt;
-        [_, [name], rExpLi] = stmt;
-        env.assign(name, eval(rExpLi, env));
-    
-    def runObjArrAssign(stmt, env):
-        "Helps runAssign(..) w/ assignments to object keys."
-        [_, lExpLi, rExpLi] = stmt
-        rhsExp = eval(rExpLi, env);
-        ls = gmob(lExpLi, -1);         # Last Square Bracket  # form of lExpLi:     a [ "foo" ]  [  1  ] ..  [      0       ] 
-        part1 = lExpLi[ : ls];                                # indices:            0                        ls            -1
-        part2 = lExpLi[ls + 1 : -1]                           # parts:              <--------part1--------->   <---part2--->
-        objarr = eval(part1, env);    # obj or arr
-        innexp = eval(part2, env);    # inner exp
-        if [type(objarr), type(innexp)] == [dict, str]:
-            objarr[innexp] = rhsExp;
-        elif [type(objarr), type(innexp)] == [list, float]:
-            eval(lExpLi, env);        # checks range and roundness
-            objarr[int(innexp)] = rhsExp;
-        else:    # Note: strings are immutable
-            raise LJTypeErr('illegal LHS in assignment' + eMsgr(stmt));
+        [_, [_, name], rExp] = stmt;
+        env.assign(name, eval(rExp, env));
+    
+    def runObjArrAssign(stmt, env):                          # form of lExp:     a [ "foo" ] [ 1 ] .. [ 0 ]
+        "Helps runAssign(..) w/ assignments to object keys."  #                  <-------objExp----->   keyExp
+        [_, [_, objExp, keyExp], rExp] = stmt;
+        rhsVal = eval(rExp, env);
+        objarr = eval(objExp, env);    # obj or arr
+        innexp = eval(keyExp, env);    # inner exp
+        assignRefinement(objarr, innexp, rhsVal, fuel);
     
     def runAssign(stmt, env):
         "Helps exec variable assignment."
-        [_, lExpLi, _] = stmt;
-        #print 'pre runAssign, ', stmt, ' env = ', env.show();
-        if len(lExpLi) == 1:
+        [_, lExp, _] = stmt;
+        if lExp[0] == 'name':
             runNameAssign(stmt, env);
         else:
             runObjArrAssign(stmt, env);
-        #print 'pre runAssign, ', stmt, ' env = ', env.show();
     
     def runExpStmt(stmt, env):
         'Helps eval exp-stmts like `writeln("Hi!");`'
-        [_, expLi] = stmt;
-        ans = eval(expLi, env);
+        [_, exp] = stmt;
+        ans = eval(exp, env);
         if writer and ans != None and env.isGlobal:
             writer(lj_repr(ans) + '\n');
         return ans;
     
     # -------------------------------------------------------
 
-    for stmt in tree:
-        #print 'tree-stmt = ', stmt;
+    for stmt in tree:                                        # Returns a completion signal (see LJJump).
+        fuel.tank -= 1;
+        if fuel.tank < 0: fuel.refill();
         if stmt[0] == 'init':
             runInit(stmt, env);
         elif stmt[0] == 'if-ladder':
-            runIfLadder(stmt, env);
+            signal = runIfLadder(stmt, env);
+            if signal is not None: return signal;
         elif stmt[0] == 'while':
-            runWhile(stmt, env);
+            signal = runWhile(stmt, env);
+            if signal is not None: return signal;
         elif stmt[0] == 'return':
-            runReturn(stmt, env);
+            if tailCalls and stmt[1][0] == 'call':
+                [_, funcExp, argExps] = stmt[1];
+                func = eval(funcExp, env);
+                args = [eval(argExp, env) for argExp in argExps];
+                if type(func) is Function:
+                    return (TailCall(func, args),);
+                elif inspect.isfunction(func):                # Natives (and non-functions) needn't be deferred.
+                    return (invokePyFunction(func, args, fuel, env.depth),);
+                raise LJTypeErr('cannot call a non-function ... ' + lj_repr(func));
+            return (eval(stmt[1], env),);
         elif stmt[0] == 'break':
-            raise LJBreak();                            # too simple for a function
+            return BREAK;
         elif stmt[0] == 'assign':
             runAssign(stmt, env);
         elif stmt[0] == 'exp-stmt':
             runExpStmt(stmt, env);
 
+#############################################################
+#                    OPTIMIZATION                           #
+#############################################################
+                                                              # optimize() simplifies a parse tree, once, before it is run or compiled:
+def foldExp(exp):                                             #    1. Operators whose operands are all literals are evaluated, e.g.
+    "Returns a copy of exp, with constants folded."           #       `60 * 60` --> 3600 and `!true` --> false. Ill-typed ones, like
+    tag = exp[0];                                             #       `-'a'`, are left as they are, to raise only if (and when) run.
+    if tag == 'binop':                                        #    2. if-ladder arms with literal conditions are pruned, or made the
+        [_, op, a, b] = exp;                                  #       last arm. (A pure else's condition is `['literal', True]`.)
+        a, b = foldExp(a), foldExp(b);                        #       `while (false)` loops are dropped.
+        if a[0] == 'literal' and (op is sym('&&') or op is sym('||')):
+            return b if isTruthy(a[1]) is (op is sym('&&')) else a;
+        if a[0] == 'literal' and b[0] == 'literal':           #    3. Statements after `return` or `break` are dropped.
+            try: return ['literal', binop(a[1], op, b[1])];   # Literals are never arrays or objects (which are made afresh each
+            except Exception: pass;                           #    time), so folding never changes identities.
+        return ['binop', op, a, b];
+    elif tag == 'unop':
+        a = foldExp(exp[2]);
+        if a[0] == 'literal':
+            try: return ['literal', unop(exp[1], a[1])];
+            except Exception: pass;
+        return ['unop', exp[1], a];
+    elif tag == 'refine':
+        return ['refine', foldExp(exp[1]), foldExp(exp[2])];
+    elif tag == 'call':
+        return ['call', foldExp(exp[1]), map(foldExp, exp[2])];
+    elif tag == 'array':
+        return ['array', map(foldExp, exp[1])];
+    elif tag == 'object':
+        return ['object', [[key, foldExp(valExp)] for key, valExp in exp[1]]];
+    elif tag == 'function':
+        template = exp[1];
+        return ['function', Function(template.params, optimize(template.tree), template.iTokens)];
+    return exp;                                               # 'name' & 'literal'
+
+def optimizeIfLadder(stmt):
+    "Returns the live arms of an if-ladder, as a list."
+    arms = [];
+    for j in xrange(1, len(stmt), 2):
+        cond = foldExp(stmt[j]);
+        if cond[0] == 'literal' and isFalsy(cond[1]): continue;
+        arms.extend([cond, optimize(stmt[j+1])]);
+        if cond[0] == 'literal': break;                       # later arms are unreachable
+    return arms;
+
+def optimize(tree):
+    "Returns a simplified copy of a parse tree."
+    out = [];
+    for stmt in tree:
+        tag = stmt[0];
+        if tag == 'if-ladder':
+            arms = optimizeIfLadder(stmt);
+            if arms and arms[0][0] == 'literal':
+                out.extend(arms[1]);                          # Blocks don't have their own scope, so `if (true) { .. }` is `..`.
+            elif arms:
+                out.append(['if-ladder'] + arms);
+        elif tag == 'while':
+            cond = foldExp(stmt[1]);
+            if cond[0] == 'literal' and isFalsy(cond[1]): continue;
+            out.append(['while', cond, optimize(stmt[2])]);
+        elif tag == 'init':
+            out.append(['init', stmt[1], foldExp(stmt[2])]);
+        elif tag == 'assign':
+            out.append(['assign', foldExp(stmt[1]), foldExp(stmt[2])]);
+        elif tag in ['return', 'exp-stmt']:
+            out.append([tag, foldExp(stmt[1])]);
+        else:
+            out.append(stmt);
+        if out and out[-1][0] in ['return', 'break']:
+            break;                                            # The rest of the block is unreachable.
+    return out;
+
+#############################################################
+#                    RESOLUTION                             #
+#############################################################
+                                                              # Before compilation, resolve() maps each variable of a function to a
+class Frame(object):                                          #    (depth, slot) pair: `depth` Frames up the chain of creation, at
+    "Holds the variables of a function call, in slots."       #    index `slot` in that Frame's `vals`. Each call of a compiled
+    __slots__ = ['vals', 'parent', 'env', 'depth'];           #    Function gets a Frame, whose `vals` hold params, then vars.
+    isGlobal = False;                                         # Names not declared in any enclosing function are looked up (by name)
+    def __init__(self, vals, parent, depth):                  #    in frame.env, the nearest Env up the chain, just like run().
+        self.vals = vals;                                     # Code outside functions is left as is; its Env is a dict anyway.
+        self.parent = parent;                                 # Resolved nodes (in addition to those built by yacc):
+        self.env = parent.env if type(parent) is Frame else parent;
+        self.depth = depth;                                   #     ['local', depth, slot, Name]      ['global', Name]
+                                                              #     ['declare', slot, Name, exp]      (slot is None if already defined)
+UNSET = object();    # value of vars not yet initialized      #     ['function', template, resolvedBody, nVars]
+                                                              #     ['tail-call', callExp]            (see markTailCalls)
+
+class FrozenVals(list):
+    "The `vals` of a Frame of a Base."
+    def __setitem__(self, slot, value):
+        raise LJTypeErr('cannot change frozen variable');
+
+class Scope(object):
+    "Compile-time view of a function's params and vars."
+    def __init__(self, params, tree, parent):
+        self.parent = parent;
+        self.slots = {};
+        for slot, name in enumerate(params):
+            self.slots[name] = slot;
+        self.visible = dict(self.slots);                      # names declared so far; `var b = a, a = 1;` must not see the local a
+        self.nVars = 0;
+        for stmt in tree:                                     # a function's var statement comes first
+            if stmt[0] != 'init': break;
+            if stmt[1] not in self.slots:
+                self.slots[stmt[1]] = len(params) + self.nVars;
+                self.nVars += 1;
+
+def resolveName(name, scope, free):
+    "Returns the node for reading (or writing) a variable."
+    if scope is None:
+        free.add(name);
+        return ['name', name];
+    depth, table = 0, scope.visible;                          # Nested functions run later, and see all of an outer scope's names.
+    while scope is not None:
+        if name in table:
+            return ['local', depth, table[name], name];
+        scope = scope.parent;
+        depth += 1;
+        if scope is not None: table = scope.slots;
+    free.add(name);
+    return ['global', name];
+
+def resolveFunction(params, tree, parent, free):
+    "Resolves a function body; returns it with its no. of vars."
+    scope = Scope(params, tree, parent);
+    body = resolveBlock(tree, scope, free);
+    markTailCalls(body);                                    # (body is a fresh copy, so it may be marked in place.)
+    return body, scope.nVars;
+
+def resolveExp(exp, scope, free):
+    "Returns a copy of exp, with its names resolved in scope."
+    tag = exp[0];
+    r = lambda e: resolveExp(e, scope, free);
+    if tag == 'name':
+        return resolveName(exp[1], scope, free);
+    elif tag == 'literal':
+        return exp;
+    elif tag == 'binop':
+        return ['binop', exp[1], r(exp[2]), r(exp[3])];
+    elif tag == 'refine':
+        return ['refine', r(exp[1]), r(exp[2])];
+    elif tag == 'call':
+        return ['call', r(exp[1]), map(r, exp[2])];
+    elif tag == 'unop':
+        return ['unop', exp[1], r(exp[2])];
+    elif tag == 'array':
+        return ['array', map(r, exp[1])];
+    elif tag == 'object':
+        return ['object', [[key, r(valExp)] for key, valExp in exp[1]]];
+    elif tag == 'function':
+        template = exp[1];
+        body, nVars = resolveFunction(template.params, template.tree, scope, free);
+        return ['function', template, body, nVars];
+    raise Exception('unknown node ' + tag);               # internal error
+
+def resolveStmt(stmt, scope, free):
+    "Returns a copy of stmt, with its names resolved in scope."
+    tag = stmt[0];
+    r = lambda e: resolveExp(e, scope, free);
+    if tag == 'init':
+        [_, name, exp] = stmt;
+        val = r(exp);                                         # resolved before `name` becomes visible
+        if scope is None:
+            return ['init', name, val];
+        if name in scope.visible:                             # `var a = 1, a = 2;` fails when run, like Env.init()
+            return ['declare', None, name, val];
+        scope.visible[name] = scope.slots[name];
+        return ['declare', scope.slots[name], name, val];
+    elif tag == 'assign':
+        [_, lExp, rExp] = stmt;
+        if lExp[0] == 'name':
+            return ['assign', resolveName(lExp[1], scope, free), r(rExp)];
+        return ['assign', ['refine', r(lExp[1]), r(lExp[2])], r(rExp)];
+    elif tag == 'if-ladder':
+        out = ['if-ladder'];
+        for j in xrange(1, len(stmt), 2):
+            out.extend([r(stmt[j]), resolveBlock(stmt[j+1], scope, free)]);
+        return out;
+    elif tag == 'while':
+        return ['while', r(stmt[1]), resolveBlock(stmt[2], scope, free)];
+    elif tag in ['return', 'exp-stmt']:
+        return [tag, r(stmt[1])];
+    elif tag == 'break':
+        return stmt;
+    raise Exception('unknown statement ' + tag);            # internal error
+
+def resolveBlock(tree, scope, free):
+    "Resolves a list of statements."
+    return [resolveStmt(stmt, scope, free) for stmt in tree];
+
+def markTailCalls(tree):
+    "Marks `return f(..);` statements in tail position."     # i.e. in a function body, outside loops (see TailCall)
+    for j, stmt in enumerate(tree):
+        if stmt[0] == 'return' and stmt[1][0] == 'call':
+            tree[j] = ['tail-call', stmt[1]];
+        elif stmt[0] == 'if-ladder':
+            for k in xrange(2, len(stmt), 2):
+                markTailCalls(stmt[k]);
+
+def resolve(tree):
+    "Resolves a program; returns it with its free names."
+    free = set();
+    return resolveBlock(tree, None, free), free;
+
+#############################################################
+#                    COMPILATION                            #
+#############################################################
+                                                              # compileTree() turns a (resolved) parse tree into nested Python closures,
+class Context(object):                                        #    once. Each closure has the signature f(env, ctx), where env is an
+    "Holds per-run settings read by compiled code."           #    Env outside functions, and a Frame inside them. Expression closures
+    def __init__(self, maxLoopTime=None, writer=None, maxDepth=None, fuel=None):
+        self.maxLoopTime = maxLoopTime;                       #    return a value; statement closures return a completion signal
+        self.writer = writer;                                 #    (see LJJump), exactly like run().
+        self.maxDepth = maxDepth;                             # Compiled code never mutates the tree, so a compiled program may
+        self.fuel = fuel if fuel is not None else Fuel();     #    be run any number of times, in any environment.
+
+pyBinops = {                                                  # fast paths, used when both operands are numbers
+    sym('*'): operator.mul, sym('/'): operator.truediv,
+    sym('%'): operator.mod, sym('-'): operator.sub,
+    sym('+'): operator.add, sym('>='): operator.ge,
+    sym('<='): operator.le, sym('>'): operator.gt,
+    sym('<'): operator.lt#,
+};
+
+def compileBinop(exp):
+    "Compiles a 'binop' node."
+    [_, op, a, b] = exp;
+    fa, fb = compileExp(a), compileExp(b);
+    if op is sym('&&'):                                     # The right operand is evaluated only if needed.
+        def andand(env, ctx):
+            x = fa(env, ctx);
+            return fb(env, ctx) if isTruthy(x) else x;
+        return andand;
+    elif op is sym('||'):
+        def oror(env, ctx):
+            x = fa(env, ctx);
+            return x if isTruthy(x) else fb(env, ctx);
+        return oror;
+    if op in pyBinops:
+        pyOp = pyBinops[op];
+        def numBinop(env, ctx):
+            x = fa(env, ctx); y = fb(env, ctx);
+            if type(x) is float and type(y) is float:
+                return pyOp(x, y);
+            return binop(x, op, y, ctx.fuel);
+        return numBinop;
+    return lambda env, ctx: binop(fa(env, ctx), op, fb(env, ctx), ctx.fuel);
+
+def callFunction(func, args, env, ctx, depth=None):
+    "Invokes a non-native Function via its compiled body."
+    start = None;
+    if depth is None: depth = env.depth + 1;                # env is the caller's Env or Frame
+    while True:
+        if len(args) != len(func.params):
+            raise LJTypeErr('incorrect no. of arguments ... (%s)' % lj_repr(args)[1:-1]);
+        if func.crEnv is None: raise Exception();           # internal error
+        if ctx.maxDepth and depth >= ctx.maxDepth:
+            raise LJRuntimeErr('maximum call depth exceeded');
+        ctx.fuel.tank -= 1;
+        if ctx.fuel.tank < 0: ctx.fuel.refill();
+        body = func.body or compileFunction(func);          # Functions created by run() have no body, and are compiled lazily.
+        val = body(func.crEnv, args, depth, ctx);           # A function is executed in its environ of creation
+        if type(val) is not TailCall:
+            return val;
+        func, args = val.func, val.args;                    # The tail call replaces this one, at the same depth.
+        start = checkTailTime(start, ctx.maxLoopTime);
+
+def checkTailTime(start, maxLoopTime):
+    "Limits a chain of tail calls, like a loop, in time."   # start is the time of the chain's first tail call (or None).
+    if not maxLoopTime:
+        return None;
+    if start is None:
+        return time.time();
+    if time.time() - start > maxLoopTime:
+        raise LJRuntimeErr('looping for to long');
+    return start;
+
+def tailCall(func, args, env, ctx):
+    "Defers a call to a Function, in tail position."
+    if type(func) is Function:
+        return TailCall(func, args);
+    return callValue(func, args, env, ctx);                 # Natives (and non-functions) needn't be deferred.
+
+def callValue(func, args, env, ctx):
+    "Invokes a Function or a native function with args."
+    if type(func) is Function:
+        return callFunction(func, args, env, ctx);
+    elif inspect.isfunction(func):
+        return invokePyFunction(func, args, ctx.fuel, env.depth);
+    raise LJTypeErr('cannot call a non-function ... ' + lj_repr(func));
+
+def compileCall(exp):
+    "Compiles a 'call' node."
+    [_, funcExp, argExps] = exp;
+    fFunc = compileExp(funcExp);
+    fArgs = map(compileExp, argExps);
+    def call(env, ctx):
+        func = fFunc(env, ctx);
+        args = [f(env, ctx) for f in fArgs];
+        if type(func) is Function:
+            return callFunction(func, args, env, ctx);
+        elif inspect.isfunction(func):
+            return invokePyFunction(func, args, ctx.fuel, env.depth);
+        raise LJTypeErr('cannot call a non-function ... ' + lj_repr(func));
+    return call;
+
+def compileObject(exp):
+    "Compiles an 'object' node."
+    keys = [key for key, _ in exp[1]];
+    fVals = [compileExp(valExp) for _, valExp in exp[1]];
+    pairs = zip(keys, fVals);
+    size = valueBytes(dict, len(pairs));
+    def makeObject(env, ctx):
+        fuel = ctx.fuel;
+        fuel.room -= size;
+        if fuel.room < 0: fuel.grow();
+        obj = {};
+        for key, f in pairs:
+            obj[key] = f(env, ctx);
+        return obj;
+    return makeObject;
+
+def compileArray(exp):
+    "Compiles an 'array' node."
+    fElts = map(compileExp, exp[1]);
+    size = valueBytes(list, len(fElts));
+    def makeArray(env, ctx):
+        fuel = ctx.fuel;
+        fuel.room -= size;
+        if fuel.room < 0: fuel.grow();
+        return [f(env, ctx) for f in fElts];
+    return makeArray;
+
+def compileBody(tree, nVars):
+    "Compiles a resolved function body."                    # body(crEnv, args, depth, ctx) runs the function in a new Frame,
+    code = compileBlock(tree);                              #    and returns its value.
+    pad = [UNSET] * nVars;
+    def body(crEnv, args, depth, ctx):
+        signal = code(Frame(args + pad, crEnv, depth), ctx);
+        if signal is None:
+            raise LJTypeErr('non-returning function');
+        if signal is BREAK:
+            raise LJBreak();                                # misplaced; breaks out of the caller's loop (if any)
+        return signal[0];
+    return body;
+
+def compileFunction(func):
+    "Compiles (and caches) the body of a Function."         # Used for Functions created by run(). Their crEnv is an Env, so
+    if func.body is not None:                               #    names outside the function itself are looked up dynamically.
+        return func.body;                                   # Each engine's form is cached apart from the others' (& from body),
+    owner = func.template or func;                          #    as such Functions may be shared by Runtimes of any engine, via
+    if owner.compiled is None:                              #    a Base. It's cached on the template, as the tree engine makes a
+        tree, nVars = resolveFunction(func.params, func.tree, None, set());
+        owner.compiled = compileBody(tree, nVars);          #    fresh Function each time a literal is evaluated. (Threads that
+    return owner.compiled;                                  #    race to compile a Function just make the same body twice.)
+
+def compileFunctionLiteral(exp):
+    "Compiles a resolved 'function' node."                  # The Function in the tree is a template. Each evaluation of the
+    [_, template, tree, nVars] = exp;                       #    literal creates a fresh Function sharing the compiled body,
+    body = compileBody(tree, nVars);                        #    paired with its own creation Env or Frame.
+    return lambda env, ctx: makeFunction(template, body, env);
+
+def compileLocal(exp):
+    "Compiles a resolved 'local' node."
+    [_, depth, slot, name] = exp;
+    if depth == 0:                                          # Own vars are always initialized before use.
+        return lambda env, ctx: env.vals[slot];
+    def outer(env, ctx):
+        for _ in xrange(depth): env = env.parent;
+        val = env.vals[slot];
+        if val is UNSET:                                    # form:        var f = function () { return a; }, b = f(), a = 1;
+            raise LJReferenceErr('%s is not defined' % name);
+        return val;
+    return outer;
+
+def compileExp(exp):
+    "Compiles an expression node into a closure."
+    tag = exp[0];
+    if tag == 'literal':
+        val = exp[1];
+        return lambda env, ctx: val;
+    elif tag == 'local':
+        return compileLocal(exp);
+    elif tag == 'global':
+        name = exp[1];
+        return lambda env, ctx: env.env.lookup(name);
+    elif tag == 'name':
+        name = exp[1];
+        return lambda env, ctx: env.lookup(name);
+    elif tag == 'binop':
+        return compileBinop(exp);
+    elif tag == 'refine':
+        fObj, fKey = compileExp(exp[1]), compileExp(exp[2]);
+        return lambda env, ctx: refine(fObj(env, ctx), fKey(env, ctx));
+    elif tag == 'call':
+        return compileCall(exp);
+    elif tag == 'unop':
+        op, fVal = exp[1], compileExp(exp[2]);
+        return lambda env, ctx: unop(op, fVal(env, ctx));
+    elif tag == 'array':
+        return compileArray(exp);
+    elif tag == 'object':
+        return compileObject(exp);
+    elif tag == 'function':
+        return compileFunctionLiteral(exp);
+    raise Exception('unknown node ' + tag);               # internal error
+
+#############################################################
+
+def compileInit(stmt):
+    "Compiles an init `var a = 10;` statement."
+    [_, name, exp] = stmt;
+    fVal = compileExp(exp);
+    return lambda env, ctx: env.init(name, fVal(env, ctx));
+
+def compileDeclare(stmt):
+    "Compiles a var, inside a function."
+    [_, slot, name, exp] = stmt;
+    fVal = compileExp(exp);
+    def declare(env, ctx):
+        val = fVal(env, ctx);
+        if slot is None:
+            raise LJReferenceErr('%s is already defined' % name);
+        env.vals[slot] = val;
+    return declare;
+
+def compileIfLadder(stmt):
+    "Compiles an if-ladder."
+    arms = [];
+    for j in xrange(1, len(stmt), 2):
+        arms.append((compileExp(stmt[j]), compileBlock(stmt[j+1])));
+    def ifLadder(env, ctx):
+        for fCond, fCode in arms:
+            if isTruthy(fCond(env, ctx)):
+                return fCode(env, ctx);
+    return ifLadder;
+
+def compileCountedLoop(counted):                            # Like runCountedLoop(), the counter is kept in its own slot (or
+    "Compiles a counted loop (see countedLoop)."            #    Env), and is read afresh each time, as a callee may assign it.
+    [var, op, bound, pOrM, step, code] = counted;
+    fCode = compileBlock(code, entry=2);                    # Each iteration burns fuel for itself, and the increment.
+    fBound = compileExp(bound);
+    pyOp, pyStep = pyBinops[op], pyBinops[pOrM];
+    if var[0] == 'local':
+        [_, depth, slot, _] = var;
+    def loop(env, ctx):
+        maxLoopTime = ctx.maxLoopTime;
+        if var[0] == 'local':
+            home, key = env, slot;
+            for _ in xrange(depth): home = home.parent;
+            home = home.vals;
+            if depth and home[key] is UNSET:
+                raise LJReferenceErr('%s is not defined' % var[3]);
+        else:
+            home, key = (env if var[0] == 'name' else env.env).getEnv(var[1]), var[1];
+        t1 = time.time();
+        while True:
+            x = home[key]; y = fBound(env, ctx);
+            if type(x) is float and type(y) is float:
+                if not pyOp(x, y): break;
+            elif isFalsy(binop(x, op, y)): break;
+            try: signal = fCode(env, ctx);
+            except LJBreak: break;                          # a callee's misplaced break
+            if signal is not None:
+                if signal is BREAK: break;
+                return signal;
+            x = home[key];
+            home[key] = pyStep(x, step) if type(x) is float else binop(x, pOrM, step);
+            if maxLoopTime and time.time() - t1 > maxLoopTime:
+                raise LJRuntimeErr('looping for to long');
+    return loop;
+
+def compileWhile(stmt):
+    "Compiles a while loop."
+    counted = countedLoop(stmt);
+    if counted:
+        return compileCountedLoop(counted);
+    [_, exp, code] = stmt;
+    fCond, fCode = compileExp(exp), compileBlock(code, entry=1);    # (Each iteration burns fuel.)
+    def loop(env, ctx):
+        maxLoopTime = ctx.maxLoopTime;
+        t1 = time.time();
+        while isTruthy(fCond(env, ctx)):
+            try: signal = fCode(env, ctx);
+            except LJBreak: break;                          # a callee's misplaced break
+            if signal is not None:
+                if signal is BREAK: break;
+                return signal;
+            if maxLoopTime and time.time() - t1 > maxLoopTime:
+                raise LJRuntimeErr('looping for to long');
+    return loop;
+
+def compileReturn(stmt):
+    "Compiles a return statement."
+    fVal = compileExp(stmt[1]);
+    return lambda env, ctx: (fVal(env, ctx),);
+
+def compileTailCall(stmt):
+    "Compiles `return f(..);` in tail position."
+    [_, [_, funcExp, argExps]] = stmt;
+    fFunc = compileExp(funcExp);
+    fArgs = map(compileExp, argExps);
+    def tail(env, ctx):
+        func = fFunc(env, ctx);
+        return (tailCall(func, [f(env, ctx) for f in fArgs], env, ctx),);
+    return tail;
+
+def compileBreak(stmt):
+    "Compiles a break statement."
+    return lambda env, ctx: BREAK;
+
+def compileAssign(stmt):
+    "Compiles an assignment."
+    [_, lExp, rExp] = stmt;
+    fVal = compileExp(rExp);
+    if lExp[0] == 'name':
+        name = lExp[1];
+        return lambda env, ctx: env.assign(name, fVal(env, ctx));
+    elif lExp[0] == 'global':
+        name = lExp[1];
+        return lambda env, ctx: env.env.assign(name, fVal(env, ctx));
+    elif lExp[0] == 'local':
+        [_, depth, slot, _] = lExp;
+        def localAssign(env, ctx):
+            val = fVal(env, ctx);
+            for _ in xrange(depth): env = env.parent;
+            env.vals[slot] = val;
+        return localAssign;
+    # otherwise...                                          # form of lExp:     a [ "foo" ] [ 1 ] .. [ 0 ]
+    fObj, fKey = compileExp(lExp[1]), compileExp(lExp[2]);  #                  <-------objExp----->   keyExp
+    def objArrAssign(env, ctx):
+        rhsVal = fVal(env, ctx);
+        assignRefinement(fObj(env, ctx), fKey(env, ctx), rhsVal, ctx.fuel);
+    return objArrAssign;
+
+def compileExpStmt(stmt):
+    "Compiles an exp-stmt like `print('Hi!');`"
+    fVal = compileExp(stmt[1]);
+    def expStmt(env, ctx):
+        ans = fVal(env, ctx);
+        if ctx.writer and ans != None and env.isGlobal:
+            ctx.writer(lj_repr(ans) + '\n');
+    return expStmt;
+
+stmtCompilers = {
+    'init': compileInit, 'declare': compileDeclare,
+    'if-ladder': compileIfLadder,
+    'while': compileWhile, 'return': compileReturn,
+    'tail-call': compileTailCall,
+    'break': compileBreak, 'assign': compileAssign,
+    'exp-stmt': compileExpStmt#,
+};
+
+def compileBlock(tree, entry=0):
+    "Compiles a list of statements into a single closure."  # Fuel is burnt once per run of statements (see fuelRuns).
+    runs = [(n, [stmtCompilers[stmt[0]](stmt) for stmt in stmts]) for stmts, n in fuelRuns(tree, entry)];
+    if len(runs) == 1 and len(runs[0][1]) <= 1:
+        [n, stmts] = runs[0];
+        f = stmts[0] if stmts else lambda env, ctx: None;
+        def stmt(env, ctx):
+            fuel = ctx.fuel;
+            fuel.tank -= n;
+            if fuel.tank < 0: fuel.refill();
+            return f(env, ctx);
+        return stmt;
+    def block(env, ctx):
+        fuel = ctx.fuel;
+        for n, stmts in runs:
+            fuel.tank -= n;
+            if fuel.tank < 0: fuel.refill();
+            for f in stmts:
+                signal = f(env, ctx);
+                if signal is not None: return signal;
+    return block;
+
+class Resolved(object):
+    "Base class for programs compiled from a resolved tree."
+    def __init__(self, tree):
+        self.tree = tree;
+        self.resolved, self.freeNames = resolve(tree);
+    def missingNames(self, env):
+        "Lists names that would be undefined, if run in env."  # Reports (most) ReferenceErrors before running. Names declared
+        declared = [stmt[1] for stmt in self.tree if stmt[0] == 'init'];
+        missing = [];                                       #    by the program itself, or by `env`, are never missing.
+        for name in sorted(self.freeNames):
+            if name in declared: continue;
+            try: env.getEnv(name);
+            except LJReferenceErr: missing.append(name);
+        return missing;
+
+class Compiled(Resolved):
+    "A parse tree, compiled (once) into nested closures."
+    def __init__(self, tree):
+        Resolved.__init__(self, tree);
+        self.code = compileBlock(self.resolved);
+    def __reduce__(self):                                   # Closures can't be pickled, but recompiling is cheap.
+        return (compileTree, (self.tree,));
+    def run(self, env, maxLoopTime=None, writer=None, fuel=None):
+        "Executes the compiled code in an environment `env`."
+        checkCompletion(self.code(env, Context(maxLoopTime, writer, env.maxDepth, fuel)));
+
+def compileTree(tree):
+    "Compiles a parse tree for repeated, fast execution."
+    return Compiled(tree);
+
+#############################################################
+#                    TRANSPILATION                          #
+#############################################################
+                                                              # transpile() translates a parse tree into Python source, which is then
+pyInfixOps = {                                                #    run through Python's own compile(). LittleJ semantics are kept by:
+    sym('*'): '*', sym('/'): '/', sym('%'): '%',              #    - using Python's operators only when both operands are numbers,
+    sym('-'): '-', sym('+'): '+', sym('>='): '>=',            #        and falling back to binop(), unop() etc. otherwise;
+    sym('<='): '<=', sym('>'): '>', sym('<'): '<'#,           #    - testing truthiness via isTruthy() (unless a value is a boolean);
+};                                                            #    - keeping variables in Envs and Frames, like compileTree().
+floatOps = map(sym, '* / % -'.split());                       # Each expression is flattened into simple statements, which store
+boolOps = map(sym, '>= <= > < === !=='.split());              #    intermediate results in temporaries (t1, t2 ...). An expression's
+                                                              #    result is an `atom`: a temporary or a Python literal.
+transpilerGlobals = {
+    'binop': binop, 'unop': unop, 'refine': refine, 'eqeqeq': eqeqeq,
+    'isTruthy': isTruthy, 'isFalsy': isFalsy, 'callValue': callValue,
+    'makeFunction': makeFunction, 'assignRefinement': assignRefinement,
+    'lj_repr': lj_repr, 'sym': sym, 'time': time,
+    'Frame': Frame, 'UNSET': UNSET, 'LJReferenceErr': LJReferenceErr,
+    'LJTypeErr': LJTypeErr, 'LJRuntimeErr': LJRuntimeErr,
+    'LJReturn': LJReturn, 'LJBreak': LJBreak, 'tailCall': tailCall#,
+};
+
+def pyLiteral(val):
+    "Returns Python source for a literal value."
+    if type(val) is float and (val != val or val in [float('inf'), float('-inf')]):
+        return "float('%s')" % val;
+    return repr(val);
+
+def indent(lines):
+    "Indents lines of Python source by one level."
+    return ['    ' + line for line in lines];
+
+def transpileSource(tree):
+    "Translates a resolved parse tree into Python source."
+    defs = [];           # Python source of all function bodies
+    templates = {};      # template name --> Function
+    kinds = {};          # atom --> 'float' or 'bool' (when known)
+    uses = [];           # per function being emitted: outer depths & 'genv' used
+    counter = [0];
+    
+    def newName(prefix):
+        counter[0] += 1;
+        return prefix + str(counter[0]);
+    
+    def emitCond(exp, out):
+        "Emits exp, and returns a Python boolean expression."
+        x = emitExp(exp, out);
+        if kinds.get(x) == 'bool': return x;
+        return 'isTruthy(%s)' % x;
+    
+    def emitShortCircuit(exp, out):                       # form:    t3 = t1
+        [_, op, a, b] = exp;                              #          if isTruthy(t3):            (if not ..., for ||)
+        x = emitExp(a, out);                              #              <statements computing t2>
+        t, inner = newName('t'), [];                      #              t3 = t2
+        y = emitExp(b, inner);
+        test = x if kinds.get(x) == 'bool' else 'isTruthy(%s)' % x;
+        if op is sym('||'): test = 'not ' + test;
+        out.extend(['%s = %s' % (t, x), 'if %s:' % test] + indent(inner + ['%s = %s' % (t, y)]));
+        if kinds.get(x) == kinds.get(y) == 'bool': kinds[t] = 'bool';
+        return t;
+    
+    def emitBinop(exp, out):                              # form:    t3 = t1 < t2                if both are known to be numbers
+        [_, op, a, b] = exp;                              #          if type(t1) is float ...    otherwise
+        if op is sym('&&') or op is sym('||'):
+            return emitShortCircuit(exp, out);
+        x, y = emitExp(a, out), emitExp(b, out);
+        t = newName('t');
+        if op in pyInfixOps:
+            fast = '%s = %s %s %s' % (t, x, pyInfixOps[op], y);
+            slow = '%s = binop(%s, sym(%r), %s, fuel)' % (t, x, str(op), y);
+            checks = ['type(%s) is float' % v for v in [x, y] if kinds.get(v) != 'float'];
+            if checks:
+                out.extend(['if %s:' % ' and '.join(checks), '    ' + fast, 'else:', '    ' + slow]);
+            else:
+                out.append(fast);
+        elif op is sym('==='):
+            out.append('%s = eqeqeq(%s, %s)' % (t, x, y));
+        elif op is sym('!=='):
+            out.append('%s = not eqeqeq(%s, %s)' % (t, x, y));
+        else:
+            out.append('%s = binop(%s, sym(%r), %s, fuel)' % (t, x, str(op), y));
+        if op in floatOps: kinds[t] = 'float';
+        elif op in boolOps: kinds[t] = 'bool';
+        return t;
+    
+    def emitUnop(exp, out):
+        [_, op, a] = exp;
+        x = emitExp(a, out);
+        t = newName('t');
+        if op is sym('!'):
+            if kinds.get(x) == 'bool': out.append('%s = not %s' % (t, x));
+            else: out.append('%s = isFalsy(%s)' % (t, x));
+            kinds[t] = 'bool';
+            return t;
+        if op is sym('-') and kinds.get(x) == 'float':
+            out.append('%s = -%s' % (t, x));
+        elif op is sym('-'):
+            out.extend(['if type(%s) is float:' % x, '    %s = -%s' % (t, x),
+                        'else:', '    %s = unop(sym(%r), %s)' % (t, str(op), x)]);
+        else:
+            out.append('%s = unop(sym(%r), %s)' % (t, str(op), x));
+        kinds[t] = 'float';
+        return t;
+    
+    def emitFunctionLiteral(exp, out):                    # form:    def f2(crEnv, args, depth, ctx):
+        [_, template, tree, nVars] = exp;                 #              env = Frame(args + [UNSET], crEnv, depth)
+        tName, fName = newName('T'), newName('f');        #              vals = env.vals
+        templates[tName] = template;                      #              vals1 = env.parent.vals     (if used)
+        uses.append(set());                               #              genv = env.env              (if used)
+        body = emitBlock(tree, inLoop=False, inFunc=True);
+        body.append("raise LJTypeErr('non-returning function')");
+        used = uses.pop();
+        head = ['env = Frame(args + [%s], crEnv, depth)' % ', '.join(['UNSET'] * nVars), 'vals = env.vals', 'fuel = ctx.fuel'];
+        for depth in sorted(d for d in used if d != 'genv'):
+            head.append('vals%s = env%s.vals' % (depth, '.parent' * depth));
+        if 'genv' in used: head.append('genv = env.env');
+        defs.extend(['def %s(crEnv, args, depth, ctx):' % fName] + indent(head + body) + ['']);
+        t = newName('t');
+        out.append('%s = makeFunction(%s, %s, env)' % (t, tName, fName));
+        return t;
+    
+    def emitLocal(exp, out):
+        [_, depth, slot, name] = exp;
+        t = newName('t');                                 # Copied, as a callee may reassign the var (via a closure).
+        if depth == 0:                                    # Own vars are always initialized before use.
+            out.append('%s = vals[%s]' % (t, slot));
+            return t;
+        uses[-1].add(depth);
+        out.extend(['%s = vals%s[%s]' % (t, depth, slot),
+                    'if %s is UNSET:' % t,
+                    "    raise LJReferenceErr('%s is not defined')" % name]);
+        return t;
+    
+    def emitExp(exp, out):
+        "Emits statements computing exp; returns its atom."
+        tag = exp[0];
+        if tag == 'literal':
+            atom = pyLiteral(exp[1]);
+            if type(exp[1]) is float: kinds[atom] = 'float';
+            elif type(exp[1]) is bool: kinds[atom] = 'bool';
+            return atom;
+        elif tag == 'binop':
+            return emitBinop(exp, out);
+        elif tag == 'unop':
+            return emitUnop(exp, out);
+        elif tag == 'function':
+            return emitFunctionLiteral(exp, out);
+        elif tag == 'local':
+            return emitLocal(exp, out);
+        # otherwise...
+        t = newName('t');
+        if tag == 'name':
+            out.append('%s = env.lookup(%r)' % (t, str(exp[1])));
+        elif tag == 'global':
+            uses[-1].add('genv');
+            out.append('%s = genv.lookup(%r)' % (t, str(exp[1])));
+        elif tag == 'refine':
+            x, y = emitExp(exp[1], out), emitExp(exp[2], out);
+            out.append('%s = refine(%s, %s)' % (t, x, y));
+        elif tag == 'call':
+            f = emitExp(exp[1], out);
+            args = [emitExp(arg, out) for arg in exp[2]];
+            out.append('%s = callValue(%s, [%s], env, ctx)' % (t, f, ', '.join(args)));
+        elif tag == 'array':
+            elts = [emitExp(elt, out) for elt in exp[1]];
+            out.extend(['fuel.room -= %d' % valueBytes(list, len(elts)), 'if fuel.room < 0: fuel.grow()']);
+            out.append('%s = [%s]' % (t, ', '.join(elts)));
+        elif tag == 'object':
+            pairs = ['%r: %s' % (str(key), emitExp(valExp, out)) for key, valExp in exp[1]];
+            out.extend(['fuel.room -= %d' % valueBytes(dict, len(pairs)), 'if fuel.room < 0: fuel.grow()']);
+            out.append('%s = {%s}' % (t, ', '.join(pairs)));
+        else:
+            raise Exception('unknown node ' + tag);     # internal error
+        return t;
+    
+    def emitIfLadder(stmt, out, inLoop, inFunc):          # If any `else if` condition needs statements of its own, the arms are
+        arms = [];                                        #    chained via a flag (instead of nesting them ever deeper), as
+        for j in xrange(1, len(stmt), 2):                 #    Python limits the depth of indentation.
+            pre = [];
+            cond = emitCond(stmt[j], pre);
+            code = emitBlock(stmt[j+1], inLoop, inFunc);
+            arms.append((pre, cond, code));
+        if not any(pre for pre, _, _ in arms[1:]):
+            out.extend(arms[0][0]);
+            keyword = 'if';
+            for pre, cond, code in arms:
+                if cond == 'True' and keyword == 'elif':
+                    out.extend(['else:'] + indent(code));
+                    break;
+                out.extend(['%s %s:' % (keyword, cond)] + indent(code));
+                keyword = 'elif';
+            return;
+        flag = newName('t');
+        out.append('%s = False' % flag);
+        for pre, cond, code in arms:
+            armLines = pre + ['if %s:' % cond] + indent(['%s = True' % flag] + code);
+            if cond == 'True': armLines = pre + code;
+            if pre is arms[0][0]: out.extend(armLines);
+            else: out.extend(['if not %s:' % flag] + indent(armLines));
+    
+    def emitWhile(stmt, out, inFunc):                     # form:    while True:
+        [_, exp, code] = stmt;                            #              <cond statements>
+        limit, start = newName('t'), newName('t');        #              if not <cond>: break
+        pre = [];                                         #              try:
+        cond = emitCond(exp, pre);                        #                  <body>
+        body = emitBlock(code, True, inFunc, entry=1);    #          except LJBreak: break         (a callee's stray break)
+        out.extend([                                      #              <maxLoopTime check>
+            '%s = ctx.maxLoopTime' % limit,
+            '%s = time.time()' % start,
+            'while True:'] + indent(pre + [
+            'if not (%s): break' % cond,
+            'try:'] + indent(body) + [
+            'except LJBreak:',
+            '    break',
+            'if %s and time.time() - %s > %s:' % (limit, start, limit),
+            "    raise LJRuntimeErr('looping for to long')"]));
+    
+    def emitStmt(stmt, out, inLoop, inFunc):
+        tag = stmt[0];
+        if tag == 'init':
+            x = emitExp(stmt[2], out);
+            out.append('env.init(%r, %s)' % (str(stmt[1]), x));
+        elif tag == 'declare':
+            [_, slot, name, exp] = stmt;
+            x = emitExp(exp, out);
+            if slot is None:
+                out.append("raise LJReferenceErr('%s is already defined')" % name);
+            else:
+                out.append('vals[%s] = %s' % (slot, x));
+        elif tag == 'assign' and stmt[1][0] == 'name':
+            x = emitExp(stmt[2], out);
+            out.append('env.assign(%r, %s)' % (str(stmt[1][1]), x));
+        elif tag == 'assign' and stmt[1][0] == 'global':
+            x = emitExp(stmt[2], out);
+            uses[-1].add('genv');
+            out.append('genv.assign(%r, %s)' % (str(stmt[1][1]), x));
+        elif tag == 'assign' and stmt[1][0] == 'local':
+            [_, depth, slot, _] = stmt[1];
+            x = emitExp(stmt[2], out);
+            if depth: uses[-1].add(depth);
+            out.append('vals%s[%s] = %s' % (depth or '', slot, x));
+        elif tag == 'assign':
+            x = emitExp(stmt[2], out);
+            o, k = emitExp(stmt[1][1], out), emitExp(stmt[1][2], out);
+            out.append('assignRefinement(%s, %s, %s, fuel)' % (o, k, x));
+        elif tag == 'exp-stmt':
+            x = emitExp(stmt[1], out);
+            if not inFunc:                                # A function's env is never global. Nothing is ever written.
+                out.extend(['if ctx.writer and %s != None and env.isGlobal:' % x,
+                            "    ctx.writer(lj_repr(%s) + '\\n')" % x]);
+        elif tag == 'if-ladder':
+            emitIfLadder(stmt, out, inLoop, inFunc);
+        elif tag == 'while':
+            emitWhile(stmt, out, inFunc);
+        elif tag == 'return':
+            x = emitExp(stmt[1], out);
+            out.append(('return %s' if inFunc else 'raise LJReturn(%s)') % x);
+        elif tag == 'tail-call':
+            [_, [_, funcExp, argExps]] = stmt;
+            f = emitExp(funcExp, out);
+            args = [emitExp(arg, out) for arg in argExps];
+            out.append('return tailCall(%s, [%s], env, ctx)' % (f, ', '.join(args)));
+        elif tag == 'break':
+            out.append('break' if inLoop else 'raise LJBreak()');
+        else:
+            raise Exception('unknown statement ' + tag);    # internal error
+    
+    def emitBlock(tree, inLoop, inFunc, entry=0):         # Fuel is burnt once per run of statements (see fuelRuns).
+        out = [];
+        for stmts, n in fuelRuns(tree, entry):
+            if n: out.extend(['fuel.tank -= %d' % n, 'if fuel.tank < 0: fuel.refill()']);
+            for stmt in stmts:
+                emitStmt(stmt, out, inLoop, inFunc);
+        return out or ['pass'];
+    
+    main = emitBlock(tree, inLoop=False, inFunc=False);
+    source = '\n'.join(defs + ['def main(env, ctx):'] + indent(['fuel = ctx.fuel'] + main)) + '\n';
+    return source, templates;
+
+class Transpiled(Resolved):
+    "A parse tree, translated into (and compiled as) Python."
+    def __init__(self, tree):
+        Resolved.__init__(self, tree);
+        self.source, self.templates = transpileSource(self.resolved);
+        self.code = compile(self.source, '<littlej>', 'exec');
+        self.link();
+    def link(self):
+        "Executes the translated module, to define main()."
+        namespace = dict(transpilerGlobals);
+        namespace.update(self.templates);
+        exec self.code in namespace;
+        self.main = namespace['main'];
+    def __getstate__(self):                                 # Pickled w/ its Python bytecode, as Python's compile() is
+        state = dict(self.__dict__);                        #    by far the slowest part of transpile().
+        del state['main'];
+        state['code'] = marshal.dumps(self.code);
+        return state;
+    def __setstate__(self, state):
+        self.__dict__.update(state);
+        self.code = marshal.loads(self.code);
+        self.link();
+    def run(self, env, maxLoopTime=None, writer=None, fuel=None):
+        "Executes the translated code in an environment `env`."
+        self.main(env, Context(maxLoopTime, writer, env.maxDepth, fuel));
+
+def transpile(tree):
+    "Translates a parse tree into Python, for fast execution."
+    return Transpiled(tree);
+
+#############################################################
+#                    BYTECODE                               #
+#############################################################
+                                                              # assemble() translates a (resolved) parse tree into flat bytecode: an
+vmOpNames = [                                                 #    array('i') of (opcode, argument) pairs, plus a table of constants.
+    'CONST', 'LOCAL', 'BINOP', 'JUMP_IF_FALSY', 'STORE_LOCAL', 'CALL',
+    'RETURN', 'REFINE', 'FOR_TEST', 'FOR_STEP', 'FUEL', 'LOOP_BACK',
+    'JUMP', 'OUTER', 'GLOBAL', 'NAME',
+    'STORE_OUTER', 'STORE_GLOBAL', 'STORE_NAME', 'STORE_REFINE', 'UNOP',
+    'ARRAY', 'OBJECT', 'FUNCTION', 'POP', 'PRINT_EXP', 'INIT', 'REDECLARE',
+    'SETUP_LOOP', 'POP_LOOP', 'BREAK_OUT', 'END_FUNCTION', 'END_PROGRAM',
+    'TAIL_CALL', 'JUMP_IF_FALSY_OR_POP', 'JUMP_IF_TRUTHY_OR_POP'#,
+];                                                            # Opcodes are listed roughly in order of frequency, which is also the
+for _j, _name in enumerate(vmOpNames):                        #    order in which execute() tests for them.
+    globals()['OP_' + _name] = _j;
+del _j, _name;
+
+vmBinops = [                                                  # BINOP's argument indexes this list.
+    (op, pyBinops.get(op)) for op in sorted(binaryPrecedence)
+];
+vmBinopIndex = dict((op, j) for j, (op, _) in enumerate(vmBinops));
+vmMaxDepth = None;                                            # VM calls don't use Python's stack, so (unless a Runtime's maxDepth is
+                                                              #    set) recursion is limited only by memory, or else by this.
+
+class Bytecode(object):
+    "A unit of bytecode: a function body or a whole program."
+    def __init__(self, ops, consts, loops, nVars, entryFuel=0):
+        self.ops = ops;                                       # array('i'): opcode, arg, opcode, arg ...
+        self.consts = consts;                                 # values, names, function templates etc. (indexed by args)
+        self.loops = loops;                                   # (start, end, exit, height) of each loop body, outermost first
+        self.nVars = nVars;                                   # None for programs
+        self.entryFuel = entryFuel;                           # fuel for a function body's first run of statements, burnt by callers
+        self.pad = [UNSET] * (nVars or 0);
+    def __reduce__(self):                                     # UNSET must not be pickled, as it's compared by identity.
+        return (Bytecode, (self.ops, self.consts, self.loops, self.nVars, self.entryFuel));
+    def __call__(self, crEnv, args, depth, ctx):              # Bytecode of a function body also serves as its Function's body
+        "Runs a function body; returns the function's value."  #    (see compileBody), for callers outside the VM.
+        ctx.fuel.tank -= self.entryFuel;
+        if ctx.fuel.tank < 0: ctx.fuel.refill();
+        return execute(self, Frame(args + self.pad, crEnv, depth), ctx)[0];
+    def findLoop(self, pc):
+        "Returns the innermost loop whose body contains pc."
+        found = None;
+        for loop in self.loops:
+            if loop[0] <= pc < loop[1]: found = loop;
+        return found;
+
+class Assembler(object):
+    "Accumulates the bytecode of a function body or program."
+    def __init__(self, nVars):
+        self.ops = [];
+        self.consts = [];
+        self.constIndex = {};
+        self.loops = [];
+        self.breaks = [];                                     # per active loop, positions of JUMPs to be patched to its exit
+        self.nVars = nVars;
+        self.inFunction = nVars is not None;
+        self.entryFuel = 0;
+    def const(self, x):
+        "Returns the index of constant x, adding it if new."
+        key = (type(x), repr(x)) if type(x) is float else (type(x), x);    # keeps -0.0 apart from 0.0 (& 1.0 from true)
+        if key not in self.constIndex:
+            self.constIndex[key] = len(self.consts);
+            self.consts.append(x);
+        return self.constIndex[key];
+    def emit(self, op, arg=0):
+        "Appends an instruction; returns its position."
+        self.ops.extend([op, arg]);
+        return len(self.ops) - 2;
+    def here(self):
+        return len(self.ops);
+    def patch(self, pos, target):
+        self.ops[pos + 1] = target;
+    def bytecode(self):
+        return Bytecode(array.array('i', self.ops), self.consts, map(tuple, self.loops), self.nVars, self.entryFuel);
+
+def assembleExp(exp, asm):
+    "Assembles an expression, which leaves its value on the stack."
+    tag = exp[0];
+    if tag == 'literal':
+        asm.emit(OP_CONST, asm.const(exp[1]));
+    elif tag == 'local':
+        [_, depth, slot, name] = exp;
+        if depth == 0:                                        # Own vars are always initialized before use.
+            asm.emit(OP_LOCAL, slot);
+        else:
+            asm.emit(OP_OUTER, asm.const((depth, slot, name)));
+    elif tag == 'global':
+        asm.emit(OP_GLOBAL, asm.const(exp[1]));
+    elif tag == 'name':
+        asm.emit(OP_NAME, asm.const(exp[1]));
+    elif tag == 'binop' and exp[1] in [sym('&&'), sym('||')]:    # form:    <left>
+        assembleExp(exp[2], asm);                             #          JUMP_IF_FALSY_OR_POP end    (or TRUTHY, for ||)
+        jumpOp = OP_JUMP_IF_FALSY_OR_POP if exp[1] is sym('&&') else OP_JUMP_IF_TRUTHY_OR_POP;
+        test = asm.emit(jumpOp);                              #          <right>
+        assembleExp(exp[3], asm);                             #          end:
+        asm.patch(test, asm.here());
+    elif tag == 'binop':
+        assembleExp(exp[2], asm);
+        assembleExp(exp[3], asm);
+        asm.emit(OP_BINOP, vmBinopIndex[exp[1]]);
+    elif tag == 'refine':
+        assembleExp(exp[1], asm);
+        assembleExp(exp[2], asm);
+        asm.emit(OP_REFINE);
+    elif tag == 'call':
+        assembleExp(exp[1], asm);
+        for argExp in exp[2]:
+            assembleExp(argExp, asm);
+        asm.emit(OP_CALL, len(exp[2]));
+    elif tag == 'unop':
+        assembleExp(exp[2], asm);
+        asm.emit(OP_UNOP, asm.const(exp[1]));
+    elif tag == 'array':
+        for elt in exp[1]:
+            assembleExp(elt, asm);
+        asm.emit(OP_ARRAY, len(exp[1]));
+    elif tag == 'object':
+        for _, valExp in exp[1]:
+            assembleExp(valExp, asm);
+        asm.emit(OP_OBJECT, asm.const(tuple(key for key, _ in exp[1])));
+    elif tag == 'function':
+        [_, template, tree, nVars] = exp;
+        body = assembleCode(tree, nVars);
+        asm.emit(OP_FUNCTION, asm.const((template, body)));
+    else:
+        raise Exception('unknown node ' + tag);               # internal error
+
+def assembleWhile(stmt, asm):                                 # form:    SETUP_LOOP                (pushes the loop's start time)
+    "Assembles a while loop."                                 #          cond: <exp>
+    [_, exp, code] = stmt;                                    #          JUMP_IF_FALSY exit
+    asm.emit(OP_SETUP_LOOP);                                  #          body: <block>             (break --> JUMP exit)
+    cond = asm.here();                                        #          LOOP_BACK cond            (checks maxLoopTime)
+    counted = countedLoop(stmt);                              #          exit: POP_LOOP
+    if counted and counted[0][:2] == ['local', 0]:            # Counted loops over a function's own var (see countedLoop) are:
+        [var, op, bound, pOrM, step, code] = counted;         #    cond: <bound>
+        assembleExp(bound, asm);                              #          FOR_TEST (slot, op)       (skips the JUMP, if true)
+        asm.emit(OP_FOR_TEST, asm.const((var[2], vmBinopIndex[op])));
+        test = asm.emit(OP_JUMP);                             #          JUMP exit
+    else:                                                     #          body: <block, w/o the increment>
+        assembleExp(exp, asm);                                #          FOR_STEP (slot, step, op)
+        test = asm.emit(OP_JUMP_IF_FALSY);                    #          LOOP_BACK cond ...
+    loop = [asm.here(), None, None, len(asm.breaks) + 1];     # A callee's misplaced break, raised within [body, LOOP_BACK), jumps to
+    asm.loops.append(loop);                                   #    exit too. (The stack is first cut down to `height` entries,
+    asm.breaks.append([]);                                    #    i.e. the start times of this & all enclosing loops.)
+    assembleBlock(code, asm, 1 if code is stmt[2] else 2);   # Each iteration burns fuel (& the increment, for counted loops).
+    if code is not stmt[2]:
+        asm.emit(OP_FOR_STEP, asm.const((var[2], step, vmBinopIndex[pOrM])));
+    loop[1] = asm.emit(OP_LOOP_BACK, cond);
+    loop[2] = asm.here();
+    for pos in [test] + asm.breaks.pop():
+        asm.patch(pos, loop[2]);
+    asm.emit(OP_POP_LOOP);
+
+def assembleStmt(stmt, asm):
+    "Assembles a statement."
+    tag = stmt[0];
+    if tag == 'init':
+        assembleExp(stmt[2], asm);
+        asm.emit(OP_INIT, asm.const(stmt[1]));
+    elif tag == 'declare':
+        [_, slot, name, exp] = stmt;
+        assembleExp(exp, asm);
+        if slot is None:
+            asm.emit(OP_REDECLARE, asm.const(name));
+        else:
+            asm.emit(OP_STORE_LOCAL, slot);
+    elif tag == 'assign':
+        [_, lExp, rExp] = stmt;
+        assembleExp(rExp, asm);
+        if lExp[0] == 'local' and lExp[1] == 0:
+            asm.emit(OP_STORE_LOCAL, lExp[2]);
+        elif lExp[0] == 'local':
+            asm.emit(OP_STORE_OUTER, asm.const(tuple(lExp[1:])));
+        elif lExp[0] == 'global':
+            asm.emit(OP_STORE_GLOBAL, asm.const(lExp[1]));
+        elif lExp[0] == 'name':
+            asm.emit(OP_STORE_NAME, asm.const(lExp[1]));
+        else:                                                 # form of lExp:     a [ "foo" ] [ 1 ] .. [ 0 ]
+            assembleExp(lExp[1], asm);                        #                  <-------objExp----->   keyExp
+            assembleExp(lExp[2], asm);
+            asm.emit(OP_STORE_REFINE);
+    elif tag == 'if-ladder':
+        ends = [];
+        for j in xrange(1, len(stmt), 2):
+            assembleExp(stmt[j], asm);
+            test = asm.emit(OP_JUMP_IF_FALSY);
+            assembleBlock(stmt[j+1], asm);
+            if j + 2 < len(stmt):
+                ends.append(asm.emit(OP_JUMP));
+            asm.patch(test, asm.here());
+        for pos in ends:
+            asm.patch(pos, asm.here());
+    elif tag == 'while':
+        assembleWhile(stmt, asm);
+    elif tag == 'return':
+        assembleExp(stmt[1], asm);
+        asm.emit(OP_RETURN);
+    elif tag == 'tail-call':                                  # form:    <func> <args> TAIL_CALL n RETURN
+        [_, [_, funcExp, argExps]] = stmt;                    #    (The RETURN is reached only if the callee isn't run by the VM.)
+        assembleExp(funcExp, asm);
+        for argExp in argExps:
+            assembleExp(argExp, asm);
+        asm.emit(OP_TAIL_CALL, len(argExps));
+        asm.emit(OP_RETURN);
+    elif tag == 'break':
+        if asm.breaks:
+            asm.breaks[-1].append(asm.emit(OP_JUMP));
+        else:
+            asm.emit(OP_BREAK_OUT);                           # misplaced; breaks out of the caller's loop (if any)
+    elif tag == 'exp-stmt':
+        assembleExp(stmt[1], asm);
+        asm.emit(OP_PRINT_EXP if not asm.inFunction else OP_POP);
+    else:
+        raise Exception('unknown statement ' + tag);        # internal error
+
+def assembleBlock(tree, asm, entry=0, isBody=False):
+    "Assembles a list of statements."
+    for j, (stmts, n) in enumerate(fuelRuns(tree, entry)):   # Fuel is burnt by FUEL, once per run of statements (see fuelRuns).
+        if isBody and j == 0:                                 # A function body's first run is paid for by its callers, along w/
+            asm.entryFuel = n;                                #    the call itself.
+        elif n:
+            asm.emit(OP_FUEL, n);
+        for stmt in stmts:
+            assembleStmt(stmt, asm);
+
+def assembleCode(tree, nVars=None):
+    "Assembles a function body (or a program, if nVars is None)."
+    asm = Assembler(nVars);
+    assembleBlock(tree, asm, isBody=asm.inFunction);
+    asm.emit(OP_END_FUNCTION if asm.inFunction else OP_END_PROGRAM);
+    return asm.bytecode();
+
+def assembleFunction(func):
+    "Assembles (and caches) the body of a Function."        # Used for Functions created by run(), so that the VM can call them
+    owner = func.template or func;                          #    without recursing too. (See compileFunction.)
+    if owner.assembled is None:
+        tree, nVars = resolveFunction(func.params, func.tree, None, set());
+        owner.assembled = assembleCode(tree, nVars);
+    return owner.assembled;
+
+def execute(code, env, ctx):                                  # VM-to-VM calls don't recurse in Python. Instead, the caller's state
+    "Runs bytecode in env; returns a completion signal."      #    is pushed onto `calls`, and the callee runs in the same loop.
+    ops, consts = code.ops, code.consts;                      # All calls share a single value stack. Each call's part of it
+    stack = []; push = stack.append; pop = stack.pop;         #    starts at `base`.
+    calls = []; base = 0; pc = 0;
+    tailStart = None;                                         # time of the current call's first tail call (see checkTailTime)
+    vals = env.vals if type(env) is Frame else None;
+    maxLoopTime, maxDepth, fuel = ctx.maxLoopTime, ctx.maxDepth or vmMaxDepth, ctx.fuel;
+    binops, _float = vmBinops, float;                         # Hot globals are copied into locals, which are faster to look up.
+    (OP_CONST, OP_LOCAL, OP_BINOP, OP_JUMP_IF_FALSY, OP_STORE_LOCAL, OP_CALL,
+        OP_RETURN, OP_REFINE, OP_FOR_TEST, OP_FOR_STEP, OP_FUEL, OP_LOOP_BACK, OP_JUMP, OP_OUTER) = xrange(14);
+    while True:
+        try:
+            while True:
+                op = ops[pc]; arg = ops[pc+1]; pc += 2;
+                if op == OP_CONST:
+                    push(consts[arg]);
+                elif op == OP_LOCAL:
+                    push(vals[arg]);
+                elif op == OP_BINOP:
+                    y = pop(); x = stack[-1];
+                    sym_, pyOp = binops[arg];
+                    if type(x) is _float and type(y) is _float and pyOp:
+                        stack[-1] = pyOp(x, y);
+                    else:
+                        stack[-1] = binop(x, sym_, y, fuel);
+                elif op == OP_JUMP_IF_FALSY:
+                    x = pop();
+                    if x is False or x is None or (not x and type(x) in (float, str)):    # same as isFalsy(x), but faster
+                        pc = arg;
+                elif op == OP_STORE_LOCAL:
+                    vals[arg] = pop();
+                elif op == OP_CALL:
+                    args = stack[len(stack) - arg:];
+                    del stack[len(stack) - arg:];
+                    func = pop();
+                    if type(func) is Function and (type(func.body) is Bytecode or func.body is None):
+                        if len(args) != len(func.params):
+                            raise LJTypeErr('incorrect no. of arguments ... (%s)' % lj_repr(args)[1:-1]);
+                        depth = env.depth + 1;
+                        if maxDepth and depth >= maxDepth:
+                            raise LJRuntimeErr('maximum call depth exceeded');
+                        calls.append((code, pc, env, base, tailStart)); tailStart = None;
+                        code = func.body or assembleFunction(func); ops, consts = code.ops, code.consts;
+                        fuel.tank -= 1 + code.entryFuel;
+                        if fuel.tank < 0: fuel.refill();
+                        env = Frame(args + code.pad, func.crEnv, depth); vals = env.vals;
+                        base = len(stack); pc = 0;
+                    else:
+                        push(callValue(func, args, env, ctx));
+                elif op == OP_RETURN:
+                    x = pop();
+                    if not calls:
+                        return (x,);
+                    del stack[base:];
+                    code, pc, env, base, tailStart = calls.pop();
+                    ops, consts = code.ops, code.consts;
+                    vals = env.vals if type(env) is Frame else None;
+                    push(x);
+                elif op == OP_REFINE:
+                    y = pop();
+                    stack[-1] = refine(stack[-1], y);
+                elif op == OP_FOR_TEST:
+                    slot, j = consts[arg];
+                    y = pop(); x = vals[slot];
+                    sym_, pyOp = binops[j];
+                    if type(x) is _float and type(y) is _float:
+                        if pyOp(x, y): pc += 2;               # skips the JUMP to the loop's exit
+                    elif isTruthy(binop(x, sym_, y)):
+                        pc += 2;
+                elif op == OP_FOR_STEP:
+                    slot, step, j = consts[arg];
+                    x = vals[slot];
+                    sym_, pyOp = binops[j];
+                    vals[slot] = pyOp(x, step) if type(x) is _float else binop(x, sym_, step);
+                elif op == OP_FUEL:
+                    fuel.tank -= arg;
+                    if fuel.tank < 0: fuel.refill();
+                elif op == OP_LOOP_BACK:
+                    if maxLoopTime and time.time() - stack[-1] > maxLoopTime:
+                        raise LJRuntimeErr('looping for to long');
+                    pc = arg;
+                elif op == OP_JUMP:
+                    pc = arg;
+                elif op == OP_OUTER:
+                    depth, slot, name = consts[arg]; frame = env;
+                    for _ in xrange(depth): frame = frame.parent;
+                    x = frame.vals[slot];
+                    if x is UNSET:                            # form:        var f = function () { return a; }, b = f(), a = 1;
+                        raise LJReferenceErr('%s is not defined' % name);
+                    push(x);
+                elif op == OP_GLOBAL:
+                    push(env.env.lookup(consts[arg]));
+                elif op == OP_NAME:
+                    push(env.lookup(consts[arg]));
+                elif op == OP_STORE_OUTER:
+                    depth, slot, _ = consts[arg]; frame = env;
+                    for _ in xrange(depth): frame = frame.parent;
+                    frame.vals[slot] = pop();
+                elif op == OP_STORE_GLOBAL:
+                    env.env.assign(consts[arg], pop());
+                elif op == OP_STORE_NAME:
+                    env.assign(consts[arg], pop());
+                elif op == OP_STORE_REFINE:
+                    y = pop(); x = pop();
+                    assignRefinement(x, y, pop(), fuel);
+                elif op == OP_UNOP:
+                    stack[-1] = unop(consts[arg], stack[-1]);
+                elif op == OP_ARRAY:
+                    fuel.room -= valueBytes(list, arg);
+                    if fuel.room < 0: fuel.grow();
+                    x = stack[len(stack) - arg:];
+                    del stack[len(stack) - arg:];
+                    push(x);
+                elif op == OP_OBJECT:
+                    keys = consts[arg];
+                    fuel.room -= valueBytes(dict, len(keys));
+                    if fuel.room < 0: fuel.grow();
+                    x = dict(zip(keys, stack[len(stack) - len(keys):]));
+                    del stack[len(stack) - len(keys):];
+                    push(x);
+                elif op == OP_FUNCTION:
+                    template, body = consts[arg];
+                    push(makeFunction(template, body, env));
+                elif op == OP_POP:
+                    pop();
+                elif op == OP_PRINT_EXP:
+                    x = pop();
+                    if ctx.writer and x != None and env.isGlobal:
+                        ctx.writer(lj_repr(x) + '\n');
+                elif op == OP_INIT:
+                    env.init(consts[arg], pop());
+                elif op == OP_REDECLARE:
+                    raise LJReferenceErr('%s is already defined' % consts[arg]);
+                elif op == OP_SETUP_LOOP:
+                    push(time.time());
+                elif op == OP_POP_LOOP:
+                    pop();
+                elif op == OP_BREAK_OUT:
+                    raise LJBreak();
+                elif op == OP_END_FUNCTION:
+                    raise LJTypeErr('non-returning function');
+                elif op == OP_END_PROGRAM:
+                    return None;
+                elif op == OP_TAIL_CALL:
+                    args = stack[len(stack) - arg:];
+                    del stack[len(stack) - arg:];
+                    func = pop();
+                    if type(func) is Function and (type(func.body) is Bytecode or func.body is None):
+                        if len(args) != len(func.params):
+                            raise LJTypeErr('incorrect no. of arguments ... (%s)' % lj_repr(args)[1:-1]);
+                        tailStart = checkTailTime(tailStart, maxLoopTime);
+                        del stack[base:];                     # The callee replaces this call, at the same depth.
+                        code = func.body or assembleFunction(func); ops, consts = code.ops, code.consts;
+                        fuel.tank -= 1 + code.entryFuel;
+                        if fuel.tank < 0: fuel.refill();
+                        env = Frame(args + code.pad, func.crEnv, env.depth); vals = env.vals;
+                        pc = 0;
+                    else:
+                        push(callValue(func, args, env, ctx));    # (followed by RETURN)
+                elif op == OP_JUMP_IF_FALSY_OR_POP:          # The left operand of && or || is kept as the result if it decides it.
+                    if isFalsy(stack[-1]): pc = arg;
+                    else: pop();
+                elif op == OP_JUMP_IF_TRUTHY_OR_POP:
+                    if isTruthy(stack[-1]): pc = arg;
+                    else: pop();
+                else:
+                    raise Exception('unknown opcode %d' % op);  # internal error
+        except LJBreak:                                       # A misplaced break (of a callee, or a native) breaks out of the
+            while True:                                       #    innermost loop running, in this or any calling function.
+                loop = code.findLoop(pc - 2);
+                if loop is not None:
+                    del stack[base + loop[3]:];
+                    pc = loop[2];
+                    break;
+                if not calls:
+                    raise;
+                del stack[base:];
+                code, pc, env, base, tailStart = calls.pop();
+                ops, consts = code.ops, code.consts;
+                vals = env.vals if type(env) is Frame else None;
+
+class Assembled(Resolved):
+    "A parse tree, assembled (once) into bytecode."
+    def __init__(self, tree):
+        Resolved.__init__(self, tree);
+        self.code = assembleCode(self.resolved);
+    def run(self, env, maxLoopTime=None, writer=None, fuel=None):
+        "Executes the bytecode in an environment `env`."
+        checkCompletion(execute(self.code, env, Context(maxLoopTime, writer, env.maxDepth, fuel)));
+
+def assemble(tree):
+    "Assembles a parse tree into bytecode, for the VM."
+    return Assembled(tree);
+
 #############################################################
 def inbuilts(writer):
     "Adds built-in functions like type(), len(), keys() etc."
@@ -1221,8 +2584,9 @@ def inbuilts(writer):
         return lj_repr(x); 
     
     def n_print(x):
-        "Default output function."
-        if writer: writer(n_str(x) + '\n');
+        "Default output function."                          # Writes to the writer of the Runtime running it, if any.
+        w = current.runtime.writer if current.runtime is not None else writer;
+        if w: w(n_str(x) + '\n');
         else: raise LJReferenceErr('print is not defined');
         return None; # null
     
@@ -1248,6 +2612,7 @@ def inbuilts(writer):
         
     def n_del(x, y):
         "Deletes from an object or array."
+        checkMutable(x);
         if [type(x), type(y)] == [dict, str]:
             if y in x:
                 x.pop(y); 
@@ -1261,6 +2626,7 @@ def inbuilts(writer):
         raise LJTypeErr('bad call to del()');
     
     def n_append(li, elt):
+        checkMutable(li);
         if type(li) is list: li.append(elt);
         else: raise LJTypeErr('cannot append() to non-array');
         return float(len(li));
@@ -1331,7 +2697,7 @@ def addNatives(env, dicty):
     okTypes = [bool, float, str, list, dict, Function, type(None)]        # py-function excluded
     for key in dicty:
         name = Name(key);
-        if name in env:
+        if name in env or (env.base is not None and name in env.base):
             sys.stdout.write('WARNING!! Conflicting native name ' + name);
         # otherwise...
         if inspect.isfunction(dicty[key]):
@@ -1341,38 +2707,599 @@ def addNatives(env, dicty):
         else:
             raise Exception('illegal native ' + key);
 
+def ljValue(x, memo=None):                                    # memo maps id(list, tuple or dict) to its converted form, so that
+    "Converts a Python value into a LittleJ value."          #    shared (& cyclic) containers stay shared once converted.
+    t = type(x);
+    if t is float or t is str or t is bool or x is None:
+        return x;
+    if t is int or t is long:
+        return float(x);
+    if t is dict or t is list or t is tuple:
+        if memo is None: memo = {};
+        elif id(x) in memo: return memo[id(x)];
+        if t is not dict:
+            out = memo[id(x)] = [];
+            out.extend([ljValue(val, memo) for val in x]);
+            return out;
+        out = memo[id(x)] = {};
+        for key, val in x.iteritems():
+            if type(key) is not str:
+                if not isinstance(key, basestring):
+                    raise TypeError('object keys must be strings: ' + repr(key));
+                key = ljValue(key);
+            out[key] = ljValue(val, memo);
+        return out;
+    if t is Function or inspect.isfunction(x):
+        return x;
+    if t is unicode:
+        return x.encode('utf-8');
+    for base in [int, long, float, str, unicode, dict, list, tuple]:    # subclasses (like Name)
+        if isinstance(x, base): return ljValue(base(x), memo);
+    raise TypeError('cannot convert to a LittleJ value: ' + repr(x));
+
+#############################################################
+#                    NATIVE STDLIB                          #
 #############################################################
+                                                              # nativeStdlib() implements stdlib.l.js in Python. Each helper takes a
+stdlibPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stdlib.l.js');    # fast path for the usual arguments,
+lowerTable = ''.join(chr(j + 32) if 65 <= j <= 90 else chr(j) for j in xrange(256));    #    & otherwise follows its LittleJ
+upperTable = ''.join(chr(j - 32) if 97 <= j <= 122 else chr(j) for j in xrange(256));   #    twin step by step (via refine(),
+                                                              #    binop() etc.), so that odd arguments give the same values, or raise
+def isIndex(x):                                               #    the same errors. Only fuel differs: natives burn none of their own,
+    "Tells if x is a non-negative integer (float)."          #    except in loops that might not end. Callbacks (like sortBy's f) burn
+    return type(x) is float and 0 <= x < 2 ** 53 and x == round(x);    # fuel as usual, but may be called on other pairs.
+
+def nativeStdlib(env):
+    "Creates native string, array & object (see stdlib.l.js)."
+    n_len, n_str, n_ord = env.lookup('len'), env.lookup('str'), env.lookup('ord');    # env's natives, as used by stdlib.l.js
+    n_append, n_del, n_keys = env.lookup('append'), env.lookup('del'), env.lookup('keys');
+    lt = lambda x, y: binop(x, sym('<'), y);
+    plus = lambda x, y: binop(x, sym('+'), y);
+    minus = lambda x, y: binop(x, sym('-'), y);
+
+    def context():                                            # Callbacks burn the fuel of the run in progress (see current), w/ its
+        "Returns a Context for calling back into LittleJ."   #    Runtime's limits. They're called one level deeper than the native
+        rt = current.runtime;                                 #    was (see invokePyFunction), so that recursion through callbacks
+        if rt is None:                                        #    still meets maxDepth. So, natives must make their Context before
+            ctx = Context(None, None, env.maxDepth);          #    any callback runs.
+        else:
+            ctx = Context(rt.maxLoopTime, None, rt.gEnv.maxDepth, rt.fuel);
+        ctx.depth = current.depth;
+        return ctx;
+
+    def call(f, args, ctx):
+        if type(f) is Function:
+            return callFunction(f, args, env, ctx, ctx.depth + 1);
+        return callValue(f, args, env, ctx);
+
+    def tick(nBytes=0):
+        "Burns a unit of fuel (& meters nBytes) of the run."
+        fuel = current.runtime and current.runtime.fuel;
+        if fuel is None: return;
+        fuel.tank -= 1;
+        if fuel.tank < 0: fuel.refill();
+        if nBytes: fuel.alloc(nBytes);
+
+    def at(a, i):
+        "Reads a[i], like LittleJ."
+        return a[i] if type(a) is list and i < len(a) else refine(a, float(i));
+
+    def items(a):
+        "Yields a[0] ... a[len(a) - 1], like LittleJ's loops."
+        for i in xrange(int(n_len(a))):
+            yield at(a, i);
+
+    def bounds(s, p1, p2):                                    # form:        string.slice(s, p1, p2)
+        "Resolves the positions of a slice to (lo, hi)."     # Returns None if the slice is empty.
+        ls = n_len(s);
+        if p1 is None: p1 = 0.0;
+        elif lt(p1, 0.0): p1 = plus(ls, p1);
+        if p2 is None: p2 = ls;
+        elif binop(p2, sym('>'), ls): p2 = ls;
+        elif lt(p2, 0.0): p2 = plus(ls, p2);
+        if not lt(p1, p2): return None;
+        refine(s, p1);                                        # raises unless p1 (& so each position up to p2) is an index
+        return int(p1), int(math.ceil(p2));
+
+    # string ------------------------------------------------
+    def s_slice(s, p1, p2):
+        b = bounds(s, p1, p2);
+        if b is None: return '';
+        if type(s) is str: return s[b[0] : b[1]];
+        ans = '';
+        for x in s[b[0] : b[1]]: ans = plus(ans, x);
+        return ans;
+
+    def s_indexOf(s, tgt, pos):
+        if type(s) is str and type(tgt) is str and (pos is None or isIndex(pos)):
+            return float(s.find(tgt, int(pos or 0)));
+        ls, ltgt = n_len(s), n_len(tgt);
+        i = 0.0 if pos is None else pos;
+        while binop(i, sym('<='), minus(ls, ltgt)):
+            if eqeqeq(s_slice(s, i, plus(i, ltgt)), tgt): return i;
+            i = plus(i, 1.0);
+            tick();
+        return -1.0;
+
+    def s_lastIndexOf(s, tgt, pos):
+        if type(s) is str and type(tgt) is str and (s and pos is None or isIndex(pos) and pos < len(s)):
+            return float(s.rfind(tgt, 0, len(s) if pos is None else int(pos) + 1));
+        ls, ltgt = n_len(s), n_len(tgt);
+        if pos is None: pos = minus(ls, 1.0);
+        s = s_slice(s, 0.0, plus(pos, 1.0));
+        i = pos;
+        while binop(i, sym('>='), minus(ltgt, 1.0)):
+            j = minus(i, minus(ltgt, 1.0));
+            if eqeqeq(s_slice(s, j, plus(i, 1.0)), tgt): return j;
+            i = minus(i, 1.0);
+            tick();
+        return -1.0;
+
+    def s_replace(s, old, rep):                               # Each search starts afresh, as in LittleJ, so a replacement may make a
+        if type(s) is str and type(old) is str and type(rep) is str:    # new match (& if rep contains old, it never ends). But
+            lold, i = len(old), s.find(old);                  #    the text before the previous match can't hold a match, & is skipped.
+            while i != -1:
+                s = s[:i] + rep + s[i + lold:];
+                tick(len(rep));
+                i = s.find(old, max(0, i + 1 - lold) if lold else 0);
+            return s;
+        lold = n_len(old);
+        while True:
+            i = s_indexOf(s, old, None);
+            if eqeqeq(i, -1.0): break;
+            s = plus(plus(s_slice(s, None, i), rep), s_slice(s, plus(i, lold), None));
+            tick();
+        return s;
+
+    def s_split(s, sep):
+        if type(s) is str and type(sep) is str:
+            return s.split(sep) if sep else list(s);
+        ls, lsep = n_len(s), n_len(sep);
+        if eqeqeq(sep, ''): return a_slice(s, None, None);
+        ans = [];
+        while True:
+            i = s_indexOf(s, sep, None);
+            if eqeqeq(i, -1.0):
+                n_append(ans, s);
+                break;
+            n_append(ans, s_slice(s, None, i));
+            s = s_slice(s, plus(i, lsep), None);
+            tick();
+        return ans;
+
+    def caseMap(s, table):
+        "Helps change the case of ASCII letters."
+        if type(s) is str: return s.translate(table);
+        ans = '';
+        for c in items(s):
+            ans += table[int(n_ord(c))];
+        return ans;
+
+    string = {
+        'charCodeAt': lambda s, i: n_ord(refine(s, i)),
+        'concat': lambda s1, s2: plus(s1, s2),
+        'slice': s_slice,
+        'from': lambda s, p1: s_slice(s, p1, None),
+        'upto': lambda s, p2: s_slice(s, None, p2),
+        'indexOf': s_indexOf,
+        'index': lambda s, tgt: s_indexOf(s, tgt, None),
+        'lastIndexOf': s_lastIndexOf,
+        'rindex': lambda s, tgt: s_lastIndexOf(s, tgt, None),
+        'replace': s_replace,
+        'split': s_split,
+        'splitLimit': lambda s, sep, limit: a_slice(s_split(s, sep), None, limit),
+        'toLowerCase': lambda s: caseMap(s, lowerTable),
+        'toUpperCase': lambda s: caseMap(s, upperTable)#,
+    };
+    string['lower'] = string['toLowerCase'];
+    string['upper'] = string['toUpperCase'];
+
+    # array -------------------------------------------------
+    def a_slice(a, p1, p2):
+        b = bounds(a, p1, p2);
+        if b is None: return [];
+        return list(a[b[0] : b[1]]);
+
+    def a_concat(a1, a2):
+        if type(a1) is list and type(a2) is list: return a1 + a2;
+        n_len(a1); n_len(a2);
+        return a_slice(a1, None, None) + a_slice(a2, None, None);
+
+    def a_join(a, sep):
+        if type(a) is list and a and (type(sep) is str or len(a) == 1):
+            return n_str(a[0]) if len(a) == 1 else sep.join(map(n_str, a));
+        la, ans, i = n_len(a), '', 0.0;
+        while lt(i, minus(la, 1.0)):
+            ans = plus(ans, plus(n_str(refine(a, i)), sep));
+            i = plus(i, 1.0);
+        return plus(ans, n_str(refine(a, i)));
+
+    def a_popAt(a, i):
+        ans = refine(a, i);
+        n_del(a, i);
+        return ans;
+
+    def a_reverse(a):
+        checkMutable(a);
+        if type(a) is list:
+            a.reverse();
+            return None;
+        la, i = n_len(a), 0.0;
+        while lt(i, binop(la, sym('/'), 2.0)):
+            tmp, j = refine(a, i), minus(minus(la, 1.0), i);
+            assignRefinement(a, i, refine(a, j));
+            assignRefinement(a, j, tmp);
+            i = plus(i, 1.0);
+        return None;
+
+    def a_sortBy(a, f):                                       # Python's sort is stable, like stdlib.l.js's merge sort. Both take
+        la = n_len(a);                                        #    y before x iff f(x, y) > 0, so they agree for any consistent f.
+        if la < 2: return a;
+        checkMutable(a);
+        src, ctx = a_slice(a, None, None), context();
+        def before(y, x):
+            return -1 if binop(call(f, [x, y], ctx), sym('>'), 0.0) else 0;
+        src.sort(cmp=before);
+        if type(a) is list and len(a) == la:
+            a[:] = src;
+        else:
+            for i in xrange(int(la)): assignRefinement(a, float(i), src[i]);
+        return a;
+
+    def a_sort(a):
+        if type(a) is list and (all(type(x) is float for x in a) or all(type(x) is str for x in a)):
+            checkMutable(a);
+            a.sort();
+            return a;
+        return a_sortBy(a, lambda m, n: -1.0 if binop(m, sym('<='), n) else 1.0);
+
+    def a_splice(a, p1, count):
+        if count is None: count = 1.0;
+        if type(a) is list and isIndex(p1) and isIndex(count) and p1 + count <= len(a):
+            checkMutable(a);
+            ans = a[int(p1) : int(p1 + count)];
+            del a[int(p1) : int(p1 + count)];
+            return ans;
+        ans, i = [], 0.0;
+        while lt(i, count):
+            n_append(ans, refine(a, p1));
+            n_del(a, p1);
+            i = plus(i, 1.0);
+            tick();
+        return ans;
+
+    def a_unshift(a, elt):
+        la = n_append(a, elt);                                # raises unless a is an array
+        a.insert(0, a.pop());
+        return la;
+
+    def same(elt):
+        "Returns a test for x === elt."
+        if type(elt) in [list, dict, Function] or inspect.isfunction(elt):
+            return lambda x: x is elt;
+        return lambda x: type(x) is type(elt) and x == elt;
+
+    def a_indexOf(a, elt, pos):
+        if type(a) is list and (pos is None or isIndex(pos)):
+            isElt = same(elt);
+            for i in xrange(int(pos or 0), len(a)):
+                if isElt(a[i]): return float(i);
+            return -1.0;
+        la, i = n_len(a), 0.0 if pos is None else pos;
+        while lt(i, la):
+            if eqeqeq(elt, refine(a, i)): return i;
+            i = plus(i, 1.0);
+            tick();
+        return -1.0;
+
+    def a_lastIndexOf(a, elt, pos):
+        if type(a) is list and (pos is None or isIndex(pos) and pos < len(a)):
+            isElt = same(elt);
+            for i in xrange(len(a) - 1 if pos is None else int(pos), -1, -1):
+                if isElt(a[i]): return float(i);
+            return -1.0;
+        la = n_len(a);
+        i = minus(la, 1.0) if pos is None else pos;
+        while binop(i, sym('>='), 0.0):
+            if eqeqeq(elt, refine(a, i)): return i;
+            i = minus(i, 1.0);
+            tick();
+        return -1.0;
+
+    def a_every(a, f):                                        # A callee's misplaced break ends the loop, as in LittleJ.
+        ctx = context();
+        try:
+            for x in items(a):
+                if isFalsy(call(f, [x], ctx)): return False;
+        except LJBreak: pass;
+        return True;
+
+    def a_some(a, f):
+        ctx = context();
+        try:
+            for x in items(a):
+                if isTruthy(call(f, [x], ctx)): return True;
+        except LJBreak: pass;
+        return False;
+
+    def a_forEach(a, f):
+        ctx = context();
+        try:
+            for x in items(a): call(f, [x], ctx);
+        except LJBreak: pass;
+        return None;
+
+    def a_map(a, f):
+        ans, ctx = [], context();
+        try:
+            for x in items(a): ans.append(call(f, [x], ctx));
+        except LJBreak: pass;
+        return ans;
+
+    def a_filter(a, f):
+        ans, ctx = [], context();
+        try:
+            for i in xrange(int(n_len(a))):
+                if isTruthy(call(f, [at(a, i)], ctx)): ans.append(at(a, i));
+        except LJBreak: pass;
+        return ans;
+
+    def a_fold(a, f, initial):
+        ctx = context();
+        try:
+            for x in items(a): initial = call(f, [initial, x], ctx);
+        except LJBreak: pass;
+        return initial;
+
+    def a_foldr(a, f, initial):
+        ctx = context();
+        try:
+            for i in xrange(int(n_len(a)) - 1, -1, -1):
+                initial = call(f, [initial, at(a, i)], ctx);
+        except LJBreak: pass;
+        return initial;
+
+    array = {
+        'slice': a_slice,
+        'from': lambda a, p1: a_slice(a, p1, None),
+        'upto': lambda a, p2: a_slice(a, None, p2),
+        'concat': a_concat,
+        'join': a_join,
+        'popAt': a_popAt,
+        'pop': lambda a: a_popAt(a, minus(n_len(a), 1.0)),
+        'push': n_append,
+        'reverse': a_reverse,
+        'shift': lambda a: a_popAt(a, 0.0),
+        'sortBy': a_sortBy,
+        'sort': a_sort,
+        'splice': a_splice,
+        'unshift': a_unshift,
+        'indexOf': a_indexOf,
+        'index': lambda a, elt: a_indexOf(a, elt, None),
+        'lastIndexOf': a_lastIndexOf,
+        'rindex': lambda a, elt: a_lastIndexOf(a, elt, None),
+        'every': a_every,
+        'some': a_some,
+        'forEach': a_forEach,
+        'map': a_map,
+        'filter': a_filter,
+        'fold': a_fold,
+        'reduce': lambda a, f: a_fold(a_slice(a, 1.0, None), f, refine(a, 0.0)),
+        'foldr': a_foldr,
+        'reduceRight': lambda a, f: a_foldr(a_slice(a, None, -1.0), f, refine(a, minus(n_len(a), 1.0)))#,
+    };
+    array['all'], array['any'] = array['every'], array['some'];
+    array['each'], array['foldl'] = array['forEach'], array['fold'];
+
+    # object ------------------------------------------------
+    def o_hasOwnProperty(o, s):
+        if type(o) is dict: return type(s) is str and s in o;
+        return not eqeqeq(a_indexOf(n_keys(o), s, None), -1.0);
+
+    obj = {'keys': n_keys, 'hasOwnProperty': o_hasOwnProperty};
+    return {'string': string, 'array': array, 'object': obj};
+
+#############################################################
+def approxSize(tree):
+    "Roughly estimates the bytes held by a parse tree."
+    total = 0; seen = set(); stack = [tree];
+    while stack:
+        x = stack.pop();
+        if id(x) in seen: continue;
+        seen.add(id(x));
+        total += sys.getsizeof(x);
+        if type(x) in (list, tuple):
+            stack.extend(x);
+        elif type(x) is dict:
+            stack.extend(x.keys()); stack.extend(x.values());
+        elif isa(x, Function):                                  # function templates hold their own tree & tokens
+            stack.extend([x.params, x.tree, x.iTokens]);
+    return total;
+
+def programSize(program):
+    "Roughly estimates the bytes held by a loaded program."
+    if type(program) is list:
+        return approxSize(program);
+    size = 2 * approxSize(program.tree);                        # the tree, plus its resolved (& compiled) form
+    return size + len(getattr(program, 'source', ''));
+
+def programKey(prog, engine):
+    "Content-addresses source code (or a .l.js file)."
+    if prog.endswith('.l.js'):                                  # Files are keyed by path & mtime, so that they
+        stat = os.stat(prog);                                   #    needn't be read (or hashed) on a hit.
+        return ('file', engine, os.path.abspath(prog), stat.st_mtime, stat.st_size);
+    return ('source', engine, hashlib.sha1(prog).hexdigest());
+
+ljcFormat = 9;                                                  # Bump this whenever parse trees (or programs) change shape.
+
+def ljcPath(path, engine, cacheDir):
+    "Where the precompiled form of a .l.js file is stored."
+    path = os.path.abspath(path);
+    name = '%s.%s.ljc' % (os.path.basename(path), engine);
+    if cacheDir is True:                                        # form:    lib/__ljcache__/stdlib.l.js.tree.ljc
+        return os.path.join(os.path.dirname(path), '__ljcache__', name);
+    dirHash = hashlib.sha1(os.path.dirname(path)).hexdigest()[:12];
+    return os.path.join(cacheDir, dirHash + '-' + name);        # form:    cacheDir/0123456789ab-stdlib.l.js.tree.ljc
+
+def loadFile(path, engine, cacheDir=True):
+    "Loads a .l.js file, reusing its precompiled form if fresh."
+    with open(path) as f:
+        source = f.read();
+    compiler = engines[engine];
+    if not cacheDir:
+        tree = optimize(yacc(lex(source)));
+        return compiler(tree) if compiler else tree;
+    header = (ljcFormat, imp.get_magic(), engine, hashlib.sha1(source).hexdigest());
+    ljc = ljcPath(path, engine, cacheDir);
+    try:
+        with open(ljc, 'rb') as f:
+            if pickle.load(f) == header:                        # The header is checked before the (larger) program is read.
+                return pickle.load(f);
+    except Exception:                                           # Missing, stale or corrupt caches
+        pass;                                                   #    fall back to parsing the source (below).
+    tree = optimize(yacc(lex(source)));
+    program = compiler(tree) if compiler else tree;
+    tmp = '%s.%d.%d.tmp' % (ljc, os.getpid(), threading.current_thread().ident);    # per process & thread
+    try:
+        if not os.path.isdir(os.path.dirname(ljc)):
+            os.makedirs(os.path.dirname(ljc));
+        with open(tmp, 'wb') as f:
+            pickle.dump(header, f, 2);
+            pickle.dump(program, f, 2);
+        os.rename(tmp, ljc);                                    # atomic, so that readers never see half a file
+    except Exception:                                           # Caching is best-effort. (The directory may be read-only,
+        try: os.remove(tmp);                                    #    or the tree too deep to pickle.)
+        except OSError: pass;
+    return program;
+
+class ProgramCache(object):
+    "A bounded LRU cache of parsed (& compiled) programs."
+    
+    def __init__(self, maxEntries=512, maxBytes=64*1024*1024):
+        self.maxEntries = maxEntries;
+        self.maxBytes = maxBytes;                               # approximate, see programSize()
+        self.entries = collections.OrderedDict();               # key --> (program, size), least recently used first
+        self.nBytes = 0;
+        self.hits = self.misses = self.evictions = 0;
+        self.lock = threading.Lock();
+    
+    def get(self, key, build):
+        "Returns the program at key, calling build() on a miss."
+        with self.lock:
+            entry = self.entries.pop(key, None);
+            if entry is not None:
+                self.entries[key] = entry;                      # re-inserted as the most recently used
+                self.hits += 1;
+                return entry[0];
+            self.misses += 1;
+        program = build();                                      # Built outside the lock, as parsing may be slow (or raise).
+        size = programSize(program);                            # Cached programs are shared by all Runtimes, and are safe
+        with self.lock:                                         #    to share as running them never mutates them (see Function).
+            if key not in self.entries and size <= self.maxBytes:
+                self.entries[key] = (program, size);
+                self.nBytes += size;
+                self.evict();
+        return program;
+    
+    def evict(self):
+        "Drops least recently used entries, until within bounds."
+        while self.entries and (len(self.entries) > self.maxEntries or self.nBytes > self.maxBytes):
+            _, (_, size) = self.entries.popitem(last=False);
+            self.nBytes -= size;
+            self.evictions += 1;
+    
+    def clear(self):
+        "Empties the cache. (Statistics are kept.)"
+        with self.lock:
+            self.entries.clear();
+            self.nBytes = 0;
+    
+    def stats(self):
+        "Reports hits, misses, evictions & current usage."
+        with self.lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.nBytes#,
+            };
+
+programCache = ProgramCache();                                  # shared by all Runtimes (by default)
+
+#############################################################
+engines = {                                                     # How a Runtime executes parse trees:
+    'tree': None,                                               #    'tree':    interpreted directly via run(),
+    'closure': compileTree,                                     #    'closure': compiled to nested closures via compileTree(),
+    'python': transpile,                                        #    'python':  translated to Python source via transpile(),
+    'vm': assemble#,                                            #    'vm':      assembled into bytecode via assemble().
+};
+
 class Runtime(object):
     "Represents a context for running (possibly many) programs."
     
-    def __init__(self, maxLoopTime=None, maxDepth=None, writer=sys.stdout.write):
+    def __init__(self, maxLoopTime=None, maxDepth=None, writer=sys.stdout.write, engine='tree', cache=programCache, cacheDir=True,
+                 maxFuel=None, maxRunTime=None, maxMemory=None, gEnv=None, base=None):
         "Initializes a Runtime, which has a single global Env."
-        self.gEnv = makeEnvClass(maxDepth)();
         self.writer = writer;
-        addNatives(self.gEnv, inbuilts(self.writer));
+        if gEnv is None:                                        # gEnv is given by Snapshot.fork(), & made by makeEnvClass(maxDepth).
+            gEnv = makeEnvClass(maxDepth)();
+            if base is None: addNatives(gEnv, inbuilts(self.writer));
+            else: gEnv.base = base.env;                         # Globals not set by the Runtime are read from its Base, if any.
+        self.gEnv = gEnv;
+        self.base = base;
         self.maxDepth = maxDepth;
         self.maxLoopTime = maxLoopTime;
+        if engine not in engines:
+            raise ValueError('unknown engine ' + repr(engine));
+        self.engine = engine;                                   # See `engines` (above).
+        self.cache = cache;                                     # A ProgramCache, or None (for no caching).
+        self.cacheDir = cacheDir;                               # Where .l.js files are precompiled to. True (for __ljcache__
+                                                                #    beside each file), a directory, or None (for not at all).
+        self.maxFuel = maxFuel;                                 # Units of fuel (see Fuel) that each run may burn, if set.
+        self.maxRunTime = maxRunTime;                           # Seconds that each run may take, if set. (Checked along w/ fuel.)
+        self.fuelUsed = 0;                                      # Units of fuel burnt by the latest run.
+        self.maxMemory = maxMemory;                             # Bytes that each run may allocate, if set. (Approximate; see Fuel.)
+        self.memoryAllocated = 0;                               # Bytes allocated by the latest run, & at most by any one run.
+        self.memoryAllocatedPeak = 0;                           #    (Not bytes in use: see Fuel.allocated.)
+        self.fuel = None;                                       # Fuel of the run (or call) in progress, if any. Natives that call
+                                                                #    back into LittleJ (see current) burn it too.
+        self.lock = threading.RLock();                          # Held while running (or calling), so that a Runtime runs one
+                                                                #    thread's program at a time. (See enter.)
     
     def addNatives(self, dicty):
         "Adds native functions to the Runtimes' global Env."
         addNatives(self.gEnv, dicty);
     
+    def loadStdlib(self, native=False):                         # Either way, string, array & object are defined globally. The
+        "Runs stdlib.l.js, or adds its native twin."            #    native helpers behave alike (see nativeStdlib), but run faster.
+        if native:
+            self.addNatives(nativeStdlib(self.gEnv));
+        else:
+            self.runG(stdlibPath);
+    
     def run(self, prog, env=None, console=False): # console <--> isInConsoleMode?
         "Runs a program in any  environment `env`."
         try:
             if env is None: env = self.gEnv;                    # We cannot use `run(.. env=self.gEnv ..)` as `self` is not defined
             tree = None; # parse tree                           # at the time of evaluating arguments. This is a work-around.
-            if type(prog) is list:
+            if isa(prog, Resolved):
+                tree = prog;
+            elif type(prog) is list:
                 tree = prog;
-            elif type(prog) is str and prog.endswith('.l.js'):
-                with open(prog) as f:
-                    tree = yacc(lex(f.read()));
             elif type(prog) is str:
-                tree = yacc(lex(prog));
+                tree = self.load(prog);
             else:
                 raise TypeError('bad input to Runtime.run()');
             writer = self.writer if console else None;
-            run(tree, env, self.maxLoopTime, writer);
+            if type(tree) is list and engines[self.engine]:
+                tree = engines[self.engine](tree);
+            fuel = Fuel(self.maxFuel, self.maxRunTime, self.maxMemory);
+            prev = self.enter(fuel);
+            try:
+                if type(tree) is list:
+                    checkCompletion(run(tree, env, self.maxLoopTime, writer, False, fuel));
+                else:
+                    tree.run(env, self.maxLoopTime, writer, fuel);
+            finally:
+                self.leave(prev, fuel);
         except LJErr as e:
             print('%s: %s' % (type(e).__name__[2:] + 'or' , e))
         except LJJump as e:
@@ -1383,6 +3310,110 @@ class Runtime(object):
             else:
                 raise e; # unexpected
     
+    def enter(self, fuel):
+        "Notes a run (or call) starting, w/ its fuel."       # Returns what leave() restores, as runs may nest (via natives).
+        self.lock.acquire();                                    # Other threads wait for the run to end. The same thread may
+        prev = (current.runtime, self.fuel);                    #    re-enter, as the lock is an RLock.
+        current.runtime, self.fuel = self, fuel;
+        return prev;
+    
+    def leave(self, prev, fuel):
+        "Notes a run (or call) ending, & records its usage."
+        try:
+            current.runtime, self.fuel = prev;
+            self.noteUsage(fuel);
+        finally:
+            self.lock.release();
+    
+    def noteUsage(self, fuel):
+        "Records the fuel & memory used by a run."
+        self.fuelUsed = fuel.used();
+        self.memoryAllocated = fuel.allocated();
+        self.memoryAllocatedPeak = max(self.memoryAllocatedPeak, fuel.allocatedPeak());
+    
+    def snapshot(self):
+        "Captures the global Env, for forking (see Snapshot)."
+        return Snapshot(self);
+    
+    def settings(self):
+        "Returns the arguments the Runtime was made with."   # (but for gEnv)
+        return {
+            'maxLoopTime': self.maxLoopTime, 'maxDepth': self.maxDepth, 'writer': self.writer,
+            'engine': self.engine, 'cache': self.cache, 'cacheDir': self.cacheDir,
+            'maxFuel': self.maxFuel, 'maxRunTime': self.maxRunTime, 'maxMemory': self.maxMemory,
+            'base': self.base#,
+        };
+    
+    def freeze(self):
+        "Freezes the global Env into a Base; starts afresh on it."
+        base = Base(self.gEnv);
+        self.gEnv = makeEnvClass(self.maxDepth)();
+        self.gEnv.base, self.base = base.env, base;
+        return base;
+    
+    def get(self, name):
+        "Returns the value of a global variable."
+        return self.gEnv.lookup(Name(name));                    # (Raises LJReferenceErr if undefined.)
+    
+    def call(self, func, *args):                                # Unlike run(), errors are raised (not printed), for the host to handle.
+        "Calls a function (or global, by name) w/ Python args."  # Each call is metered like a run (see maxFuel).
+        if isinstance(func, basestring):
+            func = self.get(func);
+        args = [ljValue(arg) for arg in args];
+        fuel = Fuel(self.maxFuel, self.maxRunTime, self.maxMemory);
+        prev = self.enter(fuel);
+        try:
+            return callValue(func, args, self.gEnv, Context(self.maxLoopTime, None, self.gEnv.maxDepth, fuel));
+        except LJBreak:
+            raise LJSyntaxErr('unexpected break statement');
+        finally:
+            self.leave(prev, fuel);
+    
+    def callMany(self, func, argTuples, catch=False):           # The function is looked up (& compiled) once, and a single Context
+        "Calls a function w/ each tuple of args; yields values."  # is shared. Each call is metered separately, like a run.
+        if isinstance(func, basestring):                        # If catch is set, an LJErr raised by a call is yielded (instead of
+            func = self.get(func);                              #    its value), and the remaining calls are still made.
+        if type(func) is Function:
+            body, nParams = compileFunction(func), len(func.params);
+            if self.gEnv.maxDepth and 1 >= self.gEnv.maxDepth:
+                raise LJRuntimeErr('maximum call depth exceeded');
+        ctx = Context(self.maxLoopTime, None, self.gEnv.maxDepth);
+        for args in argTuples:
+            args = [ljValue(arg) for arg in args];
+            ctx.fuel = fuel = Fuel(self.maxFuel, self.maxRunTime, self.maxMemory);
+            prev = self.enter(fuel);
+            try:
+                if type(func) is not Function:
+                    val = callValue(func, args, self.gEnv, ctx);
+                elif len(args) != nParams:
+                    raise LJTypeErr('incorrect no. of arguments ... (%s)' % lj_repr(args)[1:-1]);
+                else:                                           # (as by callFunction, w/o its per-call checks)
+                    fuel.tank -= 1;
+                    if fuel.tank < 0: fuel.refill();
+                    val = body(func.crEnv, args, 1, ctx);
+                    if type(val) is TailCall:
+                        val = callFunction(val.func, val.args, self.gEnv, ctx, 1);
+            except LJBreak:
+                val = LJSyntaxErr('unexpected break statement');
+                if not catch: raise val;
+            except LJErr as e:
+                if not catch: raise;
+                val = e;
+            finally:
+                self.leave(prev, fuel);
+            yield val;
+    
+    def load(self, prog):
+        "Parses (& compiles) source, or a .l.js file, w/ caching."
+        def build():
+            if prog.endswith('.l.js'):
+                return loadFile(prog, self.engine, self.cacheDir);
+            tree = optimize(yacc(lex(prog)));                    # Source is optimized once, as it's loaded.
+            return engines[self.engine](tree) if engines[self.engine] else tree;
+        if self.cache is None:
+            return build();
+        return self.cache.get(programKey(prog, self.engine), build);
+    
     def runG(self, prog, console=False):                            # Note: run(prog) and runG(prog) 
         "Runs the program in the Runtime's global environment."     #       have exactly the same effect.
         self.run(prog, env=self.gEnv, console=console);             # But the second is more explicit,
@@ -1392,8 +3423,186 @@ class Runtime(object):
         self.run(prog, env=self.gEnv.makeChild(), console=console);
     
     def runX(self, prog, console=False):
-        tmpRT = Runtime(self.maxDepth, self.maxLoopTime, self.writer);
+        "Runs program in a fresh Runtime, w/ the same settings."
+        tmpRT = Runtime(**self.settings());
         tmpRT.runG(prog, console);
+        self.fuelUsed, self.memoryAllocated = tmpRT.fuelUsed, tmpRT.memoryAllocated;
+        self.memoryAllocatedPeak = max(self.memoryAllocatedPeak, tmpRT.memoryAllocatedPeak);
+
+class Snapshot(object):                                         # A snapshot holds a copy of a Runtime's global Env, & all that it
+    "A frozen copy of a Runtime's global Env, for forking."     #    reaches: objects, arrays, Functions, & the Envs (or Frames) they
+    def __init__(self, rt):                                     #    were created in. So, later changes to the Runtime don't show up
+        self.settings = rt.settings();                          #    in the snapshot, which is never run itself.
+        self.gEnv = copyEnv(rt.gEnv, makeEnvClass(rt.maxDepth));    # Each fork gets a copy of its own, & so is isolated from the
+                                                                #    others. (Copy-on-write isn't possible, as values are plain
+    def fork(self, **settings):                                 #    lists & dicts.) Copying is still much faster than re-running
+        "Creates a Runtime from the snapshot."                  #    libraries, as code, strings & natives are shared, not copied.
+        settings = dict(self.settings, **settings);             # Settings (see Runtime) default to those of the snapshot's Runtime.
+        gEnv = copyEnv(self.gEnv, makeEnvClass(settings['maxDepth']));
+        return Runtime(gEnv=gEnv, **settings);
+
+def copyEnv(gEnv, Env):                                         # Copies are made w/ an explicit stack (`todo`), so that deep values
+    "Copies a global Env & the values it reaches."              #    can't exhaust Python's stack. `memo` maps id(original) to its copy,
+    memo = {};                                                  #    so that shared (& cyclic) values stay shared once copied.
+    todo = [];
+    def copy(x):
+        "Returns the copy of x, queueing it to be filled in."
+        t = type(x);
+        if t is float or t is str or t is bool or x is None:
+            return x;
+        if id(x) in memo:
+            return memo[id(x)];
+        if id(x) in frozenIds:
+            return x;                                           # shared w/ the Base
+        if t is list or t is dict:
+            y = t();
+        elif t is Function:
+            y = Function(x.params, x.tree, x.iTokens);          # The template & compiled body are shared.
+            y.body, y.template = x.body, x.template or x;
+        elif t is Frame:
+            y = Frame.__new__(Frame);
+            y.depth = x.depth;
+        elif isa(x, dict):                                      # an Env (whose class depends on its Runtime)
+            y = dict.__new__(Env);
+            y.isGlobal, y.depth, y.base = x.isGlobal, x.depth, x.base;
+        else:
+            return x;                                           # natives, UNSET etc. are shared
+        memo[id(x)] = y;
+        todo.append((x, y));
+        return y;
+    root = copy(gEnv);
+    while todo:
+        x, y = todo.pop();
+        t = type(x);
+        if t is list:
+            y.extend([copy(val) for val in x]);
+        elif t is Function:
+            y.crEnv = copy(x.crEnv);
+        elif t is Frame:
+            y.vals = [copy(val) for val in x.vals];
+            y.parent, y.env = copy(x.parent), copy(x.env);
+        else:                                                   # dicts & Envs
+            for key, val in x.iteritems(): y[key] = copy(val);
+            if t is not dict: y.parent = copy(x.parent);
+    return root;
+
+class Base(object):                                             # A Base is a global Env (& all that it reaches) made read-only, so
+    "A frozen global Env, shared by Runtimes built on it."      #    that many Runtimes can share it, instead of each loading its own
+    def __init__(self, gEnv):                                   #    copy of stdlib.l.js & other libraries. Each Runtime's own gEnv is
+        if gEnv.base is not None:                               #    then an overlay: reads fall through to the Base, & writes (even
+            for key, val in gEnv.base.iteritems():              #    to a name from the Base) land in the overlay. So, per-Runtime
+                if key not in gEnv: gEnv[key] = val;            #    memory scales with the Runtime's own state only.
+            gEnv.base = None;                                   # Bases of Bases are flattened, & nothing that a Base reaches can
+        self.env = freezeEnv(gEnv);                             #    change (see freezeEnv).
+
+def freezeEnv(gEnv):                                            # The id of every value reached is counted in frozenIds, so that
+    "Makes a global Env & the values it reaches read-only."     #    objects & arrays can't be changed (see checkMutable). Envs &
+    seen = {};                                                  #    Frames can't be assigned to either, so closures in a Base can't
+    todo = [gEnv];                                              #    keep state.
+    while todo:                                                 # The values are kept alive by the Env (so that their ids aren't
+        x = todo.pop();                                         #    reused) for as long as it lives, & no longer: they're uncounted
+        t = type(x);                                            #    once it's collected, via a weakref.
+        if t is float or t is str or t is bool or x is None or id(x) in seen:
+            continue;
+        if t is list:
+            todo.extend(x);
+        elif t is dict:
+            todo.extend(x.itervalues());
+        elif t is Function:
+            todo.append(x.crEnv);
+        elif t is Frame:
+            if type(x.vals) is not FrozenVals: x.vals = FrozenVals(x.vals);
+            todo.extend(x.vals);
+            todo.append(x.parent);
+        elif isa(x, dict):                                      # an Env
+            x.__class__ = x.Frozen;
+            todo.extend(x.itervalues());
+            todo.append(x.parent);
+        else:
+            continue;                                           # natives, UNSET etc.
+        seen[id(x)] = x;
+    gEnv.frozenValues = seen.values();
+    ids = seen.keys();
+    def release(ref):
+        with frozenLock:
+            for i in ids:
+                frozenIds[i] -= 1;
+                if not frozenIds[i]: del frozenIds[i];
+            del baseRefs[id(ref)];
+    with frozenLock:
+        for i in ids: frozenIds[i] = frozenIds.get(i, 0) + 1;
+        ref = weakref.ref(gEnv, release);
+        baseRefs[id(ref)] = ref;
+    return gEnv;
+
+class RuntimePool(object):                                    # Pooled Runtimes share a Base, built by running warmup(rt) (if
+    "Runtimes that share a Base, reset when returned."          #    given) on a fresh Runtime, e.g. `lambda rt: rt.loadStdlib()`.
+                                                                # As a Base can't change, returning a Runtime only has to empty its
+    def __init__(self, size=4, warmup=None, **settings):        #    own global Env (& restore its attributes), which costs about as
+        rt = Runtime(**settings);                               #    much as the changes made while checked out.
+        if warmup is not None: warmup(rt);                      # Settings (see Runtime) apply to all pooled Runtimes.
+        self.base = rt.freeze();
+        settings['base'] = self.base;
+        self.idle = [Runtime(**settings) for i in xrange(size)];
+        self.states = dict((id(rt), dict(rt.__dict__)) for rt in self.idle);
+        self.out = set();                                       # ids of checked out Runtimes
+        self.size = size;
+        self.checkouts = self.waits = self.resets = 0;
+        self.cond = threading.Condition();
+    
+    def checkout(self, timeout=None):
+        "Takes an idle Runtime, waiting for one if need be."
+        with self.cond:
+            if not self.idle:
+                self.waits += 1;
+                end = None if timeout is None else time.time() + timeout;
+                while not self.idle:
+                    left = None if end is None else end - time.time();
+                    if left is not None and left <= 0:
+                        raise RuntimeError('no Runtime available');
+                    self.cond.wait(left);
+            rt = self.idle.pop();
+            self.out.add(id(rt));
+            self.checkouts += 1;                                # (only once a Runtime is had, so timeouts aren't counted)
+            return rt;
+    
+    def checkin(self, rt):
+        "Resets a Runtime, & returns it to the pool."
+        with self.cond:
+            if id(rt) not in self.out:
+                raise ValueError('Runtime not checked out from this pool');
+            state = self.states[id(rt)];
+            if not state['lock'].acquire(False):                # running in another thread (see Runtime.enter)
+                raise RuntimeError('Runtime still running');
+            try:
+                if rt.fuel is not None:                         # running in this thread, e.g. via a native
+                    raise RuntimeError('Runtime still running');
+                state['gEnv'].clear();
+                rt.__dict__.clear();
+                rt.__dict__.update(state);
+            finally:
+                state['lock'].release();
+            self.out.remove(id(rt));
+            self.resets += 1;
+            self.idle.append(rt);
+            self.cond.notify();
+    
+    @contextlib.contextmanager
+    def runtime(self, timeout=None):
+        "Checks a Runtime out, for the duration of a with block."
+        rt = self.checkout(timeout);
+        try:
+            yield rt;
+        finally:
+            self.checkin(rt);
+    
+    def stats(self):
+        "Reports checkouts, waits, resets & idle Runtimes."
+        with self.cond:
+            return {
+                'size': self.size, 'idle': len(self.idle),
+                'checkouts': self.checkouts, 'waits': self.waits, 'resets': self.resets#,
+            };
 
 def console(rt=None, semify=False, prompt='LJ> '):       # semify __tries__ to auto-appends semicolons (as required)
     "This is REPL-like, but not really a REPL."
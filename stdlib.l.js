@@ -140,16 +140,33 @@ var string = {}, array = {}, object = {};
         return ans;
     };
     array.sortBy = function (a, f) {
-        var i = null, j = null, tmp = null, la = len(a);
-        for (i = 0; i < la - 1; i += 1) {
-            for (j = i + 1; j < la; j += 1) {
-                if (f(a[i], a[j]) > 0) {    // sort is stable
-                    tmp = a[i];
-                    a[i] = a[j];
-                    a[j] = tmp;
+        var src = null, dst = null, i = null, j = null, lo = null, mid = null, hi = null,
+            width = 1, la = len(a);
+        if (la < 2) { return a; }
+        src = array.slice(a, null, null);
+        while (width < la) {    // bottom-up merge sort, which is stable
+            dst = [];
+            for (lo = 0; lo < la; lo += 2 * width) {
+                mid = lo + width;
+                if (mid > la) { mid = la; }
+                hi = mid + width;
+                if (hi > la) { hi = la; }
+                i = lo;
+                j = mid;
+                while (i < mid || j < hi) {
+                    if (j === hi || (i < mid && !(f(src[i], src[j]) > 0))) {
+                        append(dst, src[i]);
+                        i += 1;
+                    } else {
+                        append(dst, src[j]);
+                        j += 1;
+                    }
                 }
             }
+            src = dst;
+            width = width * 2;
         }
+        for (i = 0; i < la; i += 1) { a[i] = src[i]; }
         return a;
     };
     array.sort = function (a) {
@@ -235,6 +252,6 @@ var string = {}, array = {}, object = {};
         return array.foldr(array.upto(a, -1), f, a[len(a) - 1]);
     };
     object.keys = keys;
-    object.hasOwnProperty = function (o, s) { return array.index(keys(o), s, null) !== -1; };
+    object.hasOwnProperty = function (o, s) { return array.index(keys(o), s) !== -1; };
     return null;
 }());
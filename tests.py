@@ -12,7 +12,9 @@
 #                                                                           #
 #############################################################################
 
-from jispy import lex, yacc, Runtime;
+import os, sys, shutil, tempfile, StringIO, threading, time, gc, jispy;
+from multiprocessing.pool import ThreadPool;
+from jispy import lex, yacc, optimize, sym, compileTree, transpile, assemble, Runtime, ProgramCache, ljcPath, LJErr, RuntimePool, frozenIds;
 
 tests = [
     '''    // Test-0: testing for loop (factorial)
@@ -452,6 +454,92 @@ tests = [
         
         print (add1(1) === 2 && add100(100) === 200);
     ''',
+    # -------------------------------------------------------
+    ''' // Test-33: operator precedence, grouping & unary operators
+        var a = [1, 2, 3], o = {k: {v: 4}}, x = 10,
+            f = function (n) { return function (m) { return n * m; }; };
+        x -= 2 + 3;                                         // x = x - (2 + 3)
+        print(1 + 2 * 3 === 7 && (1 + 2) * 3 === 9 && 10 - 4 - 3 === 3 &&
+              -a[1] * 2 === -4 && !a[0] === false && 2 * -o.k.v === -8 &&
+              f(2)(3) === 6 && x === 5 && 'a' + 'b' < 'ac');
+    ''',
+    # -------------------------------------------------------
+    ''' // Test-34: each evaluation of a function literal creates a new function
+        var fs = [], i = 0;
+        for (i = 0; i < 3; i += 1) { append(fs, function (x) { return x * 2; }); }
+        print(fs[0] !== fs[1] && fs[2](fs[1](fs[0](1))) === 8);
+    ''',
+    # -------------------------------------------------------
+    ''' // Test-35: lexical scoping, shadowing & closures over outer vars
+        var a = 'g', n = 0,
+            f = function () { var b = a, a = 1; return b + str(a); },
+            mk = function (x) {
+                var count = function (y) { x += y; n += 1; return x; };
+                return count;
+            },
+            c1 = mk(10), c2 = mk(20);
+        c1(1); c2(2);
+        print(f() === 'g1' && c1(1) === 12 && c2(0) === 22 && n === 4 && a === 'g');
+    ''',
+    # -------------------------------------------------------
+    ''' // Test-36: return & break from within nested blocks and loops
+        var find = function (grid, x) {
+                var i = 0, j = 0;
+                for (i = 0; i < len(grid); i += 1) {
+                    for (j = 0; j < len(grid[i]); j += 1) {
+                        if (grid[i][j] === x) { return [i, j]; }
+                        if (grid[i][j] === null) { break; }
+                    }
+                }
+                return null;
+            },
+            g = [[1, null, 7], [3, 4, 5]];
+        print(find(g, 5)[1] === 2 && find(g, 7) === null && find(g, 3)[0] === 1);
+    ''',
+    # -------------------------------------------------------
+    ''' // Test-37: tail calls don't nest (beyond maxDepth), but calls within loops do
+        var sum = function (n, acc) { if (n === 0) { return acc; } return sum(n - 1, acc + n); },
+            isEven = function (n) { if (n === 0) { return true; } return isOdd(n - 1); },
+            isOdd = function (n) { if (n === 0) { return false; } return isEven(n - 1); },
+            brk = function () { break; },
+            f = function () { var i = 0; while (i < 3) { i += 1; return brk(); } return i; };
+        print(sum(1000, 0) === 500500 && isEven(1001) === false && f() === 1);
+    ''',
+    ''' // Test-38: && and || evaluate their right operand only if needed
+        var count = 0, tick = function (x) { count += 1; return x; },
+            pSquare = function (n) {
+                if (type(n) === 'number' && n > 0) { return n * n; }
+                return 'bad input';
+            },
+            ok = pSquare('what?') === 'bad input' && pSquare(3) === 9;
+        ok = ok && (false && tick(1)) === false && (0 || tick('')) === '' && ('a' || tick(1)) === 'a';
+        ok = ok && (tick(1) && tick(2) && tick(0) && tick(3)) === 0 && (null || false || tick(4)) === 4;
+        print(ok && count === 5);
+    ''',
+    ''' // Test-39: constant expressions & branches behave alike, whether or not folded
+        var day = 60 * 60 * 24, s = 'pre' + 'fix', f = null, g = null, ok = !true === false;
+        f = function (x) { if (x) { return -'a'; } return 1; };    // ill-typed, but never run
+        g = function () { while (false) { return 1; } if (0) { return 2; } else if ('') { return 3; }
+                          else { return 4; return 5; } return 6; };
+        if (false) { ok = false; } else { ok = ok && day === 86400 && s === 'prefix'; }
+        print(ok && f(false) === 1 && g() === 4 && (1 || f(true)) === 1 && (null && f(true)) === null);
+    ''',
+    ''' // Test-40: counted loops (break, final values, a changing bound & a callee assigning the counter)
+        var i = 0, n = 5, ok = true,
+            f = function () {
+                var j = 0, out = [], bump = function () { j += 2; return null; };
+                for (j = 0; j < 10; j += 1) { if (j === 4) { break; } }
+                append(out, j);
+                for (j = 10; j > 0; j -= 3) { append(out, j); }
+                append(out, j);
+                for (j = 0; j <= 6; j += 1) { bump(); }
+                append(out, j);
+                return out;
+            };
+        for (i = 0; i < n; i += 1) { n -= 1; }
+        ok = i === 3 && n === 2;
+        print(ok && str(f()) === str([4, 10, 7, 4, 1, -2, 9]));
+    ''',
 ];
 
 j = -1;
@@ -465,3 +553,410 @@ for prog in tests:
     #print 'tree     -->\n', tree, '\n';
     rt = Runtime(maxLoopTime=13, maxDepth=100);
     rt.run(tree);
+
+for compiler in [compileTree, transpile, assemble]:                   # Again, with each tree compiled by each compiler.
+    j = -1;
+    for prog in tests:
+        j += 1;
+        print compiler.__name__ + ' ' + str(j) + '. ',
+        tree = yacc(lex(prog));
+        rt = Runtime(maxLoopTime=13, maxDepth=100);
+        rt.run(compiler(tree));
+
+cache = ProgramCache();                                     # Again, from source. The second run of each is a cache hit,
+for engine in ['tree', 'closure', 'python', 'vm']:                #    and must behave exactly like the first.
+    j = -1;
+    for prog in tests * 2:
+        j += 1;
+        print 'cached ' + engine + ' ' + str(j % len(tests)) + '. ',
+        rt = Runtime(maxLoopTime=13, maxDepth=100, engine=engine, cache=cache);
+        rt.run(prog);
+stats = cache.stats();
+print 'cache stats. ', str(stats['misses'] == stats['hits'] == 4 * len(tests) and stats['evictions'] == 0).lower();
+
+tmpDir = tempfile.mkdtemp();                                # Again, from .l.js files precompiled to (& reloaded from) disk.
+try:
+    path = os.path.join(tmpDir, 'test.l.js');
+    for engine in ['tree', 'closure', 'python', 'vm']:
+        for j in range(len(tests)):
+            with open(path, 'w') as f:
+                f.write(tests[j]);
+            for attempt in ['cold', 'warm', 'corrupt']:
+                print 'precompiled ' + engine + ' ' + attempt + ' ' + str(j) + '. ',
+                if attempt == 'corrupt':
+                    with open(ljcPath(path, engine, tmpDir), 'r+b') as f:
+                        f.seek(-7, 2); f.write('garbage');
+                rt = Runtime(maxLoopTime=13, maxDepth=100, engine=engine, cache=None, cacheDir=tmpDir);
+                rt.run(path);
+finally:
+    shutil.rmtree(tmpDir);
+
+deepTests = [                                               # Only the VM runs these, as other engines recurse in Python.
+    ''' // Deep-0: recursive clone of a deeply nested object
+        var depth = 20000, i = 0, deep = {child: null},
+            clone = function (o) {
+                var out = {}, ks = keys(o), j = 0;
+                for (j = 0; j < len(ks); j += 1) {
+                    if (type(o[ks[j]]) === 'object') { out[ks[j]] = clone(o[ks[j]]); }
+                    else { out[ks[j]] = o[ks[j]]; }
+                }
+                return out;
+            },
+            height = function (o) { if (o.child === null) { return 0; } return 1 + height(o.child); };
+        for (i = 0; i < depth; i += 1) { deep = {child: deep}; }
+        print(height(clone(deep)) === depth && str(clone(deep)) === str(deep));
+    ''',
+    ''' // Deep-1: mutual recursion
+        var isEven = function (n) { if (n === 0) { return true; } return isOdd(n - 1); },
+            isOdd = function (n) { if (n === 0) { return false; } return isEven(n - 1); };
+        print(isEven(30000) && isOdd(30001));
+    ''',
+];
+
+rt = Runtime();                                             # Names that neither the program nor the environment declares are
+rt.run('var g = 1;');                                       #    reported before running, by each compiler alike.
+for compiler in [compileTree, transpile, assemble]:
+    print 'missing names ' + compiler.__name__ + '. ',
+    bad = compiler(yacc(lex('var a = b, f = function (x) { var y = x; return y + a + g + len([c]); }; print(d);')));
+    good = compiler(yacc(lex('var a = g, f = function (x) { var y = x; return y + a + len([f]); }; print(f(2));')));
+    print str(bad.missingNames(rt.gEnv) == ['b', 'c', 'd'] and good.missingNames(rt.gEnv) == []).lower();
+
+print 'optimizer. ',                                        # Well-typed constants are folded; ill-typed ones are kept, to raise when run.
+print str(optimize(yacc(lex("var a = -'a', b = 60 * 60; if (true) { a = 1; } else { a = 2; }"))) == [
+    ['init', 'a', ['unop', sym('-'), ['literal', 'a']]], ['init', 'b', ['literal', 3600.0]],
+    ['assign', ['name', 'a'], ['literal', 1.0]]#,
+]).lower();
+
+j = -1;
+for prog in deepTests:
+    j += 1;
+    print 'deep vm ' + str(j) + '. ',
+    Runtime(engine='vm').run(prog);
+
+print 'deep vm (calling a tree-made function). ',     # Functions made by other engines are called without recursion too.
+rt = Runtime();
+rt.run('var count = function (n) { if (n === 0) { return 0; } return 1 + count(n - 1); };');
+rt.run(assemble(yacc(lex('print(count(20000) === 20000);'))));
+
+for engine in ['tree', 'closure', 'python', 'vm']:         # Tail-recursive loops run past maxDepth (at their caller's depth), &
+    print 'tail calls ' + engine + '. ',                    #    fuel stops runaway ones. Other recursion still counts toward maxDepth.
+    rt = Runtime(engine=engine, maxDepth=100, maxFuel=100000);
+    out, sys.stdout = sys.stdout, StringIO.StringIO();
+    try:
+        rt.runC('var f = function (n) { return f(n + 1); }; f(0);');
+        rt.runC('var f = function (n) { if (n === 0) { return 0; } return 1 + f(n - 1); }; f(500);');
+    finally:
+        out, sys.stdout = sys.stdout.getvalue(), out;
+    rt.runG('var sum = function (n, acc) { if (n === 0) { return acc; } return sum(n - 1, acc + n); };');
+    print str(out == 'RuntimeError: out of fuel\nRuntimeError: maximum call depth exceeded\n' and
+        rt.call('sum', 5000, 0) == 12502500 and list(rt.callMany('sum', [(500, 0), (1000, 0)])) == [125250, 500500]).lower();
+
+fuelUsed = [];                                              # Fuel is deterministic: each engine burns exactly as much, on each run,
+for engine in ['tree', 'closure', 'python', 'vm']:         #    & stops runaway programs once out of it.
+    print 'fuel ' + engine + '. ',
+    rt = Runtime(engine=engine, maxFuel=1000);
+    out, sys.stdout = sys.stdout, StringIO.StringIO();
+    try:
+        rt.run('var n = 0; while (true) { n += 1; }');
+    finally:
+        out, sys.stdout = sys.stdout.getvalue(), out;
+    stopped = out == 'RuntimeError: out of fuel\n' and rt.fuelUsed > 1000;
+    rt.maxFuel = None;
+    for _ in range(2):
+        rt.runC('''var f = function (n) { if (n < 2) { return n; } return f(n - 1) + f(n - 2); }, i = 0, s = 0;
+            for (i = 0; i < 50; i += 1) { s += f(i % 7); }''');
+        fuelUsed.append(rt.fuelUsed);
+    print str(stopped and fuelUsed[-1] > 0 and len(set(fuelUsed)) == 1).lower();
+
+allocations = [];                                           # Memory is metered alike by each engine, & runaway allocation stops
+for engine in ['tree', 'closure', 'python', 'vm']:         #    once maxMemory is exceeded.
+    print 'memory ' + engine + '. ',
+    rt = Runtime(engine=engine, maxMemory=10 ** 6);
+    out, sys.stdout = sys.stdout, StringIO.StringIO();
+    try:
+        rt.runC("var s = 'ab'; while (true) { s += s; }");
+        rt.runC("var a = []; while (true) { append(a, [a]); }");
+        rt.runC("var o = {}, i = 0; while (true) { o[str(i)] = {}; i += 1; }");
+        rt.runC('''var s = 'x', a = [], i = 0; while (len(s) < 10000) { s += s; }
+            for (i = 0; i < 200; i += 1) { append(a, s + '!'); }''');    # each new string is counted whole
+    finally:
+        out, sys.stdout = sys.stdout.getvalue(), out;
+    stopped = out == 'RuntimeError: out of memory\n' * 4 and rt.memoryAllocatedPeak > 10 ** 6;
+    rt.runC('''var a = [], s = '', i = 0;
+        for (i = 0; i < 100; i += 1) { s += 'x'; append(a, {s: s}); }
+        while (len(a) > 50) { del(a, 0); }''');
+    allocations.append((rt.memoryAllocated, rt.memoryAllocatedPeak));
+    print str(stopped and 0 < rt.memoryAllocated < 10 ** 6 and len(set(allocations)) == 1).lower();
+
+for engine in ['tree', 'closure', 'python', 'vm']:         # Functions are called from Python directly, w/ converted arguments.
+    print 'call ' + engine + '. ',
+    rt = Runtime(engine=engine, maxDepth=100);
+    rt.run('''var add = function (a, b) { return a + b; }, k = 7,
+        same = function (o) { return o.a === o.b && len(o.a) === 2; },
+        tally = function (xs) { var i = 0, t = 0; for (i = 0; i < len(xs); i += 1) { t += xs[i]; } return t; };''');
+    shared = (1, 2);
+    ok = rt.call('add', 1, 2) == 3.0 and rt.call(rt.get('add'), 'a', u'b') == 'ab' and rt.get('k') == 7.0;
+    ok = ok and rt.call('same', {'a': shared, u'b': shared}) is True and rt.call('tally', range(10)) == 45.0;
+    ok = ok and rt.call('len', [[1], {}]) == 2.0 and rt.fuelUsed == 0;
+    try: rt.call('add', 1); ok = False;
+    except LJErr: pass;
+    batch = [(j, 1) for j in range(5)] + [(1,), ('a', 1), (2, 2)];     # Batches may capture errors per call, or stop at the first.
+    vals = list(rt.callMany('add', batch, catch=True));
+    ok = ok and vals[:5] == [1.0, 2.0, 3.0, 4.0, 5.0] and vals[7] == 4.0;
+    ok = ok and isinstance(vals[5], LJErr) and isinstance(vals[6], LJErr);
+    vals = [];
+    try: vals.extend(rt.callMany(rt.get('add'), batch)); ok = False;
+    except LJErr: ok = ok and len(vals) == 5;
+    for maxFuel in range(8):                                # Batched calls are metered just like single ones.
+        rt.maxFuel, outs = maxFuel, [];
+        for calls in [lambda: [rt.call('tally', [1, 2])], lambda: list(rt.callMany('tally', [([1, 2],)]))]:
+            try: outs.append((calls(), rt.fuelUsed));
+            except LJErr as e: outs.append((str(e), rt.fuelUsed));
+        ok = ok and outs[0] == outs[1];
+    print str(ok).lower();
+
+stdlibPrelude = '''var s = 'Hello, World', cs = ['a', 'b', 'c'], a = [5, 'b', 3, 'a', 1], nums = [1, 2, 3, 4], o = {k: [1], j: null},
+    ps = [[2, 'a'], [1, 'b'], [2, 'c'], [1, 'd'], [0, 'e'], [2, 'f']], byKey = function (x, y) { return x[0] - y[0]; },
+    isNum = function (x) { return type(x) === 'number'; }, add = function (x, y) { return x + y; },
+    sub = function (x, y) { return x - y; }, brk = function (x) { break; }, r = null;
+'''
+stdlibCases = '''
+    string.charCodeAt(s, 1) | string.charCodeAt(s, 99) | string.concat(s, '!') | string.concat(s, 1)
+    string.slice(s, 2, -3) | string.slice(s, null, null) | string.slice(s, -20, 4) | string.slice(s, 3, 2.5)
+    string.slice(s, 0.5, 3) | string.slice(s, 1, 2.5) | string.slice(cs, 1, 3) | string.slice(a, 0, 2)
+    string.slice(5, 0, 1) | string.slice(o, 0, 1) | string.slice(o, 1, 0) | string.slice(s, 'x', 1) | string.from(s, 7)
+    string.upto(s, 5) | string.indexOf(s, 'o', null) | string.indexOf(s, 'o', 5) | string.indexOf(s, '', 99)
+    string.indexOf(s, '', 12) | string.indexOf(s, 'z', null) | string.indexOf(s, 'o', -3) | string.indexOf(cs, 'b', null)
+    string.indexOf(s, 1, null) | string.indexOf(s, 'l', 1.5) | string.index(s, 'World') | string.lastIndexOf(s, 'o', null)
+    string.lastIndexOf(s, 'o', 5) | string.lastIndexOf(s, 'o', 99) | string.lastIndexOf(s, '', 99) | string.lastIndexOf('', '', null)
+    string.lastIndexOf('', 'x', null) | string.lastIndexOf(s, 'l', 2.5) | string.rindex(s, 'l') | string.replace(s, 'l', 'L')
+    string.replace('aab', 'ab', 'b') | string.replace(s, 'xyz', '') | string.replace('aaa', 'a', '') | string.replace(cs, 'b', 'B')
+    string.replace(s, 'o', 1) | string.split(s, ', ') | string.split(s, '') | string.split('a,b,,c,', ',') | string.split('', ',')
+    string.split(cs, '') | string.split(cs, 'b') | string.split(s, null) | string.splitLimit('a b c d', ' ', 2)
+    string.splitLimit('a b c d', ' ', -1) | string.toLowerCase(s) | string.upper(s) | string.lower(cs) | string.upper(a)
+    array.slice(a, 1, null) | array.slice(a, -2, null) | array.slice(s, 0, 3) | array.from(a, 2) | array.upto(a, 2)
+    array.concat(a, [9]) | array.concat(s, a) | array.concat(o, 1) | array.join(a, '-') | array.join([], '-')
+    array.join([1], 2) | array.join([1, 2], 2) | array.join(cs, '') | array.join([[1], {k: null}], ' ') | array.popAt(a, 1)
+    array.pop(a) | array.pop([]) | array.push(a, 7) | array.reverse(a) | array.reverse([]) | array.reverse(s)
+    array.reverse('x') | array.shift(a) | array.shift([]) | array.sortBy(ps, byKey) | array.sortBy(s, byKey) | array.sortBy(ps, add)
+    array.sortBy([], add) | array.sort(a) | array.sort([3, 1, 2, 1]) | array.sort(['b', 'a', 'c']) | array.sort([])
+    array.sort([true, false]) | array.sort(ps) | array.sort([[1]]) | array.splice(a, 1, 2) | array.splice(a, 1, null)
+    array.splice(a, 4, 3) | array.splice(a, 0, 0) | array.splice(a, 'x', 0) | array.splice(a, 1, 1.5) | array.unshift(a, 0)
+    array.unshift(s, 0) | array.indexOf(a, 3, null) | array.indexOf(a, 3, 3) | array.indexOf(a, '3', null)
+    array.indexOf(ps, ps[1], null) | array.indexOf(cs, 'c', null) | array.indexOf(a, 1, 1.5) | array.index(a, 'a')
+    array.lastIndexOf(a, 'a', null) | array.lastIndexOf(a, 5, 2) | array.lastIndexOf(a, 5, 9) | array.rindex(a, 1)
+    array.every(a, isNum) | array.every(nums, isNum) | array.some(a, isNum) | array.all([], isNum) | array.any(cs, isNum)
+    array.forEach(a, isNum) | array.each(s, isNum) | array.map(a, type) | array.map(a, brk) | array.filter(a, isNum)
+    array.fold(nums, add, 0) | array.foldl(cs, add, '') | array.reduce(nums, add) | array.reduce([], add) | array.foldr(nums, sub, 0)
+    array.reduceRight(cs, add) | array.reduceRight([], add) | array.map(nums, function (x) { return array.sort([x, 1]); })
+    object.keys(o) | object.hasOwnProperty(o, 'k') | object.hasOwnProperty(o, 'z') | object.hasOwnProperty(o, 1)
+    object.hasOwnProperty(a, 'k') | array.push === append && string.lower === string.toLowerCase && object.keys === keys
+'''.replace('\n', '|').split('|');
+stdlibCases = [case.strip() for case in stdlibCases if case.strip()];
+
+for engine in ['tree', 'vm']:                              # stdlib.l.js & its native twin must agree (on values, in-place changes
+    print 'native stdlib ' + engine + '. ',                #    & errors) for usual & odd arguments alike.
+    outs = [];
+    for native in [False, True]:
+        out, sys.stdout = sys.stdout, StringIO.StringIO();
+        try:
+            rt = Runtime(engine=engine, writer=sys.stdout.write);
+            rt.loadStdlib(native=native);
+            for case in stdlibCases:
+                rt.runC(stdlibPrelude + 'r = ' + case + '; print([r, a, cs, s, ps]);');
+        finally:
+            out, sys.stdout = sys.stdout.getvalue(), out;
+        outs.append(out.split('\n'));
+    diffs = [(case, x, y) for case, x, y in zip(stdlibCases, *outs) if x != y];
+    print str(not diffs and len(outs[0]) == len(stdlibCases) + 1).lower();
+    for diff in diffs: print '    %s\n        %s\n        %s' % diff;
+
+forkLib = '''var counter = (function () { var n = 0; return function () { n += 1; return n; }; }()), cfg = {xs: [1, 2]};'''
+for engine in ['tree', 'closure', 'python', 'vm']:         # Forks start from the snapshot, w/ their own copies of its values
+    print 'fork ' + engine + '. ',                          #    (closures included), & their own settings.
+    outs = [];
+    for native in [False, True]:
+        rt = Runtime(engine=engine, maxDepth=100);
+        rt.loadStdlib(native=native);
+        rt.runG(forkLib + 'counter();');
+        snap = rt.snapshot();
+        rt.runG('counter(); append(cfg.xs, 3); string.foo = 1;');
+        out1, out2 = StringIO.StringIO(), StringIO.StringIO();
+        f1, f2 = snap.fork(writer=out1.write), snap.fork(writer=out2.write, maxFuel=2000);
+        f1.runG('string.foo = 2; append(cfg.xs, 9); print([counter(), counter(), cfg, string.foo]);');
+        f2.runG('print([counter(), cfg, object.hasOwnProperty(string, "foo"), array.map([1, 2], function (x) { return x * 2; })]);');
+        out, sys.stdout = sys.stdout, StringIO.StringIO();
+        try:
+            f2.runG('array.map([1], function (x) { while (true) { x += 1; } });');
+        finally:
+            out, sys.stdout = sys.stdout.getvalue(), out;
+        outs.append((out1.getvalue(), out2.getvalue(), out, f2.maxDepth, rt.call('counter')));
+    print str(outs[0] == outs[1] == ('[2, 3, {"xs": [1, 2, 9]}, 2]\n', '[2, {"xs": [1, 2]}, false, [2, 4]]\n',
+                                     'RuntimeError: out of fuel\n', 100, 3.0)).lower();
+
+for engine in ['tree', 'closure', 'python', 'vm']:         # Recursion through callbacks meets maxDepth, whether stdlib.l.js or its
+    print 'native stdlib depth ' + engine + '. ',           #    native twin calls them.
+    outs = [];
+    for native in [False, True]:
+        out, sys.stdout = sys.stdout, StringIO.StringIO();
+        try:
+            rt = Runtime(engine=engine, maxDepth=100, writer=sys.stdout.write);
+            rt.loadStdlib(native=native);
+            rt.runC('var f = function (n) { var r = array.map([n], function (x) { f(x + 1); return x; }); return r; }; f(0);');
+            rt.runC('var f = function (n) { var r = array.fold([n], function (a, x) { f(x + 1); return a; }, 0); return r; }; f(0);');
+            rt.runC('var f = function (n) { var r = array.sortBy([n, 1], function (x, y) { f(n + 1); return 0; }); return r; }; f(0);');
+            rt.runC('''var f = function (n) { if (n > 5) { return n; } return array.map([n], function (x) { return f(x + 1); })[0]; };
+                print(f(0));''');
+        finally:
+            out, sys.stdout = sys.stdout.getvalue(), out;
+        outs.append(out);
+    print str(outs[0] == outs[1] == 'RuntimeError: maximum call depth exceeded\n' * 3 + '6\n').lower();
+
+for engine in ['tree', 'closure', 'python', 'vm']:         # A callback made afresh on each iteration is still compiled once,
+    print 'callback compiles ' + engine + '. ',             #    as its body is cached on the literal's template.
+    rt = Runtime(engine=engine);
+    rt.loadStdlib(native=True);
+    resolve, compiles = jispy.resolveFunction, [];
+    def counting(params, tree, parent, free):
+        if parent is None: compiles.append(tree);          # only lazy compiles start w/o a parent scope
+        return resolve(params, tree, parent, free);
+    jispy.resolveFunction = counting;
+    try:
+        rt.run('''var i = 0, t = 0; for (i = 0; i < 500; i += 1) {
+            t += array.fold(array.map([i, 1], function (x) { return x * 2; }), function (a, x) { return a + x; }, 0); }''');
+    finally:
+        jispy.resolveFunction = resolve;
+    print str(len(compiles) <= 2 and rt.get('t') == 250500).lower();
+
+print 'runX settings. ',                                    # runX() once swapped maxLoopTime & maxDepth.
+rt = Runtime(maxLoopTime=13, maxDepth=100);
+rt.runX('var f = function (n) { if (n === 0) { return true; } return !!f(n - 1); }; print(f(50));');
+
+for engine in ['tree', 'closure', 'python', 'vm']:         # Runtimes on a Base read its globals, & shadow them on assignment,
+    print 'base ' + engine + '. ',                          #    but can change nothing that the Base reaches.
+    outs = [];
+    for native in [False, True]:
+        rt = Runtime(engine=engine);
+        rt.loadStdlib(native=native);
+        rt.runG(forkLib);
+        base = rt.freeze();
+        out1, out2 = StringIO.StringIO(), StringIO.StringIO();
+        r1, r2 = Runtime(engine=engine, base=base, writer=out1.write), Runtime(engine=engine, base=base, writer=out2.write);
+        out, sys.stdout = sys.stdout, StringIO.StringIO();
+        try:
+            r1.runG('var i = 0; for (i = 0; i < 3; i += 1) { cfg = i; } print([cfg, string.upper("ab")]);');
+            r2.runG('var cfg = 1;'); r2.runG('cfg.xs[0] = 5;'); r2.runG('append(cfg.xs, 3);'); r2.runG('array.sort(cfg.xs);');
+            r2.runG('counter();'); r2.runG('string.foo = 1;');
+            r2.runG('print([type(cfg), cfg, object.hasOwnProperty(string, "foo")]);');
+        finally:
+            out, sys.stdout = sys.stdout.getvalue(), out;
+        outs.append((out1.getvalue(), out2.getvalue(), out, sorted(r1.gEnv), len(r2.gEnv), r1.snapshot().fork().get('cfg')));
+    print str(outs[0] == outs[1] == ('[2, "AB"]\n', '["object", {"xs": [1, 2]}, false]\n',
+                                     'ReferenceError: cfg is already defined\n' + 'TypeError: cannot change frozen array\n' * 3 +
+                                     'TypeError: cannot change frozen variable\n' + 'TypeError: cannot change frozen object\n',
+                                     ['cfg', 'i'], 0, 2.0)).lower();
+
+recLib = 'var rec = function (n) { if (n === 0) { return 0; } return 1 + rec(n - 1); };';
+for engine in ['tree', 'closure', 'python', 'vm']:         # A Base's functions run w/ the limits of the Runtime calling them, &
+    print 'base limits ' + engine + '. ',                   #    a Base (w/ all it holds) is freed once no Runtime uses it.
+    outs = [];
+    for builderDepth, depth in [(None, 50), (20, None)]:
+        rt = Runtime(engine=engine, maxDepth=builderDepth);
+        rt.runG(recLib);
+        rt = Runtime(engine=engine, maxDepth=depth, base=rt.freeze());
+        for n in [10, 40, 100]:
+            try: outs.append(rt.call('rec', n));
+            except LJErr as e: outs.append(str(e));
+    gc.collect();
+    nFrozen = len(frozenIds);
+    for _ in range(3):
+        RuntimePool(size=2, warmup=lambda rt: rt.loadStdlib(), engine=engine).checkout().runG('var x = array.map([1], str);');
+        gc.collect();
+    outs.append(len(frozenIds) - nFrozen);
+    print str(outs == [10.0, 40.0, 'maximum call depth exceeded', 10.0, 40.0, 100.0, 0]).lower();
+
+print 'base engines. ',                                     # Functions of a Base keep a body per engine, so a VM Runtime still
+rt = Runtime();                                             #    calls them w/o recursing, after a closure Runtime compiled them.
+rt.runG('var count = function (n) { if (n === 0) { return 0; } return 1 + count(n - 1); };');
+base = rt.freeze();
+out = StringIO.StringIO();
+ok = Runtime(engine='closure', base=base).call('count', 5) == 5.0;
+Runtime(engine='vm', base=base, writer=out.write).runG('print(count(20000));');
+print str(ok and out.getvalue() == '20000\n').lower();
+
+print 'pool. ',                                             # Returned Runtimes are reset to just after warmup, & callers wait
+out = StringIO.StringIO();                                  #    for one when none is idle.
+pool = RuntimePool(size=2, warmup=lambda rt: rt.runG(forkLib), writer=out.write, maxFuel=10000);
+with pool.runtime() as rt:
+    rt.runG('var x = 1; cfg = 2; print([x, cfg]);');
+    rt.maxFuel = None;
+with pool.runtime() as rt:
+    rt.runG('print([cfg, type(cfg)]);');
+    outs = [rt.maxFuel, len(rt.gEnv)];
+rts = [pool.checkout(), pool.checkout()];
+threads = [threading.Thread(target=lambda: pool.checkin(pool.checkout()))];
+threads[0].start();
+time.sleep(0.05);
+pool.checkin(rts[0]);
+threads[0].join();
+pool.checkin(rts[1]);
+try:
+    pool.checkin(rts[1]);
+except ValueError:
+    outs.append('ValueError');
+rts = [pool.checkout(), pool.checkout()];                   # Timed out checkouts aren't counted (but their waits are), & running
+try:                                                        #    Runtimes can't be checked in, from this or another thread.
+    pool.checkout(timeout=0.01);
+except RuntimeError as e:
+    outs.append(str(e));
+started, done = threading.Event(), threading.Event();
+def checkinNow():
+    try: pool.checkin(rts[0]);
+    except RuntimeError as e: outs.append(str(e));
+def block():
+    started.set();
+    done.wait();
+rts[0].addNatives({'checkinNow': checkinNow, 'block': block});
+rts[0].runG('checkinNow();');
+threads = [threading.Thread(target=lambda: rts[0].runG('block();'))];
+threads[0].start();
+started.wait();
+checkinNow();
+done.set();
+threads[0].join();
+pool.checkin(rts[0]);
+pool.checkin(rts[1]);
+print str([out.getvalue(), outs, pool.stats()] == ['[1, 2]\n[{"xs": [1, 2]}, "object"]\n',
+                                                   [10000, 0, 'ValueError', 'no Runtime available'] + ['Runtime still running'] * 2,
+                                                   {'size': 2, 'idle': 2, 'checkouts': 7, 'waits': 2, 'resets': 7}]).lower();
+
+threadProg = '''
+var fib = function (n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }, i = 0, xs = [], o = {};
+for (i = 0; i < 30; i += 1) { append(xs, fib(i % 12)); o['k' + str(i)] = array.map([i, i + 1], function (x) { return x * seed; }); }
+print([array.fold(xs, function (a, b) { return a + b; }, seed), o.k7, string.upper('done')]);
+''';
+for engine in ['tree', 'closure', 'python', 'vm']:         # One (cached) program, run at once by many threads, each w/ its own
+    print 'threads ' + engine + '. ',                       #    Runtime on a shared Base, must give what running it alone gives.
+    def job(seed):
+        out = StringIO.StringIO();
+        rt = Runtime(engine=engine, base=threadBase, writer=out.write);
+        rt.runG('var seed = %d;' % seed);
+        rt.runG(threadProg);
+        return out.getvalue();
+    threadBase = Runtime(engine=engine);
+    threadBase.loadStdlib(native=(engine == 'vm'));
+    threadBase = threadBase.freeze();
+    expected = [job(seed) for seed in range(40)];
+    workers = ThreadPool(8);
+    try:
+        outs = workers.map(job, range(40) * 5, chunksize=1);
+    finally:
+        workers.close();
+    shared = Runtime(engine=engine);                        # A Runtime shared by threads runs one call at a time.
+    shared.runG('var n = 0, bump = function (k) { var i = 0; for (i = 0; i < k; i += 1) { n += 1; } return n; };');
+    workers = ThreadPool(8);
+    try:
+        workers.map(lambda k: shared.call('bump', k), [100] * 40, chunksize=1);
+    finally:
+        workers.close();
+    print str(outs == expected * 5 and shared.get('n') == 4000).lower();